@@ -1,12 +1,27 @@
 import os
-import subprocess
 import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from tkinter import filedialog
-import tkinter as tk
+
+from audio_conversion import csv_to_wav
+from audio_envelope import ENVELOPE_LEVELS, envelope_paths
+from create_flirvideo import flir_to_video
+from create_xirisvideo import xiris_to_video
+from instrumentation import session_report, span
+from lembox_analytics import (ANALYTICS_WINDOW_S, ARC_ON_CURRENT, ARC_OUT_CURRENT, SHORT_CIRCUIT_MIN_CURRENT,
+                              SHORT_CIRCUIT_VOLTAGE, analytics_paths, scale_and_analyze_lembox)
+from lembox_scaling import SCALED_COLUMNS
+from processing_manifest import is_job_fresh, load_manifest, record_job, save_manifest
+from robotdata_parsing import convert_robot_data_to_csv_fast
+from session_cache import write_session_cache
 
 def select_folder():
     """Open a folder selection dialog and return the selected path"""
+    # Imported here so headless runs do not need tkinter or a display
+    from tkinter import filedialog
+    import tkinter as tk
+
     root = tk.Tk()
     root.withdraw()  # Hide the main window
     folder_path = filedialog.askdirectory(
@@ -15,65 +30,210 @@ def select_folder():
     )
     return folder_path
 
-def process_data_folder(folder_path):
-    """Process different types of data files in the given folder using appropriate scripts."""
+FLIR_FPS = 10
+FLIR_SIZE = (640, 480)
+AUDIO_SAMPLING_RATE = 48000
+# FLIR frame images: 'png', 'jpg', 'npy' or None for the video only; every Nth frame is saved
+FLIR_FRAME_FORMAT = 'png'
+FLIR_FRAME_EVERY = 1
+FLIR_FRAME_QUALITY = None
+# Temperature calibration for the FLIR colors and scale labels (see flir_calibration.py); None shows raw counts
+FLIR_CALIBRATION = None
+# Render through a FLIR_stack copy of the frames, which takes about as much disk as the FLIR folder
+FLIR_USE_STACK = True
+# LEM box summary window and event thresholds (see lembox_analytics.py)
+LEMBOX_ANALYTICS = {
+    'window_s': ANALYTICS_WINDOW_S,
+    'short_circuit_voltage': SHORT_CIRCUIT_VOLTAGE,
+    'short_circuit_min_current': SHORT_CIRCUIT_MIN_CURRENT,
+    'arc_out_current': ARC_OUT_CURRENT,
+    'arc_on_current': ARC_ON_CURRENT,
+}
+XIRIS_FPS = 30
+XIRIS_SIZE = (640, 480)
+XIRIS_CURVE = 'log'
+
+class JobFailed(Exception):
+    """A stage function logged its own error and returned False instead of raising"""
+
+def _run_job(name, func, args, kwargs):
+    # Module-level so it can be sent to pool workers
+    with span(f'job.{name}', memory=True):
+        result = func(*args, **kwargs)
+    if result is False:
+        raise JobFailed(f"{func.__name__} did not produce its output (see the log above)")
+    return result
+
+def _job(func, args, kwargs=None, inputs=(), outputs=(), params=None):
+    return {
+        'func': func,
+        'args': args,
+        'kwargs': kwargs or {},
+        'inputs': [str(path) for path in inputs],
+        'outputs': [str(path) for path in outputs],
+        'params': params or {},
+    }
+
+def build_jobs(folder_path, workers=None):
+    """Return {job name: job} for the data files found in a session folder.
+
+    Each job holds the function and arguments to run plus the input and output paths and
+    processing parameters that decide whether it needs to run again. The jobs are
+    independent of each other; a job fails if its function raises or returns False.
+    `workers` is the most processes the robot parser, FLIR and Xiris renderers may use
+    internally; run_jobs lowers it to their share of the cores.
+    """
     folder = Path(folder_path)
-    script_dir = Path(__file__).parent
-    
-    # Dictionary mapping file patterns to their processing scripts
+    workers = workers or os.cpu_count() or 1
+
+    # Dictionary mapping file patterns to their job name and processing function
     processing_rules = {
-        'microphone_data.csv': 'audio_conversion.py',
-        'robot_data.txt': 'robotdata_parsing.py',
-        'lembox_data.csv': 'lembox_scaling.py'
+        'microphone_data.csv': ('audio', csv_to_wav),
+        'robot_data.txt': ('robot', convert_robot_data_to_csv_fast),
+        'lembox_data.csv': ('lembox', scale_and_analyze_lembox),
     }
-    
-    # Process regular files
+
+    jobs = {}
     for file_path in folder.glob('*'):
-        if file_path.is_file():
-            file_name = file_path.name
-            if file_name in processing_rules:
-                script_name = processing_rules[file_name]
-                script_path = script_dir / script_name
-                
-                if not script_path.exists():
-                    print(f"Processing script not found: {script_path}")
-                    continue
-                
-                print(f"\nProcessing {file_path} with {script_name}")
-                try:
-                    if script_name == 'robotdata_parsing.py':
-                        # Special handling for robot data to specify output path
-                        output_path = file_path.with_suffix('.csv')
-                        subprocess.run([sys.executable, str(script_path), 
-                                     str(file_path), str(output_path)], check=True)
-                    else:
-                        subprocess.run([sys.executable, str(script_path), 
-                                     str(file_path)], check=True)
-                except subprocess.CalledProcessError as e:
-                    print(f"Error running {script_name}: {e}")
-    
+        if file_path.is_file() and file_path.name in processing_rules:
+            job_name, func = processing_rules[file_path.name]
+            if func is csv_to_wav:
+                wav_path = file_path.with_suffix('.wav')
+                envelope_path, _ = envelope_paths(str(wav_path))
+                jobs[job_name] = _job(func, (str(file_path), str(wav_path), AUDIO_SAMPLING_RATE),
+                                      inputs=[file_path], outputs=[wav_path, envelope_path],
+                                      params={'sampling_rate': AUDIO_SAMPLING_RATE, 'envelope_levels': list(ENVELOPE_LEVELS)})
+            elif func is convert_robot_data_to_csv_fast:
+                # Special handling for robot data to specify output path
+                output_path = file_path.with_suffix('.csv')
+                jobs[job_name] = _job(func, (str(file_path), str(output_path)), {'workers': workers},
+                                      inputs=[file_path], outputs=[output_path])
+            else:
+                jobs[job_name] = _job(func, (str(file_path),), dict(LEMBOX_ANALYTICS), inputs=[file_path],
+                                      outputs=[file_path, *analytics_paths(str(file_path))],
+                                      params={'scale': {col: factor for col, (_, factor) in SCALED_COLUMNS.items()},
+                                              'analytics': LEMBOX_ANALYTICS})
+
     # Check for FLIR folder
     flir_folder = folder / 'FLIR'
     if flir_folder.is_dir():
-        flir_script = script_dir / 'create_flirvideo.py'
-        if not flir_script.exists():
-            print(f"FLIR processing script not found: {flir_script}")
-            return
-            
-        print("\nProcessing FLIR folder...")
-        try:
-            output_video = folder / 'FLIR.mp4'
-            output_frames = folder / 'FLIR_Frames'
-            subprocess.run([sys.executable, str(flir_script), 
-                          str(flir_folder),
-                          str(output_video),
-                          str(output_frames)], check=True)
-        except subprocess.CalledProcessError as e:
-            print(f"Error processing FLIR folder: {e}")
+        output_video = folder / 'FLIR.mp4'
+        output_frames = folder / 'FLIR_Frames'
+        export = {'frame_format': FLIR_FRAME_FORMAT, 'frame_every': FLIR_FRAME_EVERY, 'frame_quality': FLIR_FRAME_QUALITY,
+                  'calibration': FLIR_CALIBRATION}
+        outputs = [output_video, output_frames] if FLIR_FRAME_FORMAT else [output_video]
+        jobs['flir'] = _job(flir_to_video, (str(flir_folder), str(output_video), str(output_frames), FLIR_FPS, *FLIR_SIZE),
+                            {'workers': workers, 'use_stack': FLIR_USE_STACK, **export},
+                            inputs=[flir_folder], outputs=outputs,
+                            params={'fps': FLIR_FPS, 'size': list(FLIR_SIZE), **export})
+
+    # Check for Xiris folder
+    xiris_folder = folder / 'Xiris'
+    if xiris_folder.is_dir():
+        output_video = folder / 'Xiris.mp4'
+        jobs['xiris'] = _job(xiris_to_video, (str(xiris_folder), str(output_video), XIRIS_FPS, *XIRIS_SIZE),
+                             {'workers': workers, 'curve': XIRIS_CURVE}, inputs=[xiris_folder], outputs=[output_video],
+                             params={'fps': XIRIS_FPS, 'size': list(XIRIS_SIZE), 'curve': XIRIS_CURVE})
+    return jobs
+
+def share_workers(jobs, concurrent, workers=None):
+    """Return each job's kwargs with its internal process count cut to a share of `workers`.
+
+    Up to `concurrent` jobs run at once. Jobs without a `workers` kwarg (audio, LEM box)
+    run in a single process and take one core each; the cores left are split evenly
+    between the jobs with their own process pool, which get at least one each. Pool jobs
+    are assumed to be among those running. workers defaults to the core count.
+    """
+    workers = workers or os.cpu_count() or 1
+    pooled = sum('workers' in job['kwargs'] for job in jobs.values())
+    running_pooled = min(pooled, max(1, concurrent))
+    running_single = min(len(jobs) - pooled, max(1, concurrent) - running_pooled)
+    share = max(1, (workers - running_single) // max(1, running_pooled))
+    kwargs = {}
+    for name, job in jobs.items():
+        kwargs[name] = dict(job['kwargs'])
+        if 'workers' in kwargs[name]:
+            kwargs[name]['workers'] = min(kwargs[name]['workers'] or share, share)
+    return kwargs
+
+def run_jobs(jobs, max_workers=None, workers=None):
+    """Run independent jobs concurrently on a process pool and return {job name: error or None}.
+
+    Each job calls its module function directly, so there is no interpreter start-up per
+    job, and a slow job (FLIR) does not hold up the others. The `workers` processes
+    (default: one per core) are split between the jobs running at once, see share_workers.
+    """
+    results = {}
+    if not jobs:
+        return results
+    max_workers = min(len(jobs), max_workers or os.cpu_count() or 1)
+    job_kwargs = share_workers(jobs, max_workers, workers)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_run_job, name, job['func'], job['args'], job_kwargs[name]): name
+                   for name, job in jobs.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                future.result()
+                results[name] = None
+                print(f"\nFinished {name} job")
+            except Exception as e:
+                results[name] = f"{type(e).__name__}: {e}"
+                print(f"\nError in {name} job: {results[name]}")
+    return results
+
+def process_data_folder(folder_path, max_workers=None, force=False, hash_content=False, workers=None, profile=False):
+    """Process the data files in the given folder and return {job name: status}.
+
+    Jobs whose inputs, parameters and outputs are unchanged since their last successful
+    run (as recorded in the session's processing manifest) are skipped unless force is
+    set. Status is 'skipped', 'ok' or the error message of a failed job. `workers` is
+    the process budget the running jobs share (see run_jobs). With profile set,
+    per-stage timings and peak memory are written to performance_report.json in the folder.
+    """
+    with session_report(folder_path, enabled=profile):
+        return _process_data_folder(folder_path, max_workers, force, hash_content, workers)
+
+def _process_data_folder(folder_path, max_workers, force, hash_content, workers):
+    jobs = build_jobs(folder_path, workers)
+    manifest = load_manifest(folder_path)
+    statuses = {}
+    stale_jobs = {}
+    for name, job in jobs.items():
+        if not force and is_job_fresh(manifest, name, job, hash_content):
+            print(f"Skipping {name} job: inputs and outputs are up to date")
+            statuses[name] = 'skipped'
+        else:
+            stale_jobs[name] = job
+
+    print(f"\nRunning jobs: {', '.join(stale_jobs) or 'none'}")
+    for name, error in run_jobs(stale_jobs, max_workers, workers).items():
+        statuses[name] = error or 'ok'
+        if error is None:
+            record_job(manifest, name, stale_jobs[name], hash_content)
+        else:
+            manifest['jobs'].pop(name, None)
+    if stale_jobs:
+        save_manifest(folder_path, manifest)
+
+    # Cache the processed streams as typed columnar arrays for downstream analysis
+    print("\nWriting session cache...")
+    with span('session_cache', memory=True):
+        write_session_cache(folder_path, force=force)
+    return statuses
 
 def main():
-    print("Please select the data collection folder...")
-    folder_path = select_folder()
+    parser = argparse.ArgumentParser(description="Process the data files of an experiment folder.")
+    parser.add_argument('folder', nargs='?', help="data collection folder (prompted for if omitted)")
+    parser.add_argument('--force', action='store_true', help="rebuild every output, even if it is up to date")
+    parser.add_argument('--hash', action='store_true', help="fingerprint input files by content, not just size and mtime")
+    parser.add_argument('--profile', action='store_true', help="write per-stage timings to performance_report.json")
+    args = parser.parse_args()
+
+    folder_path = args.folder
+    if not folder_path:
+        print("Please select the data collection folder...")
+        folder_path = select_folder()
     
     if not folder_path:
         print("No folder selected. Exiting...")
@@ -84,7 +244,12 @@ def main():
         sys.exit(1)
     
     print(f"\nProcessing folder: {folder_path}")
-    process_data_folder(folder_path)
+    statuses = process_data_folder(folder_path, force=args.force, hash_content=args.hash, profile=args.profile)
+    failed = {name: status for name, status in statuses.items() if status not in ('ok', 'skipped')}
+    for name, error in failed.items():
+        print(f"{name} job failed: {error}")
+    if failed:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
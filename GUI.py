@@ -1,98 +1,95 @@
 import os
-import numpy as np
-import cv2
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
 
 from audio_conversion import csv_to_wav
-from create_flirvideo import (
-    convert_to_8bit,
-    apply_inverted_colormap,
-    add_vertical_color_scale_bar,
-    add_timestamp,
-)
-
-def npy_to_video(flir_dir, video_path, frames_path, log_func, fps=10, size=(640, 480)):
-    npy_files = [f for f in os.listdir(flir_dir) if f.endswith('.npy')]
-    data_list = []
-
-    for file in npy_files:
-        try:
-            full_path = os.path.join(flir_dir, file)
-            data = np.load(full_path, allow_pickle=True).item()
-            timestamp = data.get('timestamp')
-            if not timestamp:
-                log_func(f"Timestamp not found in {file}. Skipping.")
-                continue
-            data_list.append((file, data['frame'], timestamp))
-        except Exception as e:
-            log_func(f"Error processing {file}: {e}")
+from create_flirvideo import flir_to_video
+from Data_Processing import build_jobs
+from instrumentation import session_report
+from processing_manifest import is_job_fresh, load_manifest, record_job, save_manifest
 
-    if not data_list:
-        log_func("No valid FLIR npy files found.")
-        return
+# Frame images are named after the whole source file, e.g. frame_00001.npy.png
+GUI_FRAME_NAMES = 'filename'
 
-    try:
-        data_list.sort(key=lambda x: datetime.strptime(x[2], '%Y-%m-%d %H:%M:%S.%f'))
-    except Exception as e:
-        log_func(f"Error sorting files by timestamp: {e}")
-        return
+def npy_to_video(flir_dir, video_path, frames_path, log_func, fps=10, size=(640, 480), workers=None,
+                 progress_func=None, cancel_event=None, frame_names=GUI_FRAME_NAMES, **export_options):
+    """Render the FLIR folder via its FLIR_stack on `workers` processes (defaults to one per core).
 
-    global_min = min(frame.min() for (_, frame, _) in data_list)
-    global_max = max(frame.max() for (_, frame, _) in data_list)
-    os.makedirs(frames_path, exist_ok=True)
-    
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(video_path, fourcc, fps, size)
+    Frame images keep the GUI's <name>.npy.png naming. export_options (frame_format,
+    frame_every, frame_quality, calibration, use_stack) are passed to flir_to_video.
+    Returns True if the video was written, False if there were no frames or the run was cancelled.
+    """
+    return flir_to_video(flir_dir, video_path, frames_path, fps, *size,
+                         log_func=log_func, workers=workers or os.cpu_count() or 1,
+                         progress_func=progress_func, cancel_event=cancel_event, frame_names=frame_names,
+                         **export_options)
 
-    for fname, frame, timestamp in data_list:
-        try:
-            img = convert_to_8bit(frame, global_min, global_max)
-            img = apply_inverted_colormap(img)
-            img = cv2.resize(img, size)
-            img = add_vertical_color_scale_bar(img, *size, global_min, global_max)
-            img = add_timestamp(img, timestamp, *size)
-            out.write(img)
-            
-            frame_file = os.path.join(frames_path, f"{fname}.png")
-            cv2.imwrite(frame_file, img)
-            log_func(f"Saved FLIR frame: {frame_file}")
-        except Exception as e:
-            log_func(f"Error processing {fname}: {e}")
-    out.release()
-    log_func(f"FLIR video saved: {video_path}")
+def process_folder(folder, log_func, force=False, progress_func=None, cancel_event=None, workers=None):
+    """Process the microphone and FLIR data of a folder, skipping outputs that are up to date.
 
-def process_folder(folder, log_func):
+    `workers` caps the FLIR render processes (default: one per core).
+    """
     log_func(f"\n=== Processing folder: {folder} ===")
+    jobs = build_jobs(folder, workers)
+    manifest = load_manifest(folder)
     
     # Process microphone data if present.
-    mic_csv = os.path.join(folder, "microphone_data.csv")
-    if os.path.exists(mic_csv):
-        wav_path = os.path.join(folder, "microphone_data.wav")
+    audio_job = jobs.get('audio')
+    if audio_job is None:
+        log_func("No microphone_data.csv found in this folder.")
+    elif not force and is_job_fresh(manifest, 'audio', audio_job):
+        log_func("Microphone data is up to date. Skipping.")
+    else:
+        mic_csv, wav_path = audio_job['inputs'][0], audio_job['outputs'][0]
+        # Only a successful run is recorded, so a failed one is retried next time
+        manifest['jobs'].pop('audio', None)
         try:
-            csv_to_wav(mic_csv, wav_filename=wav_path)
-            log_func(f"Microphone data processed: {mic_csv} → {wav_path}")
+            if csv_to_wav(mic_csv, wav_filename=wav_path):
+                record_job(manifest, 'audio', audio_job)
+                log_func(f"Microphone data processed: {mic_csv} → {wav_path}")
+            else:
+                log_func(f"Microphone data could not be converted: {mic_csv}")
         except Exception as e:
             log_func(f"Error processing microphone data: {e}")
-    else:
-        log_func("No microphone_data.csv found in this folder.")
     
     # Process FLIR data if present.
-    flir_folder = os.path.join(folder, "FLIR")
-    if os.path.exists(flir_folder) and os.path.isdir(flir_folder):
-        video_path = os.path.join(folder, "FLIR.mp4")
-        frames_path = os.path.join(folder, "FLIR_Frames")
+    flir_job = jobs.get('flir')
+    if flir_job is not None:
+        # Frame names differ from the command line renders, so the manifest must tell them apart
+        flir_job['params']['frame_names'] = GUI_FRAME_NAMES
+    if flir_job is None:
+        log_func("No FLIR folder found in this folder.")
+    elif not force and is_job_fresh(manifest, 'flir', flir_job):
+        log_func("FLIR video and frames are up to date. Skipping.")
+    else:
+        flir_folder, video_path, frames_path = flir_job['args'][:3]
+        export_options = {key: value for key, value in flir_job['kwargs'].items()
+                          if key.startswith('frame_') or key in ('calibration', 'use_stack')}
+        manifest['jobs'].pop('flir', None)
         try:
-            npy_to_video(flir_folder, video_path, frames_path, log_func)
+            if npy_to_video(flir_folder, video_path, frames_path, log_func, workers=flir_job['kwargs']['workers'],
+                            progress_func=progress_func, cancel_event=cancel_event, **export_options):
+                record_job(manifest, 'flir', flir_job)
         except Exception as e:
             log_func(f"Error processing FLIR data: {e}")
-    else:
-        log_func("No FLIR folder found in this folder.")
+
+    save_manifest(folder, manifest)
+
+LOG_MAX_LINES = 5000
+POLL_INTERVAL_MS = 100
+MAX_EVENTS_PER_POLL = 5000
 
 def create_gui():
     root = tk.Tk()
     root.title("Main Folder Data Processor")
+
+    # Background workers report to the UI only through this queue; the UI drains it on a timer.
+    events = queue.Queue()
+    cancel_event = threading.Event()
     
     # Main folder selection frame.
     main_folder_frame = tk.Frame(root)
@@ -110,8 +107,34 @@ def create_gui():
     main_folder_label = tk.Label(main_folder_frame, text="No folder selected")
     main_folder_label.pack(side=tk.LEFT, padx=5)
 
-    # Process button.
-    tk.Button(root, text="Process All Subfolders", command=lambda: process_all_subfolders()).pack(pady=5)
+    # Process and cancel buttons, and processing options.
+    process_frame = tk.Frame(root)
+    process_frame.pack(pady=5)
+    force_rebuild = tk.BooleanVar(value=False)
+    performance_report = tk.BooleanVar(value=False)
+    parallel_folders = tk.IntVar(value=1)
+    process_button = tk.Button(process_frame, text="Process All Subfolders", command=lambda: process_all_subfolders())
+    process_button.pack(side=tk.LEFT, padx=5)
+    cancel_button = tk.Button(process_frame, text="Cancel", state=tk.DISABLED, command=lambda: cancel_processing())
+    cancel_button.pack(side=tk.LEFT, padx=5)
+    tk.Checkbutton(process_frame, text="Force rebuild", variable=force_rebuild).pack(side=tk.LEFT, padx=5)
+    tk.Checkbutton(process_frame, text="Performance report", variable=performance_report).pack(side=tk.LEFT, padx=5)
+    tk.Label(process_frame, text="Parallel folders:").pack(side=tk.LEFT, padx=(5, 0))
+    tk.Spinbox(process_frame, from_=1, to=os.cpu_count() or 1, width=3,
+               textvariable=parallel_folders).pack(side=tk.LEFT, padx=5)
+
+    # Per-session and per-frame progress bars.
+    progress_frame = tk.Frame(root)
+    progress_frame.pack(fill=tk.X, padx=5)
+    session_label = tk.Label(progress_frame, text="Folders: 0/0", width=16, anchor=tk.W)
+    session_label.grid(row=0, column=0, sticky=tk.W)
+    session_progress = ttk.Progressbar(progress_frame, mode='determinate')
+    session_progress.grid(row=0, column=1, sticky=tk.EW, pady=2)
+    frame_label = tk.Label(progress_frame, text="FLIR frames: 0/0", width=16, anchor=tk.W)
+    frame_label.grid(row=1, column=0, sticky=tk.W)
+    frame_progress = ttk.Progressbar(progress_frame, mode='determinate')
+    frame_progress.grid(row=1, column=1, sticky=tk.EW, pady=2)
+    progress_frame.columnconfigure(1, weight=1)
 
     # Log text box with scrollbar.
     log_frame = tk.Frame(root)
@@ -122,14 +145,88 @@ def create_gui():
     scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
     log_text.config(yscrollcommand=scrollbar.set)
 
-    # Log function: prints to both text widget and stdout.
+    # Log function: prints to stdout and queues the message for the text widget.
+    # Safe to call from any thread.
     def log(message):
         timestamp = datetime.now().strftime("[%Y-%m-%d %H:%M:%S] ")
         full_message = timestamp + message
-        log_text.insert(tk.END, full_message + "\n")
-        log_text.see(tk.END)
         print(full_message)
-        root.update_idletasks()
+        events.put(('log', full_message))
+
+    # FLIR frame progress per folder; the bar shows the sum over the folders being processed
+    frame_counts = {}
+
+    def drain_events():
+        lines = []
+        sessions = frames = finished = None
+        for _ in range(MAX_EVENTS_PER_POLL):
+            try:
+                kind, *payload = events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'log':
+                lines.append(payload[0])
+            elif kind == 'sessions':
+                sessions = payload
+            elif kind == 'frames':
+                folder, done, total = payload
+                if folder is None:
+                    frame_counts.clear()
+                else:
+                    frame_counts[folder] = (done, total)
+                frames = [sum(counts) for counts in zip(*frame_counts.values())] or [0, 0]
+            elif kind == 'finished':
+                finished = payload[0]
+
+        # One insert per poll, with the widget capped at LOG_MAX_LINES lines
+        if lines:
+            log_text.insert(tk.END, "\n".join(lines) + "\n")
+            line_count = int(log_text.index('end-1c').split('.')[0])
+            if line_count > LOG_MAX_LINES:
+                log_text.delete('1.0', f"{line_count - LOG_MAX_LINES}.0")
+            log_text.see(tk.END)
+        if sessions is not None:
+            session_progress.config(maximum=max(sessions[1], 1), value=sessions[0])
+            session_label.config(text=f"Folders: {sessions[0]}/{sessions[1]}")
+        if frames is not None:
+            frame_progress.config(maximum=max(frames[1], 1), value=frames[0])
+            frame_label.config(text=f"FLIR frames: {frames[0]}/{frames[1]}")
+        if finished is not None:
+            process_button.config(state=tk.NORMAL)
+            cancel_button.config(state=tk.DISABLED)
+            if finished:
+                messagebox.showinfo("Cancelled", "Processing was cancelled.")
+        root.after(POLL_INTERVAL_MS, drain_events)
+
+    def run_subfolders(subfolders, force, parallel, profile):
+        # Folders processed at once split the cores between their FLIR renderers
+        workers = max(1, (os.cpu_count() or 1) // parallel)
+
+        def run_one(folder):
+            if cancel_event.is_set():
+                return
+
+            def report_frames(done, total):
+                events.put(('frames', folder, done, total))
+
+            with session_report(folder, enabled=profile, log_func=log):
+                process_folder(folder, log, force=force, progress_func=report_frames, cancel_event=cancel_event,
+                               workers=workers)
+            log(f"=== Finished processing folder: {folder} ===\n")
+
+        try:
+            with ThreadPoolExecutor(max_workers=parallel) as executor:
+                futures = [executor.submit(run_one, folder) for folder in subfolders]
+                for done, future in enumerate(as_completed(futures), start=1):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        log(f"Error processing folder: {e}")
+                    events.put(('sessions', done, len(subfolders)))
+            if cancel_event.is_set():
+                log("Processing cancelled.")
+        finally:
+            events.put(('finished', cancel_event.is_set()))
 
     def process_all_subfolders():
         main_folder = selected_main_folder.get()
@@ -142,12 +239,36 @@ def create_gui():
         if not subfolders:
             log("No subfolders found in the main folder.")
             return
-        
-        for folder in subfolders:
-            process_folder(folder, log)
-            log(f"=== Finished processing folder: {folder} ===\n")
 
+        try:
+            parallel = max(1, int(parallel_folders.get()))
+        except (tk.TclError, ValueError):
+            parallel = 1
+        profile = performance_report.get()
+        if profile and parallel > 1:
+            # Timings are collected per process, so reports need one folder at a time
+            log("Performance reports are enabled; processing one folder at a time.")
+            parallel = 1
+        cancel_event.clear()
+        process_button.config(state=tk.DISABLED)
+        cancel_button.config(state=tk.NORMAL)
+        events.put(('sessions', 0, len(subfolders)))
+        events.put(('frames', None, 0, 0))
+        threading.Thread(target=run_subfolders, args=(subfolders, force_rebuild.get(), parallel, profile),
+                         daemon=True).start()
+
+    def cancel_processing():
+        cancel_event.set()
+        cancel_button.config(state=tk.DISABLED)
+        log("Cancelling after the current step...")
+
+    def on_close():
+        cancel_event.set()
+        root.destroy()
+
+    root.protocol("WM_DELETE_WINDOW", on_close)
+    root.after(POLL_INTERVAL_MS, drain_events)
     root.mainloop()
 
 if __name__ == "__main__":
-    create_gui()
\ No newline at end of file
+    create_gui()
@@ -1,61 +1,168 @@
 import os
 import sys
+import json
 import pandas as pd
 import numpy as np
 import wave
 
-def csv_to_wav(csv_filename, wav_filename=None, sampling_rate=48000):
+from audio_envelope import ENVELOPE_LEVELS, EnvelopeWriter
+from instrumentation import span, timed_iter
 
+DEFAULT_CHUNKSIZE = 500000
+
+def find_header_row(csv_filename):
+    """Return how many rows precede the header containing 'Amplitude', or None if there is none.
+
+    Only the first lines are read; a header row with extra info is tried first.
+    """
+    for skiprows in (1, 0):
+        columns = pd.read_csv(csv_filename, skiprows=skiprows, nrows=0).columns
+        print(f"Columns found (skiprows={skiprows}): {columns.tolist()}")
+        if 'Amplitude' in columns:
+            return skiprows
+    return None
+
+def _peak_cache_path(csv_filename):
+    return os.path.splitext(csv_filename)[0] + '.peak.json'
+
+def scan_amplitude(csv_filename, skiprows, chunksize=DEFAULT_CHUNKSIZE):
+    """Return the sample count and min/max/peak of the 'Amplitude' column.
+
+    The column is read in chunks, and the result is cached in a sidecar file next to the
+    CSV so later conversions of the same file skip this pass.
+    """
+    stat = os.stat(csv_filename)
+    try:
+        with open(_peak_cache_path(csv_filename), 'r') as f:
+            cached = json.load(f)
+        if cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+            return cached
+    except (OSError, ValueError, KeyError):
+        pass
+
+    samples = 0
+    data_min = float('inf')
+    data_max = float('-inf')
+    for chunk in timed_iter('audio.scan', pd.read_csv(csv_filename, skiprows=skiprows, usecols=['Amplitude'], chunksize=chunksize)):
+        audio_chunk = chunk['Amplitude'].to_numpy()
+        if len(audio_chunk) == 0:
+            continue
+        samples += len(audio_chunk)
+        data_min = min(data_min, float(audio_chunk.min()))
+        data_max = max(data_max, float(audio_chunk.max()))
+
+    return write_amplitude_cache(csv_filename, samples, data_min, data_max, stat)
+
+def write_amplitude_cache(csv_filename, samples, data_min, data_max, stat=None):
+    """Cache the amplitude scan of a CSV (see scan_amplitude) and return the cached stats.
+
+    stat is the os.stat of the CSV the scan covered; by default the file is stat'ed now.
+    """
+    stat = stat or os.stat(csv_filename)
+    stats = {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'samples': samples,
+        'min': data_min,
+        'max': data_max,
+        'peak': max(abs(data_min), abs(data_max)) if samples else 0.0,
+    }
+    try:
+        with open(_peak_cache_path(csv_filename), 'w') as f:
+            json.dump(stats, f)
+    except OSError as e:
+        print(f"Could not cache amplitude scan: {e}")
+    return stats
+
+def _to_int16(audio_data, max_amplitude):
+    # Normalize the signal: scale so maximum amplitude is 0.9.
+    if max_amplitude > 0:
+        audio_data = audio_data / max_amplitude * 0.9
+    # Convert the normalized data to 16-bit integers.
+    return (audio_data * 32767).astype(np.int16)
+
+def _write_frames(wav_file, audio_data, max_amplitude, envelope=None):
+    with span('audio.normalize'):
+        frames = _to_int16(audio_data, max_amplitude).tobytes()
+    with span('audio.write'):
+        wav_file.writeframes(frames)
+    if envelope is not None:
+        with span('audio.envelope'):
+            envelope.add(audio_data)
+
+def csv_to_wav(csv_filename, wav_filename=None, sampling_rate=48000, chunksize=DEFAULT_CHUNKSIZE,
+               envelope_levels=ENVELOPE_LEVELS):
+    """Convert the 'Amplitude' column of a microphone CSV to a 16-bit mono WAV file.
+
+    By default the CSV is streamed in chunks of `chunksize` rows: one pass (or the cached
+    result of an earlier one) finds the peak amplitude, and a second pass converts and
+    appends each chunk to the WAV file, so memory does not grow with the recording length.
+    Pass chunksize=None to load the whole file at once instead.
+
+    The same pass writes a min/max/RMS envelope pyramid next to the WAV file (see
+    audio_envelope.py) with blocks of each size in envelope_levels; None skips it.
+    Errors are logged; returns True if the WAV file was written and False otherwise.
+    """
     print(f"Reading {csv_filename}...")
     try:
-        # Try reading with one header row skipped (in case there's extra info)
-        df = pd.read_csv(csv_filename, skiprows=1, low_memory=False)
-        print(f"Columns found (skiprows=1): {df.columns.tolist()}")
-        if 'Amplitude' not in df.columns:
-            # If 'Amplitude' isn't found, try reading the CSV normally.
-            df = pd.read_csv(csv_filename, low_memory=False)
-            print(f"Retrying with all rows: {df.columns.tolist()}")
+        skiprows = find_header_row(csv_filename)
     except Exception as e:
         print(f"Error reading CSV: {e}")
-        return
+        return False
 
-    if 'Amplitude' not in df.columns:
+    if skiprows is None:
         print(f"Column 'Amplitude' not found in {csv_filename}. Skipping...")
-        return
+        return False
+
+    # Generate output filename if not provided.
+    if wav_filename is None:
+        wav_filename = os.path.splitext(csv_filename)[0] + '.wav'
 
     try:
-        # Extract mono audio data from the 'Amplitude' column.
-        audio_data = df['Amplitude'].to_numpy()
-        
+        if chunksize is None:
+            with span('audio.read'):
+                audio_data = pd.read_csv(csv_filename, skiprows=skiprows, usecols=['Amplitude'],
+                                         low_memory=False)['Amplitude'].to_numpy()
+            samples = len(audio_data)
+            data_min, data_max = audio_data.min(), audio_data.max()
+            max_amplitude = np.max(np.abs(audio_data))
+        else:
+            stats = scan_amplitude(csv_filename, skiprows, chunksize)
+            samples = stats['samples']
+            data_min, data_max = stats['min'], stats['max']
+            max_amplitude = stats['peak']
+
         print(f"\nDebug Information for {csv_filename}:")
-        print(f"Raw audio data range: {audio_data.min():.6f} to {audio_data.max():.6f}")
-        print(f"Number of samples: {len(audio_data)}")
-        
-        # Normalize the signal: scale so maximum amplitude is 0.9.
-        max_amplitude = np.max(np.abs(audio_data))
-        if max_amplitude > 0:
-            audio_data = audio_data / max_amplitude * 0.9
-        
-        # Convert the normalized data to 16-bit integers.
-        audio_data_int16 = (audio_data * 32767).astype(np.int16)
-        
-        # Generate output filename if not provided.
-        if wav_filename is None:
-            wav_filename = os.path.splitext(csv_filename)[0] + '.wav'
-        
+        print(f"Raw audio data range: {data_min:.6f} to {data_max:.6f}")
+        print(f"Number of samples: {samples}")
+
+        envelope = None
+        if envelope_levels:
+            # Scale that turns the WAV's 16-bit samples back into amplitudes
+            scale = float(max_amplitude) / (0.9 * 32767) if max_amplitude > 0 else 1 / 32767
+            envelope = EnvelopeWriter(wav_filename, samples, sampling_rate, scale, envelope_levels)
+
         # Save the WAV file using Python's wave module.
         print(f"\nSaving to {wav_filename}...")
         with wave.open(wav_filename, 'wb') as wav_file:
             wav_file.setnchannels(1)   # Mono
             wav_file.setsampwidth(2)    # 2 bytes per sample for 16-bit
             wav_file.setframerate(sampling_rate)
-            wav_file.writeframes(audio_data_int16.tobytes())
-        
+            if chunksize is None:
+                _write_frames(wav_file, audio_data, max_amplitude, envelope)
+            else:
+                for chunk in timed_iter('audio.read', pd.read_csv(csv_filename, skiprows=skiprows, usecols=['Amplitude'],
+                                                                  chunksize=chunksize)):
+                    _write_frames(wav_file, chunk['Amplitude'].to_numpy(), max_amplitude, envelope)
+        if envelope is not None:
+            envelope.close()
+
         print(f"WAV file saved successfully as {wav_filename}\n")
-        
+        return True
+
     except Exception as e:
         print(f"Error during conversion for {csv_filename}: {e}")
-        return
+        return False
 
 def main():
     if len(sys.argv) != 2:
@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import numpy as np
+
+# Samples per envelope block at each pyramid level, finest first
+ENVELOPE_LEVELS = (16, 256, 4096)
+ENVELOPE_VERSION = 1
+
+def envelope_paths(wav_filename, levels=ENVELOPE_LEVELS):
+    """Return the envelope metadata path and {level: array path} for a WAV file"""
+    base = os.path.splitext(wav_filename)[0]
+    return base + '.envelope.json', {level: f"{base}.envelope_{level}.npy" for level in levels}
+
+def _block_stats(blocks):
+    # One row of min, max and RMS per block
+    return np.column_stack((blocks.min(axis=1), blocks.max(axis=1), np.sqrt(np.mean(blocks * blocks, axis=1))))
+
+class EnvelopeWriter:
+    """Builds a min/max/RMS envelope pyramid of a sample stream, one chunk at a time.
+
+    Each level is a float32 (blocks x 3) .npy file written through a memory map sized
+    from the expected sample count. Samples left over at the end of a chunk are carried
+    into the next one, so the chunk size does not change the result.
+    """
+
+    def __init__(self, wav_filename, samples, sampling_rate, scale, levels=ENVELOPE_LEVELS):
+        self.wav_filename = wav_filename
+        self.sampling_rate = sampling_rate
+        self.scale = scale
+        self.levels = tuple(levels)
+        self.metadata_path, self.paths = envelope_paths(wav_filename, self.levels)
+        if os.path.exists(self.metadata_path):
+            os.remove(self.metadata_path)
+        self.arrays = {level: np.lib.format.open_memmap(self.paths[level], mode='w+', dtype=np.float32,
+                                                        shape=(-(-samples // level), 3))
+                       for level in self.levels}
+        self.carry = {level: np.empty(0) for level in self.levels}
+        self.rows = {level: 0 for level in self.levels}
+        self.samples = 0
+
+    def _append(self, level, stats):
+        array = self.arrays[level]
+        rows = min(len(stats), len(array) - self.rows[level])
+        array[self.rows[level]:self.rows[level] + rows] = stats[:rows]
+        self.rows[level] += rows
+
+    def add(self, chunk):
+        chunk = np.asarray(chunk, dtype=np.float64)
+        self.samples += len(chunk)
+        for level in self.levels:
+            data = np.concatenate((self.carry[level], chunk)) if len(self.carry[level]) else chunk
+            blocks = len(data) // level
+            if blocks:
+                self._append(level, _block_stats(data[:blocks * level].reshape(blocks, level)))
+            self.carry[level] = data[blocks * level:].copy()
+
+    def close(self):
+        """Write the last partial blocks and the metadata file that marks the envelope complete"""
+        for level in self.levels:
+            if len(self.carry[level]):
+                self._append(level, _block_stats(self.carry[level].reshape(1, -1)))
+            self.arrays[level].flush()
+        self.arrays = {}
+        metadata = {
+            'version': ENVELOPE_VERSION,
+            'wav': os.path.basename(self.wav_filename),
+            'sampling_rate': self.sampling_rate,
+            'samples': self.samples,
+            'scale': self.scale,
+            'levels': {str(level): {'file': os.path.basename(self.paths[level]), 'blocks': self.rows[level]}
+                       for level in self.levels},
+        }
+        with open(self.metadata_path + '.tmp', 'w') as f:
+            json.dump(metadata, f)
+        os.replace(self.metadata_path + '.tmp', self.metadata_path)
+
+def _wav_data(wav_filename):
+    """Memory map the 16-bit samples of a PCM WAV file"""
+    with open(wav_filename, 'rb') as f:
+        header = f.read(12)
+        if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            raise ValueError(f"{wav_filename} is not a WAV file")
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise ValueError(f"No data chunk in {wav_filename}")
+            size = int.from_bytes(chunk[4:], 'little')
+            if chunk[:4] == b'data':
+                offset = f.tell()
+                break
+            f.seek(size + (size & 1), os.SEEK_CUR)
+    return np.memmap(wav_filename, dtype='<i2', mode='r', offset=offset, shape=(size // 2,))
+
+def _reduce_bins(times, mins, maxs, rms, points):
+    # Merge consecutive rows into at most `points` bins
+    if len(mins) <= points:
+        return times, mins, maxs, rms
+    edges = np.linspace(0, len(mins), points + 1).astype(np.int64)[:-1]
+    counts = np.diff(np.append(edges, len(mins)))
+    return (times[edges], np.minimum.reduceat(mins, edges), np.maximum.reduceat(maxs, edges),
+            np.sqrt(np.add.reduceat(rms.astype(np.float64) ** 2, edges) / counts))
+
+class AudioEnvelope:
+    """Reads a recording's envelope pyramid to answer waveform queries without loading it.
+
+    Amplitudes are in the units of the CSV's 'Amplitude' column and times are seconds
+    from the start of the recording.
+    """
+
+    def __init__(self, wav_filename):
+        self.wav_filename = wav_filename
+        metadata_path, _ = envelope_paths(wav_filename, ())
+        with open(metadata_path, 'r') as f:
+            self.metadata = json.load(f)
+        if self.metadata.get('version') != ENVELOPE_VERSION:
+            raise ValueError(f"Unsupported envelope version in {metadata_path}")
+        self.sampling_rate = self.metadata['sampling_rate']
+        self.samples = self.metadata['samples']
+        folder = os.path.dirname(os.path.abspath(wav_filename))
+        self.levels = {int(level): np.load(os.path.join(folder, info['file']), mmap_mode='r')
+                       for level, info in self.metadata['levels'].items()}
+
+    @property
+    def duration(self):
+        return self.samples / self.sampling_rate
+
+    def window(self, start_s, end_s, points=2000):
+        """Return {level, time, min, max, rms} for [start_s, end_s) in at most `points` bins.
+
+        The coarsest level that still has `points` blocks in the window is read, so the
+        work is bounded by the number of points, not by the window length. Windows too
+        short for the finest level are read from the WAV samples directly.
+        """
+        start = max(0, int(start_s * self.sampling_rate))
+        end = min(self.samples, int(np.ceil(end_s * self.sampling_rate)))
+        if end <= start:
+            empty = np.empty(0)
+            return {'level': None, 'time': empty, 'min': empty, 'max': empty, 'rms': empty}
+
+        usable = [level for level in self.levels if (end - start) // level >= points]
+        if usable:
+            level = max(usable)
+            first, last = start // level, -(-end // level)
+            rows = np.asarray(self.levels[level][first:last])
+            times = np.arange(first, last) * level / self.sampling_rate
+            mins, maxs, rms = rows[:, 0], rows[:, 1], rows[:, 2]
+        else:
+            level = 1
+            values = _wav_data(self.wav_filename)[start:end] * self.metadata['scale']
+            times = np.arange(start, end) / self.sampling_rate
+            mins, maxs, rms = values, values, np.abs(values)
+        times, mins, maxs, rms = _reduce_bins(times, mins, maxs, rms, points)
+        return {'level': level, 'time': times, 'min': mins, 'max': maxs, 'rms': rms}
+
+    def segments_above(self, threshold, level=256, min_gap_s=0.0):
+        """Return (start_s, end_s) pairs where the block RMS at `level` exceeds threshold.
+
+        Segments separated by less than min_gap_s are merged. Useful for finding arc-on
+        periods in a long recording.
+        """
+        rms = np.asarray(self.levels[level][:, 2])
+        above = np.concatenate(([False], rms > threshold, [False]))
+        changes = np.flatnonzero(above[1:] != above[:-1])
+        starts, ends = changes[0::2] * level, np.minimum(changes[1::2] * level, self.samples)
+        segments = []
+        for start, end in zip(starts / self.sampling_rate, ends / self.sampling_rate):
+            if segments and start - segments[-1][1] < min_gap_s:
+                segments[-1] = (segments[-1][0], float(end))
+            else:
+                segments.append((float(start), float(end)))
+        return segments
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 4):
+        print("Usage: python audio_envelope.py <wav_file> [start_s end_s]")
+        sys.exit(1)
+
+    envelope = AudioEnvelope(sys.argv[1])
+    print(f"{envelope.samples} samples, {envelope.duration:.1f} s, levels {sorted(envelope.levels)}")
+    if len(sys.argv) == 4:
+        result = envelope.window(float(sys.argv[2]), float(sys.argv[3]), points=20)
+        for t, lo, hi, r in zip(result['time'], result['min'], result['max'], result['rms']):
+            print(f"{t:10.4f} s  min {lo: .6f}  max {hi: .6f}  rms {r:.6f}")
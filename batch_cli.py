@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import glob
+import time
+import zlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from Data_Processing import build_jobs, process_data_folder
+
+# Folders written by the processing itself, never searched for sessions
+OUTPUT_FOLDERS = {'FLIR', 'FLIR_Frames', 'FLIR_stack', 'session_cache'}
+
+def is_session_folder(folder):
+    """True if the folder holds any data file or FLIR folder that Data_Processing handles"""
+    return bool(build_jobs(folder, workers=1))
+
+def discover_sessions(roots):
+    """Return (root, session folder) pairs for every session under the given roots.
+
+    Each root may be a folder or a glob pattern (`**` is supported). A root that is a
+    session itself is returned as is; otherwise it is searched recursively. Sessions
+    are not searched further, so their output folders are never mistaken for sessions.
+    """
+    found = {}
+    for pattern in roots:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for root in matches:
+            if not os.path.isdir(root):
+                continue
+            root = os.path.abspath(root)
+            for dirpath, dirnames, _ in os.walk(root):
+                if is_session_folder(dirpath):
+                    found.setdefault(dirpath, root)
+                    dirnames[:] = []
+                else:
+                    dirnames[:] = sorted(d for d in dirnames if d not in OUTPUT_FOLDERS and not d.startswith('.'))
+    return sorted((root, folder) for folder, root in found.items())
+
+def parse_shard(value):
+    """Parse 'i/n' (0 <= i < n) into (i, n)"""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shard must look like i/n, got {value!r}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be in 0..{count - 1}, got {value!r}")
+    return index, count
+
+def in_shard(root, folder, shard):
+    """Assign sessions to shards by a CRC32 of their path relative to the root.
+
+    The relative path does not depend on where the archive is mounted, so every node
+    computes the same split without coordinating.
+    """
+    index, count = shard
+    key = os.path.relpath(folder, root).replace(os.sep, '/')
+    if key == '.':
+        key = os.path.basename(folder)
+    return zlib.crc32(key.encode('utf-8')) % count == index
+
+def _process_session(folder, force, hash_content, job_workers, profile=False):
+    # Module-level so it can be sent to pool workers
+    started = time.time()
+    try:
+        statuses = process_data_folder(folder, max_workers=job_workers, force=force,
+                                       hash_content=hash_content, workers=job_workers, profile=profile)
+        failed = any(status not in ('ok', 'skipped') for status in statuses.values())
+        return {'folder': folder, 'status': 'failed' if failed else 'ok', 'jobs': statuses,
+                'seconds': round(time.time() - started, 3)}
+    except Exception as e:
+        return {'folder': folder, 'status': 'error', 'error': f"{type(e).__name__}: {e}",
+                'jobs': {}, 'seconds': round(time.time() - started, 3)}
+
+def run_batch(sessions, workers=None, force=False, hash_content=False, job_workers=None, profile=False):
+    """Process session folders on a process pool and return one result dict per session.
+
+    `workers` sessions run at once; each may use `job_workers` processes for its own jobs
+    (by default the cores are split evenly between the running sessions).
+    """
+    if not sessions:
+        return []
+    cpu_count = os.cpu_count() or 1
+    workers = min(len(sessions), workers or cpu_count)
+    job_workers = job_workers or max(1, cpu_count // workers)
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_process_session, folder, force, hash_content, job_workers, profile)
+                   for folder in sessions]
+        for done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            results.append(result)
+            print(f"[{done}/{len(sessions)}] {result['status']}: {result['folder']} ({result['seconds']:.1f} s)")
+    return sorted(results, key=lambda result: result['folder'])
+
+def write_summary(path, summary):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(summary, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Process every session folder under one or more roots, without a GUI.")
+    parser.add_argument('roots', nargs='+', help="root folders or glob patterns to search for sessions")
+    parser.add_argument('--workers', type=int, help="sessions processed at once (default: one per core)")
+    parser.add_argument('--job-workers', type=int, help="processes each session may use for its jobs")
+    parser.add_argument('--shard', type=parse_shard, default=(0, 1), help="only process shard i of n, e.g. 2/8")
+    parser.add_argument('--summary', default='batch_summary.json', help="where to write the JSON summary")
+    parser.add_argument('--force', action='store_true', help="rebuild every output, even if it is up to date")
+    parser.add_argument('--hash', action='store_true', help="fingerprint input files by content, not just size and mtime")
+    parser.add_argument('--list', action='store_true', help="only list the sessions in this shard")
+    parser.add_argument('--profile', action='store_true', help="write a performance_report.json in every session")
+    args = parser.parse_args()
+
+    discovered = discover_sessions(args.roots)
+    sessions = [folder for root, folder in discovered if in_shard(root, folder, args.shard)]
+    print(f"Found {len(discovered)} sessions, {len(sessions)} in shard {args.shard[0]}/{args.shard[1]}")
+    if args.list:
+        for folder in sessions:
+            print(folder)
+        return
+
+    started = datetime.now()
+    results = run_batch(sessions, args.workers, args.force, args.hash, args.job_workers, args.profile)
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    write_summary(args.summary, {
+        'started': started.isoformat(timespec='seconds'),
+        'finished': datetime.now().isoformat(timespec='seconds'),
+        'roots': args.roots,
+        'shard': f"{args.shard[0]}/{args.shard[1]}",
+        'counts': counts,
+        'sessions': results,
+    })
+    print(f"Summary written to {args.summary}: {counts or 'no sessions'}")
+    if any(result['status'] != 'ok' for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
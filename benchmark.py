@@ -0,0 +1,314 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+BENCHMARK_VERSION = 1
+SESSION_START = datetime(2025, 3, 1, 12, 0, 0)
+GENERATOR_CHUNK = 1_000_000
+# Written into every generated session; only folders holding it are ever deleted
+SESSION_MARKER = '.benchmark_session'
+ROBOT_LOG_HEADER = 'SystemTime|RelativeTime|Message'
+
+# Default synthetic session sizes; override with the command line options
+DEFAULT_SIZES = {
+    'audio_seconds': 60,
+    'flir_frames': 1000,
+    'robot_lines': 200_000,
+    'lembox_rows': 1_000_000,
+    'xiris_frames': 300,
+}
+
+def _timestamps(start, count, step_seconds, offset=0):
+    times = np.datetime64(start, 'us') + (np.arange(offset, offset + count) * step_seconds * 1e6).astype('timedelta64[us]')
+    return np.char.replace(np.datetime_as_string(times, unit='us').astype(str), 'T', ' ')
+
+def generate_microphone_csv(path, seconds, sampling_rate=48000, seed=0):
+    """Write a 48 kHz microphone CSV (info row, Time and Amplitude columns) and return its row count"""
+    rng = np.random.default_rng(seed)
+    rows = int(seconds * sampling_rate)
+    with open(path, 'w', newline='') as f:
+        f.write(f"Recording started {SESSION_START.strftime('%Y-%m-%d %H:%M:%S.%f')}\n")
+        for start in range(0, max(rows, 1), GENERATOR_CHUNK):
+            n = min(GENERATOR_CHUNK, rows - start)
+            if n <= 0:
+                break
+            t = np.arange(start, start + n) / sampling_rate
+            amplitude = 0.05 * np.sin(2 * np.pi * 220 * t) + rng.normal(0, 0.01, n)
+            pd.DataFrame({'Time': t, 'Amplitude': amplitude}).to_csv(
+                f, index=False, header=(start == 0), float_format='%.6f')
+    return rows
+
+def generate_flir_frames(folder, count, shape=(240, 320), fps=10, seed=0):
+    """Write FLIR frames as pickled {'frame', 'timestamp'} .npy dicts and return the frame count"""
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    yy, xx = np.mgrid[0:shape[0], 0:shape[1]]
+    timestamps = _timestamps(SESSION_START, count, 1 / fps)
+    for i in range(count):
+        cx = shape[1] * (0.1 + 0.8 * i / max(1, count - 1))
+        hot_spot = np.exp(-((xx - cx) ** 2 + (yy - shape[0] / 2) ** 2) / 200.0) * 2000
+        frame = (7000 + hot_spot + rng.normal(0, 20, shape)).astype(np.uint16)
+        np.save(os.path.join(folder, f"frame_{i:05d}.npy"), {'frame': frame, 'timestamp': str(timestamps[i])})
+    return count
+
+def generate_robot_log(path, lines, seed=0):
+    """Write a robot log (header line, then SystemTime|RelativeTime|<Rob> XML lines) and return the message count"""
+    rng = np.random.default_rng(seed)
+    with open(path, 'w') as f:
+        f.write(ROBOT_LOG_HEADER + '\n')
+        for start in range(0, lines, GENERATOR_CHUNK):
+            n = min(GENERATOR_CHUNK, lines - start)
+            times = _timestamps(SESSION_START, n, 0.004, start)
+            pose = np.round(rng.uniform(-500, 500, (n, 3)), 4)
+            f.writelines(
+                f'{times[i]}|{(start + i) * 0.004:.3f}|<Rob Type="KUKA">'
+                f'<RIst X="{x}" Y="{y}" Z="{z}" A="0.0" B="90.0" C="0.0"/>'
+                f'<RSol X="{x}" Y="{y}" Z="{z}" A="0.0" B="90.0" C="0.0"/>'
+                f'<Delay D="0"/><CAM>{(start + i) % 2}</CAM><FLASH>OFF</FLASH><IPOC>{1000 + start + i}</IPOC></Rob>\n'
+                for i, (x, y, z) in enumerate(pose.tolist()))
+    return lines
+
+def generate_lembox_csv(path, rows, rate=10000, seed=0):
+    """Write a raw LEM box CSV (Timestamp, Voltage(V), Current(A)) and return its row count"""
+    rng = np.random.default_rng(seed)
+    with open(path, 'w', newline='') as f:
+        for start in range(0, max(rows, 1), GENERATOR_CHUNK):
+            n = min(GENERATOR_CHUNK, rows - start)
+            if n <= 0:
+                break
+            pd.DataFrame({
+                'Timestamp': _timestamps(SESSION_START, n, 1 / rate, start),
+                'Voltage(V)': np.round(2.5 + rng.normal(0, 0.2, n), 5),
+                'Current(A)': np.round(2.0 + rng.normal(0, 0.2, n), 5),
+            }).to_csv(f, index=False, header=(start == 0))
+    return rows
+
+def generate_xiris_frames(folder, count):
+    """Write synthetic Xiris frames (see create_xirisvideo) and return the frame count"""
+    from create_xirisvideo import generate_synthetic_xiris
+    generate_synthetic_xiris(folder, count)
+    return count
+
+def generate_session(folder, sizes, log_func=print):
+    """Write a synthetic session folder and return {stream: item count}"""
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, SESSION_MARKER), 'w') as f:
+        f.write(f"Synthetic session written by benchmark.py version {BENCHMARK_VERSION}\n")
+    counts = {}
+    steps = [
+        ('audio', sizes['audio_seconds'], lambda: generate_microphone_csv(os.path.join(folder, 'microphone_data.csv'), sizes['audio_seconds'])),
+        ('robot', sizes['robot_lines'], lambda: generate_robot_log(os.path.join(folder, 'robot_data.txt'), sizes['robot_lines'])),
+        ('lembox', sizes['lembox_rows'], lambda: generate_lembox_csv(os.path.join(folder, 'lembox_raw.csv'), sizes['lembox_rows'])),
+        ('flir', sizes['flir_frames'], lambda: generate_flir_frames(os.path.join(folder, 'FLIR'), sizes['flir_frames'])),
+        ('xiris', sizes['xiris_frames'], lambda: generate_xiris_frames(os.path.join(folder, 'Xiris'), sizes['xiris_frames'])),
+    ]
+    for name, size, generate in steps:
+        if not size:
+            continue
+        started = time.perf_counter()
+        counts[name] = generate()
+        log_func(f"Generated {name}: {counts[name]} items in {time.perf_counter() - started:.1f} s")
+    return counts
+
+# Stage functions: each prepares a cold start (outside the timing) and returns the work to time
+
+def is_benchmark_session(folder):
+    return os.path.isfile(os.path.join(folder, SESSION_MARKER))
+
+def _stage_audio(folder, workers):
+    from audio_conversion import csv_to_wav
+    csv_path = os.path.join(folder, 'microphone_data.csv')
+    peak_cache = os.path.join(folder, 'microphone_data.peak.json')
+    if os.path.exists(peak_cache):
+        os.remove(peak_cache)
+    return lambda: csv_to_wav(csv_path, os.path.join(folder, 'microphone_data.wav'))
+
+def _stage_robot(folder, workers):
+    from robotdata_parsing import convert_robot_data_to_csv_fast
+    return lambda: convert_robot_data_to_csv_fast(os.path.join(folder, 'robot_data.txt'),
+                                                  os.path.join(folder, 'robot_data.csv'), workers=workers)
+
+def _stage_robot_generic(folder, workers):
+    from robotdata_parsing import convert_robot_data_to_csv
+    return lambda: convert_robot_data_to_csv(os.path.join(folder, 'robot_data.txt'),
+                                             os.path.join(folder, 'robot_data_generic.csv'))
+
+def _stage_lembox(folder, workers):
+    from lembox_scaling import scale_lembox_csv
+    # Scaling rewrites the file in place, so every run starts from a fresh copy of the raw CSV
+    csv_path = os.path.join(folder, 'lembox_data.csv')
+    shutil.copyfile(os.path.join(folder, 'lembox_raw.csv'), csv_path)
+    return lambda: scale_lembox_csv(csv_path, log_func=lambda message: None)
+
+def _stage_lembox_analytics(folder, workers):
+    from lembox_analytics import analyze_lembox_csv
+    csv_path = os.path.join(folder, 'lembox_raw.csv')
+    return lambda: analyze_lembox_csv(csv_path, os.path.join(folder, 'lembox_summary.csv'),
+                                      os.path.join(folder, 'lembox_events.csv'), log_func=lambda message: None)
+
+def _stage_flir(folder, workers):
+    from create_flirvideo import MANIFEST_FILENAME, default_stack_folder, flir_to_video
+    flir_folder = os.path.join(folder, 'FLIR')
+    shutil.rmtree(default_stack_folder(flir_folder), ignore_errors=True)
+    if os.path.exists(os.path.join(flir_folder, MANIFEST_FILENAME)):
+        os.remove(os.path.join(flir_folder, MANIFEST_FILENAME))
+    return lambda: flir_to_video(flir_folder, os.path.join(folder, 'FLIR.mp4'), os.path.join(folder, 'FLIR_Frames'),
+                                 log_func=lambda message: None, workers=workers)
+
+def _stage_xiris(folder, workers):
+    from create_xirisvideo import xiris_to_video
+    return lambda: xiris_to_video(os.path.join(folder, 'Xiris'), os.path.join(folder, 'Xiris.mp4'),
+                                  log_func=lambda message: None, workers=workers)
+
+def _stage_session_cache(folder, workers):
+    from session_cache import write_session_cache
+    return lambda: write_session_cache(folder, force=True, log_func=lambda message: None)
+
+# Stage name -> (setup function, stream whose item count it processes, throughput unit)
+STAGES = {
+    'audio': (_stage_audio, 'audio', 'rows/s'),
+    'robot': (_stage_robot, 'robot', 'lines/s'),
+    'robot_generic': (_stage_robot_generic, 'robot', 'lines/s'),
+    'lembox': (_stage_lembox, 'lembox', 'rows/s'),
+    'lembox_analytics': (_stage_lembox_analytics, 'lembox', 'rows/s'),
+    'flir': (_stage_flir, 'flir', 'frames/s'),
+    'xiris': (_stage_xiris, 'xiris', 'frames/s'),
+    'session_cache': (_stage_session_cache, None, None),
+}
+
+def _peak_rss_mb(who):
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def _run_stage(name, folder, workers):
+    # Runs in a fresh process, so its peak RSS belongs to this stage alone
+    silence = open(os.devnull, 'w')
+    sys.stdout = silence
+    try:
+        work = STAGES[name][0](folder, workers)
+        baseline_rss = _peak_rss_mb(resource.RUSAGE_SELF) if resource else None
+        started = time.perf_counter()
+        work()
+        seconds = time.perf_counter() - started
+    finally:
+        sys.stdout = sys.__stdout__
+        silence.close()
+    return {
+        'seconds': round(seconds, 4),
+        'baseline_rss_mb': baseline_rss,
+        'peak_rss_mb': _peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+        'children_peak_rss_mb': _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+    }
+
+def run_stage(name, folder, counts, workers=1):
+    """Run one stage in a spawned process and return its wall time, throughput and peak RSS"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        result = executor.submit(_run_stage, name, folder, workers).result()
+    _, stream, unit = STAGES[name]
+    if stream is not None:
+        items = counts.get(stream, 0)
+        result['items'] = items
+        result['throughput'] = round(items / result['seconds'], 1) if result['seconds'] > 0 else None
+        result['unit'] = unit
+    return result
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(folder, sizes, stages, workers=1, log_func=print):
+    """Generate a synthetic session in folder, time each stage and return the report"""
+    counts = generate_session(folder, sizes, log_func)
+    report = {
+        'version': BENCHMARK_VERSION,
+        'revision': _git_revision(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'workers': workers,
+        'sizes': sizes,
+        'stages': {},
+    }
+    for name in stages:
+        stream = STAGES[name][1]
+        if stream is not None and not counts.get(stream):
+            continue
+        result = run_stage(name, folder, counts, workers)
+        report['stages'][name] = result
+        throughput = f", {result['throughput']} {result['unit']}" if result.get('throughput') else ''
+        log_func(f"{name}: {result['seconds']:.2f} s{throughput}, peak RSS {result['peak_rss_mb']} MB "
+                 f"(workers {result['children_peak_rss_mb']} MB)")
+    return report
+
+def compare_reports(previous, current, log_func=print):
+    """Print the wall time ratio of each stage against an earlier report"""
+    for name, result in current['stages'].items():
+        old = previous.get('stages', {}).get(name)
+        if old and old['seconds'] > 0:
+            log_func(f"{name}: {old['seconds']:.2f} s -> {result['seconds']:.2f} s "
+                     f"({result['seconds'] / old['seconds']:.2f}x)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each processing stage on a synthetic session.")
+    parser.add_argument('--workdir', default='benchmark_session', help="folder for the synthetic session")
+    parser.add_argument('--output', default='benchmark.json', help="where to write the JSON report")
+    parser.add_argument('--stages', default=','.join(name for name in STAGES if name != 'robot_generic'),
+                        help=f"comma separated stages out of {', '.join(STAGES)}")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="processes for the parallel stages")
+    parser.add_argument('--compare', help="earlier report to compare wall times with")
+    parser.add_argument('--keep', action='store_true', help="keep the synthetic session after the run")
+    for key, default in DEFAULT_SIZES.items():
+        parser.add_argument('--' + key.replace('_', '-'), type=int, default=default)
+    args = parser.parse_args()
+
+    stages = [name.strip() for name in args.stages.split(',') if name.strip()]
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+    sizes = {key: getattr(args, key) for key in DEFAULT_SIZES}
+    # Never write into, or delete, a folder of real data
+    if os.path.isdir(args.workdir) and os.listdir(args.workdir) and not is_benchmark_session(args.workdir):
+        parser.error(f"{args.workdir} is not empty and was not created by benchmark.py; choose another --workdir")
+    # Only a folder this run creates, or an earlier benchmark session, is removed afterwards
+    removable = not os.path.exists(args.workdir) or is_benchmark_session(args.workdir)
+
+    try:
+        report = run_benchmark(args.workdir, sizes, stages, args.workers)
+    finally:
+        if not args.keep:
+            if removable and is_benchmark_session(args.workdir):
+                shutil.rmtree(args.workdir, ignore_errors=True)
+            else:
+                print(f"Synthetic session left in {args.workdir}")
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f"Report written to {args.output}")
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare_reports(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
 import numpy as np
 import cv2
 import os
-import matplotlib.pyplot as plt
+import json
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
+
+from flir_calibration import CALIBRATION_PROFILES, get_profile
+from instrumentation import span, timed_iter
 
 def convert_to_8bit(image, global_min, global_max):
     image_normalized = (image - global_min) / (global_max - global_min)
@@ -10,38 +17,60 @@ def convert_to_8bit(image, global_min, global_max):
     image_8bit = (image_normalized * 255).astype(np.uint8)
     return image_8bit
 
+# Segment data of matplotlib's 'jet' colormap as (x, y) control points per channel, so the
+# lookup tables below reproduce plt.get_cmap('jet') exactly without importing matplotlib.
+_JET_SEGMENTS = (
+    ((0.0, 0.0), (0.35, 0.0), (0.66, 1.0), (0.89, 1.0), (1.0, 0.5)),
+    ((0.0, 0.0), (0.125, 0.0), (0.375, 1.0), (0.64, 1.0), (0.91, 0.0), (1.0, 0.0)),
+    ((0.0, 0.5), (0.11, 1.0), (0.34, 1.0), (0.65, 0.0), (1.0, 0.0)),
+)
+
+def _segment_lut(points, n=256):
+    # Same interpolation as matplotlib.colors._create_lookup_table
+    points = np.asarray(points, dtype=float)
+    x = points[:, 0] * (n - 1)
+    y = points[:, 1]
+    xind = (n - 1) * np.linspace(0, 1, n)
+    ind = np.searchsorted(x, xind)[1:-1]
+    distance = (xind[1:-1] - x[ind - 1]) / (x[ind] - x[ind - 1])
+    lut = np.concatenate([[y[0]], distance * (y[ind] - y[ind - 1]) + y[ind - 1], [y[-1]]])
+    return np.clip(lut, 0.0, 1.0)
+
+def build_colormap_lut(inverted=False):
+    """Return the 256 x 3 uint8 'jet' lookup table (reversed if inverted).
+
+    Channels are stored in the same order the frames have always been written with,
+    so output images are unchanged.
+    """
+    channels = []
+    for points in _JET_SEGMENTS:
+        if inverted:
+            points = [(1.0 - x, y) for x, y in reversed(points)]
+        channels.append(_segment_lut(points))
+    return (np.stack(channels, axis=1) * 255).astype(np.uint8)
+
+JET_LUT = build_colormap_lut()
+INVERTED_JET_LUT = build_colormap_lut(inverted=True)
+
 def apply_inverted_colormap(image_8bit):
-    colormap = plt.get_cmap('jet')
-    inverted_colormap = colormap.reversed()
-    colored_image = inverted_colormap(image_8bit / 255.0)
-    return (colored_image[:, :, :3] * 255).astype(np.uint8)
+    return INVERTED_JET_LUT[image_8bit]
 
-def add_vertical_color_scale_bar(image, width, height, global_min, global_max):
+def add_vertical_color_scale_bar(image, width, height, global_min, global_max, calibration=None):
     bar_height = int(0.5 * height)
     bar_thickness = 20
     bar_x_start = width - 30
     bar_y_start = (height - bar_height) // 2
 
     gradient = np.linspace(0, 1, bar_height)
-    gradient_colormap = plt.get_cmap('jet')(gradient)
-    gradient_colormap = (gradient_colormap[:, :3] * 255).astype(np.uint8)
-
-    for i in range(bar_height):
-        image[bar_y_start + i, bar_x_start:bar_x_start + bar_thickness] = gradient_colormap[i]
+    gradient_colormap = JET_LUT[np.minimum((gradient * 256).astype(int), 255)]
+    image[bar_y_start:bar_y_start + bar_height, bar_x_start:bar_x_start + bar_thickness] = gradient_colormap[:, None, :]
 
 ###################################################################################################
-# This section is where you set the minimum and maximum values of the scale bar.    
-    # Test Range (using raw values directly)
-    min_temperature = global_min
-    max_temperature = global_max
-
-    #Lower Range
-    #min_temperature = -0.000000045*global_min*global_min + 0.0095*global_min-85
-    #max_temperature = -0.000000045*global_max*global_max + 0.0095*global_max-85
-    
-    #Upper Range
-    #min_temperature = 0.0468*global_min-267.72
-    #max_temperature = 0.0468*global_max-267.72
+# The scale bar shows raw values unless a calibration profile (see flir_calibration.py)
+# is chosen, e.g. 'lower_range' or 'upper_range'.
+    calibration = get_profile(calibration) or CALIBRATION_PROFILES['raw']
+    min_label = calibration.label(global_min)
+    max_label = calibration.label(global_max)
 ###################################################################################################
     font = cv2.FONT_HERSHEY_SIMPLEX
     font_scale = 0.5
@@ -51,13 +80,16 @@ def add_vertical_color_scale_bar(image, width, height, global_min, global_max):
     min_label_pos = (bar_x_start - 45, bar_y_start + bar_height)
     max_label_pos = (bar_x_start - 45, bar_y_start)
 
-    image = cv2.putText(image, f'{min_temperature:.2f}C', min_label_pos, font, font_scale, font_color, thickness)
-    image = cv2.putText(image, f'{max_temperature:.2f}C', max_label_pos, font, font_scale, font_color, thickness)
+    image = cv2.putText(image, min_label, min_label_pos, font, font_scale, font_color, thickness)
+    image = cv2.putText(image, max_label, max_label_pos, font, font_scale, font_color, thickness)
 
     return image
 
+# Layout of the FLIR frame timestamps
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
 def add_timestamp(image, timestamp, width, height):
-    formatted = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S.%f') \
+    formatted = datetime.strptime(timestamp, TIMESTAMP_FORMAT) \
                       .strftime('%H:%M:%S.%f')[:-3]
     text = f" {formatted}" # Add build label here if desired
     font       = cv2.FONT_HERSHEY_SIMPLEX
@@ -68,80 +100,522 @@ def add_timestamp(image, timestamp, width, height):
     loc  = (width - size[0] - 10, height - 10)
     return cv2.putText(image, text, loc, font, font_scale, color, thickness, lineType=cv2.LINE_AA)
 
-def find_global_min_max(input_folder):
-    npy_files = sorted([f for f in os.listdir(input_folder) if f.endswith('.npy')])
-    global_min = float('inf')
-    global_max = float('-inf')
+class FrameRenderer:
+    """Per-video rendering state: a raw-count colormap lookup table and a pre-drawn scale bar.
+
+    Both are built once per video, so rendering a frame is a table lookup, a resize, a
+    masked copy of the overlay and the timestamp text. With a calibration profile the
+    colors are spread evenly over the calibrated temperatures instead of the raw counts.
+    """
+
+    def __init__(self, global_min, global_max, width=640, height=480, calibration=None):
+        self.global_min = global_min
+        self.global_max = global_max
+        self.width = width
+        self.height = height
+        self.calibration = get_profile(calibration)
+
+        # Integer frames up to 16 bits are scaled and colored straight from their raw counts
+        if self.calibration is None:
+            counts = np.arange(65536)
+            self.count_8bit = convert_to_8bit(counts, global_min, global_max)
+        else:
+            self.temperature_min, self.temperature_max = self.calibration.convert([global_min, global_max])
+            self.count_8bit = convert_to_8bit(self.calibration.lut, self.temperature_min, self.temperature_max)
+        self.count_lut = INVERTED_JET_LUT[self.count_8bit]
+
+        # The jet colormap has no black entries and the labels are white, so any
+        # non-zero overlay pixel belongs to the scale bar or its labels
+        overlay = np.zeros((height, width, 3), dtype=np.uint8)
+        overlay = add_vertical_color_scale_bar(overlay, width, height, global_min, global_max, self.calibration)
+        self.overlay_index = np.flatnonzero(overlay.any(axis=2))
+        self.overlay_pixels = overlay.reshape(-1, 3)[self.overlay_index]
+
+    def to_8bit(self, image):
+        """The frame scaled to 8 bits as it is colored, at its own size"""
+        with span('flir.normalize'):
+            if image.dtype == np.uint16 or image.dtype == np.uint8:
+                return np.take(self.count_8bit, image)
+            if self.calibration is None:
+                return convert_to_8bit(image, self.global_min, self.global_max)
+            return convert_to_8bit(self.calibration.convert(image), self.temperature_min, self.temperature_max)
+
+    def colorize(self, image):
+        if image.dtype == np.uint16 or image.dtype == np.uint8:
+            with span('flir.colormap'):
+                return np.take(self.count_lut, image, axis=0)
+        image_8bit = self.to_8bit(image)
+        with span('flir.colormap'):
+            return apply_inverted_colormap(image_8bit)
+
+    def render(self, image, timestamp):
+        colored_image = self.colorize(image)
+        with span('flir.resize'):
+            resized_image = cv2.resize(colored_image, (self.width, self.height))
+        with span('flir.overlay'):
+            resized_image.reshape(-1, 3)[self.overlay_index] = self.overlay_pixels
+            return add_timestamp(resized_image, timestamp, self.width, self.height)
+
+MANIFEST_FILENAME = 'frame_manifest.json'
+MANIFEST_VERSION = 1
+
+def load_frame(npy_file_path):
+    """Load a pickled FLIR frame dict and return (frame, timestamp)"""
+    data = np.load(npy_file_path, allow_pickle=True).item()
+    return data['frame'], data.get('timestamp', None)
 
-    for npy_file in npy_files:
-        npy_file_path = os.path.join(input_folder, npy_file)
+def _read_manifest(manifest_path):
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != MANIFEST_VERSION:
+            return {}
+        return {entry['filename']: entry for entry in manifest['frames']}
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+def _write_manifest(manifest_path, entries):
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': MANIFEST_VERSION, 'frames': entries}, f)
+    os.replace(tmp_path, manifest_path)
+
+def build_frame_manifest(input_folder, log_func=print):
+    """Scan the FLIR folder once and return one manifest entry per frame, sorted by timestamp.
+
+    Each entry holds the filename, timestamp, per-frame min/max, shape and dtype. The
+    entries are cached in a sidecar file in the FLIR folder, and files whose size and
+    modification time are unchanged since the last scan are not loaded again.
+    Frames without a timestamp are kept (they still count towards the global range)
+    and sorted to the end.
+    """
+    manifest_path = os.path.join(input_folder, MANIFEST_FILENAME)
+    cached = _read_manifest(manifest_path)
+
+    entries = []
+    rescanned = 0
+    with os.scandir(input_folder) as it:
+        npy_entries = sorted((e for e in it if e.name.endswith('.npy') and e.is_file()),
+                             key=lambda e: e.name)
+
+    for dir_entry in npy_entries:
+        stat = dir_entry.stat()
+        entry = cached.get(dir_entry.name)
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            entries.append(entry)
+            continue
         try:
-            data = np.load(npy_file_path, allow_pickle=True)
-            image = data.item()['frame']
-            global_min = min(global_min, image.min())
-            global_max = max(global_max, image.max())
+            image, timestamp = load_frame(dir_entry.path)
+            entries.append({
+                'filename': dir_entry.name,
+                'timestamp': timestamp or None,
+                'min': image.min().item(),
+                'max': image.max().item(),
+                'shape': list(image.shape),
+                'dtype': str(image.dtype),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+            })
+            rescanned += 1
         except Exception as e:
-            print(f"Skipping {npy_file}: {e}")
+            log_func(f"Skipping {dir_entry.name}: {e}")
 
+    if rescanned or len(entries) != len(cached):
+        _write_manifest(manifest_path, entries)
+
+    # One vectorized parse and stable sort; NaT (no timestamp) sorts last
+    timestamps = np.array([entry['timestamp'] or 'NaT' for entry in entries], dtype='datetime64[us]')
+    return [entries[i] for i in np.argsort(timestamps, kind='stable')]
+
+def manifest_min_max(entries):
+    """Return the global (min, max) over all frames in a manifest"""
+    global_min = min((entry['min'] for entry in entries), default=float('inf'))
+    global_max = max((entry['max'] for entry in entries), default=float('-inf'))
     return global_min, global_max
 
-def npy_to_video(input_folder, output_file, output_frames_folder, fps=10, width=640, height=480):
-    global_min, global_max = find_global_min_max(input_folder)
-    
-    # Extract timestamps and sort files
-    npy_files_with_timestamps = []
-    for npy_file in os.listdir(input_folder):
-        if npy_file.endswith('.npy'):
-            npy_file_path = os.path.join(input_folder, npy_file)
+def find_global_min_max(input_folder):
+    return manifest_min_max(build_frame_manifest(input_folder))
+
+STACK_FOLDER_NAME = 'FLIR_stack'
+STACK_FRAMES_FILENAME = 'frames.npy'
+STACK_TIMESTAMPS_FILENAME = 'timestamps.npy'
+STACK_METADATA_FILENAME = 'metadata.json'
+STACK_VERSION = 1
+
+def default_stack_folder(input_folder):
+    """Return the stack folder that sits next to a FLIR folder (<session>/FLIR_stack)"""
+    return os.path.join(os.path.dirname(os.path.abspath(input_folder)), STACK_FOLDER_NAME)
+
+def is_flir_stack(folder):
+    return os.path.isfile(os.path.join(folder, STACK_METADATA_FILENAME))
+
+def source_signature(input_folder):
+    """Hash of the names, sizes and modification times of the .npy frames in a FLIR folder"""
+    digest = hashlib.sha1()
+    with os.scandir(input_folder) as it:
+        for dir_entry in sorted((e for e in it if e.name.endswith('.npy') and e.is_file()), key=lambda e: e.name):
+            stat = dir_entry.stat()
+            digest.update(f"{dir_entry.name}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+def load_stack_metadata(stack_folder):
+    with open(os.path.join(stack_folder, STACK_METADATA_FILENAME), 'r') as f:
+        return json.load(f)
+
+def is_stack_fresh(stack_folder, input_folder):
+    """True if the stack exists and was built from the current contents of input_folder"""
+    if not is_flir_stack(stack_folder):
+        return False
+    try:
+        metadata = load_stack_metadata(stack_folder)
+    except (OSError, ValueError):
+        return False
+    return metadata.get('version') == STACK_VERSION and metadata.get('source_signature') == source_signature(input_folder)
+
+def convert_to_flir_stack(input_folder, stack_folder=None, log_func=print):
+    """Consolidate the pickled FLIR frames of a folder into a memory-mappable stack.
+
+    The stack folder holds frames.npy (one contiguous N x H x W array in timestamp order),
+    timestamps.npy (datetime64[us]) and metadata.json (source filenames, global min/max,
+    shape, dtype). Frames without a timestamp, or whose shape or dtype differ from the
+    first frame, are left out. Returns the stack folder.
+    """
+    stack_folder = stack_folder or default_stack_folder(input_folder)
+    signature = source_signature(input_folder)
+    entries = build_frame_manifest(input_folder, log_func)
+    global_min, global_max = manifest_min_max(entries)
+
+    timed_entries = [entry for entry in entries if entry['timestamp']]
+    if not timed_entries:
+        log_func("No valid FLIR npy files found.")
+        return None
+    shape, dtype = timed_entries[0]['shape'], timed_entries[0]['dtype']
+    stack_entries = []
+    for entry in timed_entries:
+        if entry['shape'] == shape and entry['dtype'] == dtype:
+            stack_entries.append(entry)
+        else:
+            log_func(f"Skipping {entry['filename']}: frame is {entry['dtype']} {entry['shape']}, stack is {dtype} {shape}")
+
+    # The metadata file marks a complete stack, so it is removed first and written last
+    os.makedirs(stack_folder, exist_ok=True)
+    metadata_path = os.path.join(stack_folder, STACK_METADATA_FILENAME)
+    if os.path.exists(metadata_path):
+        os.remove(metadata_path)
+
+    frames = np.lib.format.open_memmap(os.path.join(stack_folder, STACK_FRAMES_FILENAME), mode='w+',
+                                       dtype=np.dtype(dtype), shape=(len(stack_entries), *shape))
+    for i, entry in enumerate(stack_entries):
+        frames[i], _ = load_frame(os.path.join(input_folder, entry['filename']))
+    frames.flush()
+    del frames
+
+    timestamps = np.array([entry['timestamp'] for entry in stack_entries], dtype='datetime64[us]')
+    np.save(os.path.join(stack_folder, STACK_TIMESTAMPS_FILENAME), timestamps)
+
+    metadata = {
+        'version': STACK_VERSION,
+        'count': len(stack_entries),
+        'shape': shape,
+        'dtype': dtype,
+        'global_min': global_min,
+        'global_max': global_max,
+        'filenames': [entry['filename'] for entry in stack_entries],
+        'source_signature': signature,
+    }
+    with open(metadata_path + '.tmp', 'w') as f:
+        json.dump(metadata, f)
+    os.replace(metadata_path + '.tmp', metadata_path)
+    log_func(f"FLIR stack saved to {stack_folder} ({len(stack_entries)} frames)")
+    return stack_folder
+
+def load_flir_stack(stack_folder):
+    """Open a FLIR stack and return (frames, timestamps, metadata).
+
+    frames is a read-only memory map, so indexing it only reads the frames that are used.
+    """
+    metadata = load_stack_metadata(stack_folder)
+    frames = np.load(os.path.join(stack_folder, STACK_FRAMES_FILENAME), mmap_mode='r')
+    timestamps = np.load(os.path.join(stack_folder, STACK_TIMESTAMPS_FILENAME))
+    return frames, timestamps, metadata
+
+def format_stack_timestamps(timestamps):
+    """Format datetime64 stack timestamps as the FLIR timestamp strings"""
+    return [t.replace('T', ' ') for t in np.datetime_as_string(timestamps, unit='us')]
+
+def _open_frame_source(input_folder):
+    # Stack frames are read from its memory map, folder frames from their files
+    if is_flir_stack(input_folder):
+        source, _, _ = load_flir_stack(input_folder)
+        return source
+    return input_folder
+
+def _render_frame(renderer, source, frame_key, timestamp, keep_8bit=False):
+    # Returns the rendered frame and, if keep_8bit is set, the 8-bit frame before coloring.
+    # Stack frames are keyed by index, folder frames by filename.
+    with span('flir.load'):
+        if isinstance(frame_key, int):
+            image = np.array(source[frame_key])
+        else:
+            image, _ = load_frame(os.path.join(source, frame_key))
+    return renderer.render(image, timestamp), renderer.to_8bit(image) if keep_8bit else None
+
+# Per-process state of the render pool workers; never set in the calling process
+_worker_renderer = None
+_worker_source = None
+
+def _init_render_worker(renderer, input_folder):
+    global _worker_renderer, _worker_source
+    _worker_renderer = renderer
+    _worker_source = _open_frame_source(input_folder)
+
+def _render_frame_file(frame_key, timestamp, keep_8bit=False):
+    return _render_frame(_worker_renderer, _worker_source, frame_key, timestamp, keep_8bit)
+
+# Frame export format -> file extension
+FRAME_FORMATS = {'png': '.png', 'jpg': '.jpg', 'npy': '.npy'}
+# How frame images are named after their source file: 'stem' gives frame_00001.png (the
+# command line scripts), 'filename' gives frame_00001.npy.png (the GUI)
+FRAME_NAMES = ('stem', 'filename')
+
+class FrameExporter:
+    """Writes every Nth rendered frame to a folder on a background thread pool.
+
+    Frames are saved as PNG (quality is the 0-9 compression level), JPEG (quality is
+    0-100) or as the given array in a .npy file; npy_to_video passes the 8-bit frame
+    before coloring for npy. At most max_pending writes are
+    queued; submitting more waits for the oldest, which bounds memory if the disk falls
+    behind. cv2 releases the GIL while encoding, so the writes overlap with rendering.
+    """
+
+    def __init__(self, folder, frame_format='png', every=1, quality=None, threads=2, max_pending=None,
+                 log_func=print):
+        if frame_format not in FRAME_FORMATS:
+            raise ValueError(f"Unknown frame format {frame_format!r}, expected one of {list(FRAME_FORMATS)}")
+        self.folder = folder
+        self.frame_format = frame_format
+        self.every = max(1, every)
+        self.log_func = log_func
+        if frame_format == 'png':
+            self.params = [cv2.IMWRITE_PNG_COMPRESSION, quality] if quality is not None else []
+        elif frame_format == 'jpg':
+            self.params = [cv2.IMWRITE_JPEG_QUALITY, 95 if quality is None else quality]
+        else:
+            self.params = []
+        self.max_pending = max_pending or 4 * threads
+        self.pending = deque()
+        self.written = 0
+        self.failed = 0
+        os.makedirs(folder, exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+
+    def wants(self, index):
+        return index % self.every == 0
+
+    def submit(self, name, image):
+        """Queue image to be written as <name>.<ext> and return the path it will have"""
+        path = os.path.join(self.folder, name + FRAME_FORMATS[self.frame_format])
+        self.pending.append((path, self.executor.submit(self._write, path, image)))
+        if len(self.pending) > self.max_pending:
+            with span('flir.frame_write_wait'):
+                while len(self.pending) > self.max_pending:
+                    self._collect()
+        return path
+
+    def _write(self, path, image):
+        with span('flir.frame_write'):
+            if self.frame_format == 'npy':
+                np.save(path, image)
+            elif not cv2.imwrite(path, image, self.params):
+                raise OSError(f"cv2.imwrite could not write {path}")
+
+    def _collect(self):
+        path, future = self.pending.popleft()
+        try:
+            future.result()
+            self.written += 1
+        except Exception as e:
+            self.failed += 1
+            self.log_func(f"Error saving frame {path}: {e}")
+
+    def close(self):
+        """Wait for the queued writes and stop the threads"""
+        while self.pending:
+            self._collect()
+        self.executor.shutdown()
+
+def imap_ordered(func, tasks, workers=1, queue_depth=None, initializer=None, initargs=()):
+    """Run func(*task) for each task and yield (task, result, error) in task order.
+
+    With more than one worker the calls run on a process pool. At most queue_depth
+    tasks are in flight or waiting to be consumed, so memory is bounded by the queue
+    depth rather than by the number of tasks. With one worker the initializer runs in
+    the calling process, so module state it sets is shared with other threads.
+    """
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for task in tasks:
             try:
-                data = np.load(npy_file_path, allow_pickle=True)
-                timestamp = data.item().get('timestamp', None)
-                if timestamp:
-                    npy_files_with_timestamps.append((npy_file, timestamp))
+                yield task, func(*task), None
             except Exception as e:
-                print(f"Skipping {npy_file}: {e}")
-    
-    # Sort by timestamp
-    npy_files_with_timestamps.sort(key=lambda x: datetime.strptime(x[1], '%Y-%m-%d %H:%M:%S.%f'))
+                yield task, None, e
+        return
+
+    queue_depth = queue_depth or 2 * workers
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        pending = deque()
+        for task in tasks:
+            pending.append((task, executor.submit(func, *task)))
+            while len(pending) >= queue_depth:
+                yield _pop_result(pending)
+        while pending:
+            yield _pop_result(pending)
+
+def _pop_result(pending):
+    task, future = pending.popleft()
+    try:
+        return task, future.result(), None
+    except Exception as e:
+        return task, None, e
+
+def npy_to_video(input_folder, output_file, output_frames_folder, fps=10, width=640, height=480,
+                 log_func=print, workers=1, queue_depth=None, progress_func=None, cancel_event=None,
+                 frame_format='png', frame_every=1, frame_quality=None, io_threads=2, calibration=None,
+                 frame_names='stem'):
+    """Render a FLIR folder, or a consolidated FLIR stack folder, to a video and frame images.
 
-    # Set up video writer and output folder
-    os.makedirs(output_frames_folder, exist_ok=True)
+    Every frame_every-th frame is also saved to output_frames_folder in frame_format
+    ('png', 'jpg' or 'npy', see FrameExporter) on io_threads background threads, named
+    as set by frame_names (see FRAME_NAMES); frame_format=None saves no frames. progress_func(done, total) is called after each
+    frame. Setting cancel_event (a threading.Event) stops rendering after the frames
+    already in flight. Returns True once the video is written, and False if a frame
+    could not be rendered or the run was cancelled. calibration names a profile from
+    flir_calibration (e.g. 'lower_range') used for the colors and the scale labels; by
+    default raw counts are shown.
+    """
+    if frame_names not in FRAME_NAMES:
+        raise ValueError(f"Unknown frame naming {frame_names!r}, expected one of {list(FRAME_NAMES)}")
+    if is_flir_stack(input_folder):
+        _, timestamps, metadata = load_flir_stack(input_folder)
+        global_min, global_max = metadata['global_min'], metadata['global_max']
+        frame_list = list(zip(range(metadata['count']), metadata['filenames'], format_stack_timestamps(timestamps)))
+    else:
+        with span('flir.manifest'):
+            entries = build_frame_manifest(input_folder, log_func)
+        global_min, global_max = manifest_min_max(entries)
+        # Frames are already sorted by timestamp; only those with a timestamp are rendered
+        frame_list = [(entry['filename'], entry['filename'], entry['timestamp']) for entry in entries if entry['timestamp']]
+
+    if not frame_list:
+        log_func("No valid FLIR npy files found.")
+        return False
+
+    # Set up video writer and frame exporter
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
     out = cv2.VideoWriter(output_file, fourcc, fps, (width, height))
+    renderer = FrameRenderer(global_min, global_max, width, height, calibration)
+    exporter = None
+    if frame_format is not None:
+        exporter = FrameExporter(output_frames_folder, frame_format, frame_every, frame_quality,
+                                 io_threads, log_func=log_func)
 
-    # Process frames
-    for i, (npy_file, timestamp) in enumerate(npy_files_with_timestamps):
-        npy_file_path = os.path.join(input_folder, npy_file)
-        try:
-            data = np.load(npy_file_path, allow_pickle=True)
-            image = data.item()['frame']
-            
-            image_8bit = convert_to_8bit(image, global_min, global_max)
-            colored_image = apply_inverted_colormap(image_8bit)
-            resized_image = cv2.resize(colored_image, (width, height))
-            
-            image_with_scale_bar = add_vertical_color_scale_bar(resized_image, width, height, global_min, global_max)
-            final_image = add_timestamp(image_with_scale_bar, timestamp, width, height)
-            
-            out.write(final_image)
-            frame_filename = os.path.join(output_frames_folder, f"{os.path.splitext(npy_file)[0]}.png")
-            cv2.imwrite(frame_filename, final_image)
-            print(f"[{i+1}/{len(npy_files_with_timestamps)}] Saved frame: {frame_filename}")
-            
-        except Exception as e:
-            print(f"Error processing {npy_file}: {e}")
+    # The npy format saves the 8-bit frame before coloring, at the source resolution
+    keep_8bit = exporter is not None and frame_format == 'npy'
+    tasks = ((frame_key, timestamp, keep_8bit and exporter.wants(i))
+             for i, (frame_key, _, timestamp) in enumerate(frame_list))
+
+    # Frames are rendered on the worker pool and written to the video in timestamp order.
+    # A serial run renders in this thread with its own renderer and source: the GUI runs
+    # several folders on threads at once, so module state would be shared between them.
+    if workers <= 1:
+        results = imap_ordered(partial(_render_frame, renderer, _open_frame_source(input_folder)), tasks)
+    else:
+        results = imap_ordered(_render_frame_file, tasks, workers, queue_depth,
+                               initializer=_init_render_worker, initargs=(renderer, input_folder))
+    cancelled = False
+    written = failed = 0
+    for i, (_, result, error) in enumerate(timed_iter('flir.render_wait', results)):
+        if error is not None:
+            log_func(f"Error processing {frame_list[i][1]}: {error}")
+            failed += 1
+        else:
+            final_image, image_8bit = result
+            with span('flir.encode'):
+                out.write(final_image)
+            written += 1
+            if exporter is not None and exporter.wants(i):
+                name = frame_list[i][1] if frame_names == 'filename' else os.path.splitext(frame_list[i][1])[0]
+                frame_filename = exporter.submit(name, final_image if image_8bit is None else image_8bit)
+                log_func(f"[{i+1}/{len(frame_list)}] Saved frame: {frame_filename}")
+            else:
+                log_func(f"[{i+1}/{len(frame_list)}] Rendered frame")
+        if progress_func is not None:
+            progress_func(i + 1, len(frame_list))
+        if cancel_event is not None and cancel_event.is_set():
+            cancelled = True
+            break
+    results.close()
 
     out.release()
-    print(f"Video saved to {output_file}")
+    if exporter is not None:
+        with span('flir.frame_write_wait'):
+            exporter.close()
+    if cancelled:
+        log_func(f"FLIR rendering cancelled; partial video left at {output_file}")
+        return False
+    if written == 0:
+        log_func(f"No FLIR frame could be rendered; {output_file} is empty")
+        return False
+    if failed:
+        log_func(f"{failed} FLIR frames could not be rendered; {output_file} is incomplete")
+        return False
+    log_func(f"Video saved to {output_file}")
+    return True
+
+def flir_to_video(input_folder, output_file, output_frames_folder, fps=10, width=640, height=480,
+                  log_func=print, workers=1, queue_depth=None, use_stack=True, progress_func=None, cancel_event=None,
+                  frame_format='png', frame_every=1, frame_quality=None, io_threads=2, calibration=None,
+                  frame_names='stem'):
+    """Render a FLIR folder, reading it through its consolidated stack.
+
+    The stack next to the FLIR folder is (re)built when it is missing or stale, so later
+    runs read frames straight from the memory-mapped stack without unpickling. The stack
+    is a full copy of the frames; with use_stack=False the frame files are rendered
+    directly and no stack is written. Returns the result of npy_to_video.
+    """
+    source = input_folder
+    if use_stack and not is_flir_stack(input_folder):
+        stack_folder = default_stack_folder(input_folder)
+        if not is_stack_fresh(stack_folder, input_folder):
+            with span('flir.stack', memory=True):
+                stack_folder = convert_to_flir_stack(input_folder, stack_folder, log_func)
+        source = stack_folder or input_folder
+    return npy_to_video(source, output_file, output_frames_folder, fps, width, height,
+                        log_func=log_func, workers=workers, queue_depth=queue_depth,
+                        progress_func=progress_func, cancel_event=cancel_event,
+                        frame_format=frame_format, frame_every=frame_every, frame_quality=frame_quality,
+                        io_threads=io_threads, calibration=calibration, frame_names=frame_names)
 
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) != 4:
-        print("Usage: python create_flirvideo.py <input_folder> <output_video> <output_frames>")
-        sys.exit(1)
-    
-    input_folder = sys.argv[1]
-    output_video = sys.argv[2]
-    output_frames = sys.argv[3]
-    
-    npy_to_video(input_folder, output_video, output_frames)
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Render FLIR frames to a color mapped video and frame images.")
+    parser.add_argument('input_folder', help="FLIR folder or FLIR_stack folder")
+    parser.add_argument('output_video')
+    parser.add_argument('output_frames', help="folder for the exported frame images")
+    parser.add_argument('workers', nargs='?', type=int, default=1, help="render processes (default 1)")
+    parser.add_argument('--frames', choices=list(FRAME_FORMATS) + ['none'], default='png',
+                        help="frame image format, or none to only write the video")
+    parser.add_argument('--every', type=int, default=1, help="save every Nth frame")
+    parser.add_argument('--quality', type=int, help="PNG compression level (0-9) or JPEG quality (0-100)")
+    parser.add_argument('--io-threads', type=int, default=2, help="threads writing frame images")
+    parser.add_argument('--calibration', choices=list(CALIBRATION_PROFILES),
+                        help="temperature calibration for the colors and scale labels (default: raw counts)")
+    parser.add_argument('--no-stack', action='store_true',
+                        help="render the frame files directly instead of writing a FLIR_stack copy of them")
+    args = parser.parse_args()
+
+    flir_to_video(args.input_folder, args.output_video, args.output_frames, workers=args.workers,
+                  frame_format=None if args.frames == 'none' else args.frames, frame_every=args.every,
+                  frame_quality=args.quality, io_threads=args.io_threads, calibration=args.calibration,
+                  use_stack=not args.no_stack)
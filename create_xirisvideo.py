@@ -0,0 +1,235 @@
+import numpy as np
+import cv2
+import os
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from create_flirvideo import imap_ordered
+from instrumentation import span, timed_iter
+
+# Frame files read from a Xiris folder. .npy files may hold a plain array or a
+# {'frame', 'timestamp'} dict like the FLIR frames.
+XIRIS_EXTENSIONS = ('.png', '.tif', '.tiff', '.bmp', '.npy')
+
+def _natural_key(name):
+    # frame_2 sorts before frame_10
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+def list_xiris_frames(input_folder):
+    """Return the frame file paths of a Xiris folder in frame order"""
+    with os.scandir(input_folder) as it:
+        names = [e.name for e in it if e.is_file() and e.name.lower().endswith(XIRIS_EXTENSIONS)]
+    return [os.path.join(input_folder, name) for name in sorted(names, key=_natural_key)]
+
+def read_xiris_frame(path):
+    """Read one frame at its native bit depth"""
+    with span('xiris.read'):
+        return _read_frame_file(path)
+
+def _read_frame_file(path):
+    if path.lower().endswith('.npy'):
+        data = np.load(path, allow_pickle=True)
+        if data.dtype == object:
+            data = data.item()['frame']
+        return data
+    frame = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if frame is None:
+        raise OSError(f"cv2.imread could not read {path}")
+    return frame
+
+def read_ahead(paths, depth=8, threads=2):
+    """Yield (path, frame, error) in order while up to `depth` later frames are read on threads"""
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = deque()
+        for path in paths:
+            pending.append((path, executor.submit(read_xiris_frame, path)))
+            while len(pending) >= depth:
+                yield _pop_frame(pending)
+        while pending:
+            yield _pop_frame(pending)
+
+def _pop_frame(pending):
+    path, future = pending.popleft()
+    try:
+        return path, future.result(), None
+    except Exception as e:
+        return path, None, e
+
+def estimate_levels(frames, low_percentile=0.5, high_percentile=99.9, max_pixels=1 << 20):
+    """Estimate (black, white) tone mapping levels from a sample of frames.
+
+    Pixels are subsampled with a stride so the estimate costs about the same for any
+    frame size.
+    """
+    pixels = np.concatenate([np.asarray(frame).ravel() for frame in frames])
+    stride = max(1, pixels.size // max_pixels)
+    black, white = np.percentile(pixels[::stride], [low_percentile, high_percentile])
+    if white <= black:
+        white = black + 1
+    return float(black), float(white)
+
+def tone_curve(values, black, white, curve='log', strength=100.0):
+    """Map raw values to 0-255 between the black and white levels.
+
+    'log' compresses the bright arc so the darker weld pool and seam stay visible,
+    'gamma' applies a 0.5 gamma and 'linear' is a plain stretch.
+    """
+    x = np.clip((np.asarray(values, dtype=np.float64) - black) / (white - black), 0, 1)
+    if curve == 'log':
+        x = np.log1p(strength * x) / np.log1p(strength)
+    elif curve == 'gamma':
+        x = np.sqrt(x)
+    elif curve != 'linear':
+        raise ValueError(f"Unknown tone curve {curve!r}")
+    return np.round(x * 255).astype(np.uint8)
+
+class ToneMapper:
+    """Per-video tone mapping state: one lookup table covering every possible raw value.
+
+    8- and 16-bit frames are tone mapped with a single np.take; other dtypes fall back
+    to evaluating the curve per pixel.
+    """
+
+    def __init__(self, black, white, width=640, height=480, curve='log'):
+        self.black = black
+        self.white = white
+        self.width = width
+        self.height = height
+        self.curve = curve
+        self.lut = tone_curve(np.arange(65536), black, white, curve)
+
+    def tone_map(self, frame):
+        if frame.dtype == np.uint16 or frame.dtype == np.uint8:
+            return np.take(self.lut, frame)
+        return tone_curve(frame, self.black, self.white, self.curve)
+
+    def render(self, frame):
+        with span('xiris.tone_map'):
+            image = self.tone_map(frame)
+        with span('xiris.resize'):
+            if image.shape[1] != self.width or image.shape[0] != self.height:
+                interpolation = cv2.INTER_AREA if image.shape[1] > self.width else cv2.INTER_LINEAR
+                image = cv2.resize(image, (self.width, self.height), interpolation=interpolation)
+            if image.ndim == 2:
+                image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        return image
+
+_worker_mapper = None
+
+def _init_xiris_worker(mapper):
+    global _worker_mapper
+    _worker_mapper = mapper
+
+def _render_xiris_file(path):
+    return _worker_mapper.render(read_xiris_frame(path))
+
+def render_xiris_frames(paths, mapper, workers=1, queue_depth=None, read_threads=2):
+    """Yield (path, rendered frame, error) in frame order.
+
+    With one worker, frames are read ahead on threads (cv2 and file reads release the
+    GIL) and tone mapped in this process. With more, each pool worker reads and renders
+    its own frames, and at most queue_depth frames are in flight.
+    """
+    if workers <= 1:
+        for path, frame, error in read_ahead(paths, queue_depth or 8, read_threads):
+            if error is not None:
+                yield path, None, error
+                continue
+            try:
+                yield path, mapper.render(frame), None
+            except Exception as e:
+                yield path, None, e
+        return
+    for (path,), image, error in imap_ordered(_render_xiris_file, ((path,) for path in paths), workers,
+                                              queue_depth, initializer=_init_xiris_worker, initargs=(mapper,)):
+        yield path, image, error
+
+def xiris_to_video(input_folder, output_file, fps=30, width=640, height=480, log_func=print, workers=1,
+                   queue_depth=None, curve='log', levels=None, level_sample=16):
+    """Tone map a folder of Xiris frames and write them to a video.
+
+    Frames are streamed from disk once. The black and white levels are estimated from
+    `level_sample` frames spread over the recording unless `levels` is given; unreadable
+    sample frames are skipped. Returns False if no frame could be read or rendered.
+    """
+    paths = list_xiris_frames(input_folder)
+    if not paths:
+        log_func("No Xiris frames found.")
+        return False
+
+    if levels is None:
+        sample_paths = paths[::max(1, len(paths) // level_sample)][:level_sample]
+        sample = []
+        for path in sample_paths:
+            try:
+                sample.append(read_xiris_frame(path))
+            except Exception as e:
+                log_func(f"Skipping unreadable sample frame {os.path.basename(path)}: {e}")
+        if not sample:
+            log_func("No Xiris sample frame could be read to estimate the tone levels.")
+            return False
+        levels = estimate_levels(sample)
+    black, white = levels
+    log_func(f"Xiris: {len(paths)} frames, tone levels {black:.1f} to {white:.1f} ({curve})")
+
+    mapper = ToneMapper(black, white, width, height, curve)
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    out = cv2.VideoWriter(output_file, fourcc, fps, (width, height))
+    written = 0
+    for path, image, error in timed_iter('xiris.render_wait', render_xiris_frames(paths, mapper, workers, queue_depth)):
+        if error is not None:
+            log_func(f"Error processing {os.path.basename(path)}: {error}")
+            continue
+        with span('xiris.encode'):
+            out.write(image)
+        written += 1
+        if written % 100 == 0:
+            log_func(f"[{written}/{len(paths)}] Xiris frames written")
+    out.release()
+    if written == 0:
+        log_func(f"No Xiris frame could be rendered; {output_file} is empty")
+        return False
+    log_func(f"Video saved to {output_file} ({written} frames)")
+    return True
+
+def generate_synthetic_xiris(output_folder, count=200, width=640, height=512, bit_depth=12, seed=0):
+    """Write synthetic weld camera frames as 16-bit PNGs for offline testing.
+
+    Each frame has a noisy dark background, a seam line and a very bright arc with a
+    melt pool that moves across the image, so the dynamic range resembles a real weld.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_folder, exist_ok=True)
+    full_scale = (1 << bit_depth) - 1
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    seam = np.exp(-((yy - height / 2) / 3) ** 2) * 0.05 * full_scale
+    for i in range(count):
+        cx = width * (0.1 + 0.8 * i / max(1, count - 1))
+        cy = height / 2 + 4 * np.sin(i / 5)
+        r2 = (xx - cx) ** 2 + (yy - cy) ** 2
+        arc = np.exp(-r2 / (2 * 12 ** 2)) * full_scale * rng.uniform(0.8, 1.0)
+        pool = np.exp(-(((xx - cx + 30) / 40) ** 2 + ((yy - cy) / 15) ** 2)) * 0.2 * full_scale
+        noise = rng.normal(0.02 * full_scale, 0.005 * full_scale, (height, width))
+        frame = np.clip(seam + arc + pool + noise, 0, full_scale).astype(np.uint16)
+        cv2.imwrite(os.path.join(output_folder, f"xiris_{i:06d}.png"), frame)
+    return output_folder
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Tone map Xiris weld camera frames to a video.")
+    parser.add_argument('input_folder', help="folder of Xiris frames (or the folder to create with --synthetic)")
+    parser.add_argument('output_video', nargs='?')
+    parser.add_argument('workers', nargs='?', type=int, default=1, help="render processes (default 1)")
+    parser.add_argument('--fps', type=float, default=30)
+    parser.add_argument('--curve', choices=['log', 'gamma', 'linear'], default='log')
+    parser.add_argument('--levels', type=float, nargs=2, metavar=('BLACK', 'WHITE'), help="fixed tone levels")
+    parser.add_argument('--synthetic', type=int, metavar='COUNT', help="write COUNT synthetic frames to input_folder first")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        generate_synthetic_xiris(args.input_folder, args.synthetic)
+        print(f"Wrote {args.synthetic} synthetic frames to {args.input_folder}")
+    if args.output_video:
+        xiris_to_video(args.input_folder, args.output_video, args.fps, workers=args.workers,
+                       curve=args.curve, levels=args.levels)
@@ -0,0 +1,153 @@
+import os
+import sys
+import argparse
+import numpy as np
+
+# Number of distinct raw counts a 16-bit sensor can report
+SENSOR_COUNTS = 65536
+DEFAULT_CHUNK_FRAMES = 256
+
+class CalibrationProfile:
+    """A count-to-temperature conversion given as polynomial coefficients (highest power first).
+
+    The polynomial is evaluated once over every possible integer count; converting a
+    frame is then a table lookup. Non-integer frames fall back to evaluating the
+    polynomial directly.
+    """
+
+    def __init__(self, name, coefficients, unit='C', description=''):
+        self.name = name
+        self.coefficients = tuple(coefficients)
+        self.unit = unit
+        self.description = description
+        self._lut = None
+        self._increasing = None
+
+    @property
+    def lut(self):
+        """float32 temperature for every raw count, built on first use"""
+        if self._lut is None:
+            self._lut = np.polyval(self.coefficients, np.arange(SENSOR_COUNTS, dtype=np.float64)).astype(np.float32)
+        return self._lut
+
+    @property
+    def is_increasing(self):
+        """True if hotter counts never give lower temperatures, so counts can be compared directly"""
+        if self._increasing is None:
+            self._increasing = bool(np.all(np.diff(self.lut) >= 0))
+        return self._increasing
+
+    def count_above(self, temperature):
+        """Smallest raw count whose temperature is above `temperature` (increasing profiles only)"""
+        return int(np.searchsorted(self.lut, temperature, side='right'))
+
+    def row_means(self, counts):
+        """Mean temperature of each row of a 2-D count array, without converting every count.
+
+        The mean of a polynomial is a combination of the power sums of the counts, which
+        are exact for 16-bit counts of a linear or quadratic profile.
+        """
+        counts = np.asarray(counts)
+        degree = len(self.coefficients) - 1
+        if counts.dtype.kind in 'ui' and degree <= 2:
+            # Integer sums are exact and skip a float64 copy of the counts
+            sums = [np.full(len(counts), counts.shape[1]), counts.sum(axis=1, dtype=np.int64),
+                    np.einsum('ij,ij->i', counts, counts, dtype=np.int64)]
+        else:
+            values = counts.astype(np.float64)
+            sums = [np.full(len(values), values.shape[1]), values.sum(axis=1)]
+            power = values
+            for k in range(2, degree + 1):
+                sums.append(np.einsum('ij,ij->i', power, values))
+                if k < degree:
+                    power = power * values
+        return sum(a * total.astype(np.float64) for a, total in zip(self.coefficients[::-1], sums)) / counts.shape[1]
+
+    def convert(self, counts, out=None):
+        """Convert raw counts (scalar, frame or stack) to float32 temperatures"""
+        counts = np.asarray(counts)
+        if counts.dtype == np.uint16 or counts.dtype == np.uint8:
+            return np.take(self.lut, counts, out=out)
+        result = np.polyval(self.coefficients, counts.astype(np.float64)).astype(np.float32)
+        if out is not None:
+            out[...] = result
+            return out
+        return result
+
+    def convert_stack(self, frames, out=None, chunk_frames=DEFAULT_CHUNK_FRAMES):
+        """Convert an N x H x W stack, e.g. a memory-mapped FLIR stack, a chunk of frames at a time.
+
+        out may be a preallocated float32 array or memory map; by default one is
+        allocated. Only chunk_frames frames of the input are in memory at once.
+        """
+        if out is None:
+            out = np.empty(frames.shape, dtype=np.float32)
+        for start in range(0, len(frames), chunk_frames):
+            stop = min(start + chunk_frames, len(frames))
+            self.convert(np.asarray(frames[start:stop]), out=out[start:stop])
+        return out
+
+    def label(self, counts):
+        """Scale bar label of a raw count, e.g. '412.50C'"""
+        return f'{float(self.convert(counts)):.2f}{self.unit}'
+
+# Named profiles. 'raw' keeps the sensor counts; the range profiles are the FLIR
+# camera's lower and upper temperature range calibrations.
+CALIBRATION_PROFILES = {
+    'raw': CalibrationProfile('raw', (1.0, 0.0), 'C', "Raw sensor counts"),
+    'lower_range': CalibrationProfile('lower_range', (-0.000000045, 0.0095, -85), 'C', "Lower temperature range"),
+    'upper_range': CalibrationProfile('upper_range', (0.0468, -267.72), 'C', "Upper temperature range"),
+}
+
+def get_profile(profile):
+    """Return a CalibrationProfile from a profile or a profile name; None stays None"""
+    if profile is None or isinstance(profile, CalibrationProfile):
+        return profile
+    try:
+        return CALIBRATION_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown calibration profile {profile!r}, expected one of {list(CALIBRATION_PROFILES)}")
+
+def temperature_stack_path(stack_folder, profile):
+    return os.path.join(stack_folder, f"temperatures_{get_profile(profile).name}.npy")
+
+def calibrate_stack(stack_folder, profile, output_path=None, chunk_frames=DEFAULT_CHUNK_FRAMES):
+    """Write the temperatures of a FLIR stack (see create_flirvideo) to a float32 .npy file.
+
+    The stack is read through its memory map and converted a chunk at a time into a
+    memory-mapped output, so memory stays bounded for any number of frames. Returns the
+    output path.
+    """
+    from create_flirvideo import load_flir_stack
+
+    profile = get_profile(profile)
+    frames, _, _ = load_flir_stack(stack_folder)
+    output_path = output_path or temperature_stack_path(stack_folder, profile)
+    out = np.lib.format.open_memmap(output_path + '.tmp', mode='w+', dtype=np.float32, shape=frames.shape)
+    profile.convert_stack(frames, out, chunk_frames)
+    out.flush()
+    del out
+    os.replace(output_path + '.tmp', output_path)
+    return output_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a FLIR stack's raw counts to temperatures.")
+    parser.add_argument('folder', help="FLIR folder (its stack is built if needed) or FLIR_stack folder")
+    parser.add_argument('--profile', choices=list(CALIBRATION_PROFILES), default='lower_range')
+    parser.add_argument('--output', help="output .npy file (default temperatures_<profile>.npy in the stack folder)")
+    args = parser.parse_args()
+
+    from create_flirvideo import convert_to_flir_stack, default_stack_folder, is_flir_stack, is_stack_fresh
+
+    stack_folder = args.folder
+    if not is_flir_stack(stack_folder):
+        stack_folder = default_stack_folder(args.folder)
+        if not is_stack_fresh(stack_folder, args.folder):
+            stack_folder = convert_to_flir_stack(args.folder, stack_folder)
+        if stack_folder is None:
+            sys.exit(1)
+    output_path = calibrate_stack(stack_folder, args.profile, args.output)
+    print(f"Temperatures ({args.profile}) written to {output_path}")
+
+if __name__ == "__main__":
+    main()
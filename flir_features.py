@@ -0,0 +1,175 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+from create_flirvideo import (convert_to_flir_stack, default_stack_folder, format_stack_timestamps, imap_ordered,
+                              is_flir_stack, is_stack_fresh, load_flir_stack)
+from flir_calibration import CALIBRATION_PROFILES, get_profile
+from instrumentation import span, timed_iter
+
+FEATURES_FILENAME = 'FLIR_features.csv'
+DEFAULT_BATCH_FRAMES = 64
+# Region of interest name -> (x, y, width, height) in frame pixels; None is the whole frame
+DEFAULT_ROIS = {'frame': None}
+
+def parse_roi(value):
+    """Parse 'name=x,y,width,height' into (name, (x, y, width, height))"""
+    try:
+        name, box = value.split('=')
+        x, y, width, height = (int(part) for part in box.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ROI must look like name=x,y,width,height, got {value!r}")
+    if width < 1 or height < 1 or x < 0 or y < 0:
+        raise argparse.ArgumentTypeError(f"ROI {name!r} must have a non-negative origin and a positive size")
+    return name, (x, y, width, height)
+
+def clip_rois(rois, frame_shape):
+    """Return {name: (x, y, width, height)} with every ROI cut to the frame"""
+    frame_height, frame_width = frame_shape[:2]
+    clipped = {}
+    for name, box in rois.items():
+        x, y, width, height = box or (0, 0, frame_width, frame_height)
+        width, height = min(width, frame_width - x), min(height, frame_height - y)
+        if width < 1 or height < 1:
+            raise ValueError(f"ROI {name!r} {box} lies outside the {frame_width}x{frame_height} frame")
+        clipped[name] = (x, y, width, height)
+    return clipped
+
+def frame_features(frames, rois, calibration=None, threshold=None):
+    """Compute per-frame metrics for an N x H x W batch of raw frames.
+
+    For each ROI the columns are <roi>_max and <roi>_mean (in calibrated units, or raw
+    counts without a calibration) and <roi>_peak_x/_peak_y, the position of the hottest
+    pixel. With a threshold, <roi>_area is the number of pixels above it and
+    <roi>_hot_x/_hot_y the centroid of those pixels (NaN when there are none).
+    Positions are frame pixel coordinates. For integer frames and an increasing
+    calibration, the maximum, peak and threshold are found on the raw counts and the
+    mean from their power sums, so no pixel is converted to a temperature.
+    """
+    calibration = get_profile(calibration)
+    columns = {}
+    for name, (x, y, width, height) in rois.items():
+        region = frames[:, y:y + height, x:x + width]
+        flat = region.reshape(len(region), -1)
+        peak = flat.argmax(axis=1)
+        on_counts = region.dtype.kind == 'u' and (calibration is None or calibration.is_increasing)
+        if on_counts:
+            peak_counts = flat[np.arange(len(flat)), peak]
+            if calibration is None:
+                columns[f'{name}_max'] = peak_counts.astype(np.float32)
+                columns[f'{name}_mean'] = flat.mean(axis=1, dtype=np.float64)
+            else:
+                columns[f'{name}_max'] = calibration.convert(peak_counts)
+                columns[f'{name}_mean'] = calibration.row_means(flat)
+        else:
+            values = region.astype(np.float32) if calibration is None else calibration.convert(region)
+            flat = values.reshape(len(values), -1)
+            peak = flat.argmax(axis=1)
+            columns[f'{name}_max'] = flat[np.arange(len(flat)), peak]
+            columns[f'{name}_mean'] = flat.mean(axis=1, dtype=np.float64)
+        columns[f'{name}_peak_x'] = peak % width + x
+        columns[f'{name}_peak_y'] = peak // width + y
+        if threshold is not None:
+            if not on_counts:
+                hot = values > threshold
+            elif calibration is None:
+                hot = region > threshold
+            else:
+                hot = region >= calibration.count_above(threshold)
+            # Row and column sums of the mask give the centroid without an index grid
+            hot_cols = hot.sum(axis=1, dtype=np.int32)
+            hot_rows = hot.sum(axis=2, dtype=np.int32)
+            area = hot_cols.sum(axis=1, dtype=np.int64)
+            columns[f'{name}_area'] = area
+            with np.errstate(invalid='ignore', divide='ignore'):
+                columns[f'{name}_hot_x'] = hot_cols @ np.arange(x, x + width) / area
+                columns[f'{name}_hot_y'] = hot_rows @ np.arange(y, y + height) / area
+    return columns
+
+_worker_frames = None
+_worker_options = None
+
+def _init_features_worker(stack_folder, rois, calibration, threshold):
+    global _worker_frames, _worker_options
+    _worker_frames, _, _ = load_flir_stack(stack_folder)
+    _worker_options = (rois, calibration, threshold)
+
+def _features_batch(start, stop):
+    with span('features.load'):
+        frames = np.asarray(_worker_frames[start:stop])
+    with span('features.compute'):
+        return frame_features(frames, *_worker_options)
+
+def resolve_stack(input_folder, log_func=print):
+    """Return the FLIR stack folder for a session, FLIR or stack folder, building it if needed"""
+    if is_flir_stack(input_folder):
+        return input_folder
+    if os.path.isdir(os.path.join(input_folder, 'FLIR')):
+        input_folder = os.path.join(input_folder, 'FLIR')
+    stack_folder = default_stack_folder(input_folder)
+    if not is_stack_fresh(stack_folder, input_folder):
+        with span('flir.stack', memory=True):
+            stack_folder = convert_to_flir_stack(input_folder, stack_folder, log_func)
+    return stack_folder
+
+def extract_flir_features(input_folder, output_file=None, rois=None, calibration=None, threshold=None,
+                          workers=1, batch_frames=DEFAULT_BATCH_FRAMES, log_func=print):
+    """Write per-frame thermal metrics of a FLIR session to a CSV keyed by frame timestamp.
+
+    The frames are read once from the memory-mapped FLIR stack in batches of
+    batch_frames, on `workers` processes. rois maps names to (x, y, width, height)
+    boxes (default: the whole frame); see frame_features for the columns. The CSV goes
+    to FLIR_features.csv next to the stack unless output_file is given. Returns its path.
+    """
+    stack_folder = resolve_stack(input_folder, log_func)
+    if stack_folder is None:
+        return None
+    frames, timestamps, metadata = load_flir_stack(stack_folder)
+    rois = clip_rois(rois or DEFAULT_ROIS, metadata['shape'])
+    output_file = output_file or os.path.join(os.path.dirname(os.path.abspath(stack_folder)), FEATURES_FILENAME)
+
+    count = metadata['count']
+    tasks = ((start, min(start + batch_frames, count)) for start in range(0, count, batch_frames))
+    results = imap_ordered(_features_batch, tasks, workers, initializer=_init_features_worker,
+                           initargs=(stack_folder, rois, calibration, threshold))
+    keep = np.zeros(count, dtype=bool)
+    batches = []
+    for (start, stop), columns, error in timed_iter('features.wait', results):
+        if error is not None:
+            log_func(f"Error computing features for frames {start}-{stop - 1}: {error}")
+            continue
+        keep[start:stop] = True
+        batches.append(columns)
+    results.close()
+    if not batches:
+        log_func("No FLIR features computed.")
+        return None
+
+    with span('features.write'):
+        table = pd.DataFrame({name: np.concatenate([batch[name] for batch in batches]) for name in batches[0]})
+        table.insert(0, 'timestamp', np.array(format_stack_timestamps(timestamps))[keep])
+        table.to_csv(output_file + '.tmp', index=False, float_format='%.3f')
+        os.replace(output_file + '.tmp', output_file)
+    log_func(f"FLIR features for {len(table)} frames saved to {output_file}")
+    return output_file
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute per-frame thermal metrics of FLIR sessions.")
+    parser.add_argument('folders', nargs='+', help="session, FLIR or FLIR_stack folders")
+    parser.add_argument('--roi', type=parse_roi, action='append', metavar='NAME=X,Y,W,H',
+                        help="region of interest, may be repeated (default: the whole frame)")
+    parser.add_argument('--calibration', choices=list(CALIBRATION_PROFILES),
+                        help="temperature calibration (default: raw counts)")
+    parser.add_argument('--threshold', type=float, help="hot spot threshold, in calibrated units")
+    parser.add_argument('--workers', type=int, default=1, help="processes computing the metrics")
+    parser.add_argument('--batch', type=int, default=DEFAULT_BATCH_FRAMES, help="frames per batch")
+    args = parser.parse_args()
+
+    rois = dict(args.roi) if args.roi else None
+    for folder in args.folders:
+        extract_flir_features(folder, rois=rois, calibration=args.calibration, threshold=args.threshold,
+                              workers=args.workers, batch_frames=args.batch)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+import multiprocessing.util
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+REPORT_FILENAME = 'performance_report.json'
+# Set while a report is being collected; worker processes write their spans here
+SPOOL_ENV = 'DCP_PERF_SPOOL'
+
+# Span name -> [count, total seconds, max seconds, peak RSS in MB or None]
+_stats = {}
+_lock = threading.Lock()
+_enabled = False
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ('name', 'memory', 'start')
+
+    def __init__(self, name, memory):
+        self.name = name
+        self.memory = memory
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter() - self.start, peak_rss_mb() if self.memory else None)
+        return False
+
+def span(name, memory=False):
+    """Time a block: `with span('flir.resize'): ...`.
+
+    With memory=True the process's peak RSS at the end of the block is recorded too;
+    use it on coarse spans only. When instrumentation is off this returns a shared
+    no-op context, so a disabled span costs one function call.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, memory)
+
+def timed_iter(name, iterable):
+    """Iterate, timing each step of the iterator (e.g. reading each CSV chunk) as a span"""
+    if not _enabled:
+        return iterable
+    return _timed_iter(name, iterable)
+
+def _timed_iter(name, iterable):
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        record(name, time.perf_counter() - start)
+        yield item
+
+def record(name, seconds, rss_mb=None):
+    with _lock:
+        entry = _stats.get(name)
+        if entry is None:
+            entry = _stats[name] = [0, 0.0, 0.0, None]
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] = max(entry[2], seconds)
+        if rss_mb is not None:
+            entry[3] = max(entry[3] or 0.0, rss_mb)
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, or None where it is not available"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def snapshot():
+    """Return this process's spans and peak RSS as a JSON-serializable dict"""
+    with _lock:
+        spans = {name: list(entry) for name, entry in _stats.items()}
+    return {'pid': os.getpid(), 'peak_rss_mb': peak_rss_mb(), 'spans': spans}
+
+def _flush_to_spool():
+    spool = os.environ.get(SPOOL_ENV)
+    if not spool or not _stats or not os.path.isdir(spool):
+        return
+    path = os.path.join(spool, f"{os.getpid()}-{uuid.uuid4().hex}.json")
+    with open(path + '.tmp', 'w') as f:
+        json.dump(snapshot(), f)
+    os.replace(path + '.tmp', path)
+
+def _init_worker_process(_):
+    # Runs in every new multiprocessing child: pool workers started while a report is
+    # being collected record their own spans and write them to the spool when they exit
+    global _enabled
+    with _lock:
+        _stats.clear()
+    _enabled = bool(os.environ.get(SPOOL_ENV))
+    if _enabled:
+        multiprocessing.util.Finalize(None, _flush_to_spool, exitpriority=10)
+
+class _AfterFork:
+    pass
+
+_after_fork_token = _AfterFork()
+multiprocessing.util.register_after_fork(_after_fork_token, _init_worker_process)
+
+if os.environ.get(SPOOL_ENV):
+    # Spawned children (the default on Windows and macOS) are not forked, so the hook
+    # above never runs in them. They import this module afresh, before their parent is
+    # even known, with the spool inherited in the environment; they start recording here.
+    _init_worker_process(None)
+
+def _merge(snapshots):
+    spans = {}
+    for snap in snapshots:
+        for name, (count, total, longest, rss) in snap['spans'].items():
+            merged = spans.setdefault(name, [0, 0.0, 0.0, None])
+            merged[0] += count
+            merged[1] += total
+            merged[2] = max(merged[2], longest)
+            if rss is not None:
+                merged[3] = max(merged[3] or 0.0, rss)
+    return {
+        name: {
+            'count': count,
+            'total_s': round(total, 4),
+            'mean_ms': round(1000 * total / count, 4) if count else None,
+            'max_ms': round(1000 * longest, 4),
+            'peak_rss_mb': rss,
+        }
+        for name, (count, total, longest, rss) in sorted(spans.items(), key=lambda item: -item[1][1])
+    }
+
+@contextmanager
+def session_report(folder, enabled=True, log_func=print):
+    """Collect spans from this process and its worker processes into a session report.
+
+    On exit the spans are merged and written to performance_report.json in the folder.
+    Span totals add up the time spent in every process, so parallel stages can add up
+    to more than the wall time. Collection is process-wide: run one session at a time
+    per process while a report is being collected.
+    """
+    global _enabled
+    if not enabled:
+        yield None
+        return
+
+    previous_enabled, previous_spool = _enabled, os.environ.get(SPOOL_ENV)
+    spool = tempfile.mkdtemp(prefix='perf_spool_', dir=folder)
+    with _lock:
+        _stats.clear()
+    os.environ[SPOOL_ENV] = spool
+    _enabled = True
+    started = datetime.now()
+    start = time.perf_counter()
+    try:
+        yield spool
+    finally:
+        wall_seconds = time.perf_counter() - start
+        snapshots = [snapshot()]
+        for name in os.listdir(spool):
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(spool, name), 'r') as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    pass
+        shutil.rmtree(spool, ignore_errors=True)
+        _enabled = previous_enabled
+        if previous_spool is None:
+            os.environ.pop(SPOOL_ENV, None)
+        else:
+            os.environ[SPOOL_ENV] = previous_spool
+        with _lock:
+            _stats.clear()
+
+        peaks = [snap['peak_rss_mb'] for snap in snapshots if snap['peak_rss_mb'] is not None]
+        report = {
+            'folder': os.path.abspath(folder),
+            'started': started.isoformat(timespec='seconds'),
+            'wall_seconds': round(wall_seconds, 3),
+            'processes': len(snapshots),
+            'peak_rss_mb': max(peaks) if peaks else None,
+            'spans': _merge(snapshots),
+        }
+        report_path = os.path.join(folder, REPORT_FILENAME)
+        with open(report_path + '.tmp', 'w') as f:
+            json.dump(report, f, indent=1)
+        os.replace(report_path + '.tmp', report_path)
+        log_func(f"Performance report written to {report_path}")
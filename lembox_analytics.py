@@ -0,0 +1,258 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+from instrumentation import span, timed_iter
+from lembox_scaling import DEFAULT_CHUNKSIZE, SCALED_COLUMNS, scale_lembox_csv
+from session_alignment import NAT_NS, find_time_column, parse_timestamps_ns
+
+SUMMARY_FILENAME = 'lembox_summary.csv'
+EVENTS_FILENAME = 'lembox_events.csv'
+
+# Summary window length in seconds
+ANALYTICS_WINDOW_S = 0.1
+# Short circuit: the wire touches the pool, so the voltage collapses while current flows
+SHORT_CIRCUIT_VOLTAGE = 10.0
+SHORT_CIRCUIT_MIN_CURRENT = 20.0
+# Arc out: the current drops away after the arc was established
+ARC_OUT_CURRENT = 5.0
+ARC_ON_CURRENT = 20.0
+
+SUMMARY_COLUMNS = ['window_start', 'samples', 'voltage_mean', 'voltage_rms', 'current_mean', 'current_rms',
+                   'power_mean', 'power_max', 'short_circuits', 'arc_outs']
+EVENT_COLUMNS = ['event', 'start', 'end', 'duration_ms', 'min_voltage', 'max_current']
+
+def _format_ns(times_ns):
+    return [t.replace('T', ' ') for t in np.datetime_as_string(np.asarray(times_ns).astype('datetime64[ns]'), unit='us')]
+
+class EventDetector:
+    """Finds runs of samples where a condition holds, across chunk boundaries.
+
+    An event still open at the end of a chunk is carried into the next one with its
+    start time and running extremes, so chunking does not change the events found.
+    """
+
+    def __init__(self, name, min_duration_s=0.0, keep_open=True):
+        self.name = name
+        self.min_duration_ns = int(min_duration_s * 1e9)
+        # Whether an event still open at the end of the file is reported
+        self.keep_open = keep_open
+        self.open = None
+        self.last_time = None
+
+    def update(self, times_ns, active, voltage, current):
+        """Return the events that ended in this chunk and the index of every event start in it"""
+        edges = np.diff(np.concatenate(([self.open is not None], active, [False])).astype(np.int8))
+        starts = np.flatnonzero(edges == 1)
+        # Every run ends, at the first inactive sample or at len(active) if it is still on
+        ends = np.flatnonzero(edges == -1)
+        run_starts = np.concatenate(([0], starts)) if self.open is not None else starts
+        if len(times_ns):
+            self.last_time = int(times_ns[-1])
+        if len(ends) == 0:
+            return [], starts
+        # Extremes over each run only: reduce over [start, end) pairs and keep every other result.
+        # A carried event that ends on the first sample has an empty run here; reduceat would
+        # return that sample rather than nothing, so empty runs keep only the carried extremes.
+        nonempty = ends > run_starts
+        min_voltage = np.full(len(ends), np.inf)
+        max_current = np.full(len(ends), -np.inf)
+        if nonempty.any():
+            bounds = np.column_stack((run_starts[nonempty], ends[nonempty])).ravel()
+            min_voltage[nonempty] = np.minimum.reduceat(np.append(voltage, np.inf), bounds)[::2]
+            max_current[nonempty] = np.maximum.reduceat(np.append(current, -np.inf), bounds)[::2]
+        events = []
+        for i, (run_start, run_end) in enumerate(zip(run_starts, ends)):
+            low, high = float(min_voltage[i]), float(max_current[i])
+            if i == 0 and self.open is not None:
+                start_ns = self.open[0]
+                low, high = min(low, self.open[1]), max(high, self.open[2])
+            else:
+                start_ns = int(times_ns[run_start])
+            if run_end == len(active):
+                self.open = (start_ns, low, high)
+                break
+            events.append(self._event(start_ns, int(times_ns[run_end]), low, high))
+        else:
+            self.open = None
+        return [event for event in events if event is not None], starts
+
+    def close(self):
+        if self.open is None or not self.keep_open or self.last_time is None:
+            return []
+        event = self._event(self.open[0], self.last_time, self.open[1], self.open[2])
+        self.open = None
+        return [event] if event is not None else []
+
+    def _event(self, start_ns, end_ns, min_voltage, max_current):
+        if end_ns - start_ns < self.min_duration_ns:
+            return None
+        return (self.name, start_ns, end_ns, (end_ns - start_ns) / 1e6, min_voltage, max_current)
+
+class LemboxAnalyzer:
+    """Windowed electrical statistics and weld events of a LEM box stream.
+
+    Chunks of scaled samples are added in time order. Samples are summed into windows
+    of window_s seconds with reduceat; the samples of the last, unfinished window are
+    carried into the next chunk, so memory is bounded by the chunk size. Finished
+    windows and events are returned by add() as they are found.
+    """
+
+    def __init__(self, window_s=ANALYTICS_WINDOW_S, short_circuit_voltage=SHORT_CIRCUIT_VOLTAGE,
+                 short_circuit_min_current=SHORT_CIRCUIT_MIN_CURRENT, arc_out_current=ARC_OUT_CURRENT,
+                 arc_on_current=ARC_ON_CURRENT, min_event_s=0.0):
+        self.window_ns = int(window_s * 1e9)
+        self.short_circuit_voltage = short_circuit_voltage
+        self.short_circuit_min_current = short_circuit_min_current
+        self.arc_out_current = arc_out_current
+        self.arc_on_current = arc_on_current
+        self.short_circuits = EventDetector('short_circuit', min_event_s)
+        # An arc out still open at the end of the file is the end of the weld
+        self.arc_outs = EventDetector('arc_out', min_event_s, keep_open=False)
+        self.arc_established = False
+        self.origin_ns = None
+        self.carry = None
+
+    def add(self, times_ns, voltage, current):
+        """Add a chunk of samples; return (finished summary rows, finished events)"""
+        if len(times_ns) == 0:
+            return [], []
+        if self.origin_ns is None:
+            self.origin_ns = int(times_ns[0])
+
+        arc_on = current >= self.arc_on_current
+        established = np.logical_or.accumulate(arc_on) | self.arc_established
+        self.arc_established = bool(established[-1])
+        sc_events, sc_starts = self.short_circuits.update(
+            times_ns, (voltage < self.short_circuit_voltage) & (current >= self.short_circuit_min_current), voltage, current)
+        ao_events, ao_starts = self.arc_outs.update(
+            times_ns, (current < self.arc_out_current) & established, voltage, current)
+
+        starts = np.zeros((2, len(times_ns)), dtype=np.int64)
+        starts[0, sc_starts] = 1
+        starts[1, ao_starts] = 1
+        window = (times_ns - self.origin_ns) // self.window_ns
+        columns = [window, voltage, current, starts[0], starts[1]]
+        if self.carry is not None:
+            columns = [np.concatenate((carried, new)) for carried, new in zip(self.carry, columns)]
+        window = columns[0]
+        # The last window may continue in the next chunk
+        last = np.searchsorted(window, window[-1]) if window[0] <= window[-1] else len(window) - 1
+        self.carry = [column[last:] for column in columns]
+        rows = self._summarize(*(column[:last] for column in columns))
+        return rows, sc_events + ao_events
+
+    def close(self):
+        """Return the last summary row and the events still open"""
+        rows = self._summarize(*self.carry) if self.carry is not None else []
+        self.carry = None
+        return rows, self.short_circuits.close() + self.arc_outs.close()
+
+    def _summarize(self, window, voltage, current, sc_starts, ao_starts):
+        if len(window) == 0:
+            return []
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(window)) + 1))
+        samples = np.diff(np.append(bounds, len(window)))
+        power = voltage * current
+        sums = np.add.reduceat(np.stack((voltage, voltage * voltage, current, current * current, power)), bounds, axis=1)
+        return list(zip(
+            _format_ns(self.origin_ns + window[bounds] * self.window_ns),
+            samples.tolist(),
+            (sums[0] / samples).tolist(),
+            np.sqrt(sums[1] / samples).tolist(),
+            (sums[2] / samples).tolist(),
+            np.sqrt(sums[3] / samples).tolist(),
+            (sums[4] / samples).tolist(),
+            np.maximum.reduceat(power, bounds).tolist(),
+            np.add.reduceat(sc_starts, bounds).tolist(),
+            np.add.reduceat(ao_starts, bounds).tolist(),
+        ))
+
+def analytics_paths(input_file):
+    folder = os.path.dirname(os.path.abspath(input_file))
+    return os.path.join(folder, SUMMARY_FILENAME), os.path.join(folder, EVENTS_FILENAME)
+
+def _scaled(chunk, scaled_col):
+    # Files that were not scaled yet are scaled on the fly
+    if scaled_col in chunk:
+        return chunk[scaled_col].to_numpy(dtype=np.float64)
+    raw_col, factor = SCALED_COLUMNS[scaled_col]
+    return chunk[raw_col].to_numpy(dtype=np.float64) * factor
+
+def analyze_lembox_csv(input_file, summary_file=None, events_file=None, chunksize=DEFAULT_CHUNKSIZE,
+                       log_func=print, **options):
+    """Write the windowed summary and the event list of a LEM box CSV.
+
+    The CSV (scaled or not) is streamed in chunks of `chunksize` rows. Its time column is
+    found as in session_alignment and may hold any ISO 8601 timestamps; rows whose time
+    cannot be parsed are left out. options are passed to LemboxAnalyzer. Both tables go
+    next to the CSV by default and are appended to as windows and events are finished.
+    Returns (summary rows, events). Raises ValueError if the CSV has no time column or
+    lacks the voltage and current columns.
+    """
+    default_summary, default_events = analytics_paths(input_file)
+    summary_file = summary_file or default_summary
+    events_file = events_file or default_events
+    columns = pd.read_csv(input_file, nrows=0).columns
+    time_col = find_time_column(columns)
+    if time_col is None:
+        raise ValueError(f"No time column in {input_file}")
+    usecols = [time_col] + [col if col in columns else raw_col for col, (raw_col, _) in SCALED_COLUMNS.items()]
+    missing = [col for col in usecols if col not in columns]
+    if missing:
+        raise ValueError(f"Columns {missing} not found in {input_file}")
+
+    analyzer = LemboxAnalyzer(**options)
+    counts = [0, 0]
+    with open(summary_file + '.tmp', 'w', newline='') as summary_out, open(events_file + '.tmp', 'w', newline='') as events_out:
+        pd.DataFrame(columns=SUMMARY_COLUMNS).to_csv(summary_out, index=False)
+        pd.DataFrame(columns=EVENT_COLUMNS).to_csv(events_out, index=False)
+
+        def write(rows, events):
+            with span('lembox.analytics_write'):
+                if rows:
+                    pd.DataFrame(rows, columns=SUMMARY_COLUMNS).to_csv(summary_out, header=False, index=False,
+                                                                       float_format='%.4f')
+                if events:
+                    events = sorted(events, key=lambda event: event[1])
+                    table = pd.DataFrame(events, columns=EVENT_COLUMNS)
+                    table['start'] = _format_ns(table['start'].to_numpy())
+                    table['end'] = _format_ns(table['end'].to_numpy())
+                    table.to_csv(events_out, header=False, index=False, float_format='%.4f')
+            counts[0] += len(rows)
+            counts[1] += len(events)
+
+        for chunk in timed_iter('lembox.read', pd.read_csv(input_file, usecols=usecols, chunksize=chunksize)):
+            with span('lembox.analytics'):
+                times_ns = parse_timestamps_ns(chunk[time_col].to_numpy())
+                valid = times_ns != NAT_NS
+                result = analyzer.add(times_ns[valid], _scaled(chunk, 'Scaled_Voltage(V)')[valid],
+                                      _scaled(chunk, 'Scaled_Current(A)')[valid])
+            write(*result)
+        write(*analyzer.close())
+    os.replace(summary_file + '.tmp', summary_file)
+    os.replace(events_file + '.tmp', events_file)
+    log_func(f"LEM box analytics: {counts[0]} windows to {summary_file}, {counts[1]} events to {events_file}")
+    return tuple(counts)
+
+def scale_and_analyze_lembox(input_file, chunksize=DEFAULT_CHUNKSIZE, log_func=print, **options):
+    """The LEM box processing stage: scale the CSV in place, then write its analytics.
+
+    Analytics that cannot be computed (see analyze_lembox_csv) are logged and skipped, so
+    the scaling still counts as done; the missing tables keep the job stale, and the next
+    run retries the analytics without scaling again.
+    """
+    scale_lembox_csv(input_file, chunksize, log_func)
+    try:
+        analyze_lembox_csv(input_file, chunksize=chunksize, log_func=log_func, **options)
+    except ValueError as e:
+        log_func(f"LEM box analytics skipped for {input_file}: {e}")
+    return True
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python lembox_analytics.py <lembox_data.csv> [window_s]")
+        sys.exit(1)
+    window_s = float(sys.argv[2]) if len(sys.argv) == 3 else ANALYTICS_WINDOW_S
+    analyze_lembox_csv(sys.argv[1], window_s=window_s)
@@ -1,23 +1,66 @@
 import pandas as pd
 import os
 import sys
+import tempfile
 
-# Get the directory where the script is located
-script_dir = os.path.dirname(os.path.abspath(__file__))
+from instrumentation import span, timed_iter
 
-if len(sys.argv) > 1:
-    # Make paths relative to script directory if it's not absolute
-    input_file = os.path.join(script_dir, sys.argv[1]) if not os.path.isabs(sys.argv[1]) else sys.argv[1]
-else:
-    input_file = os.path.join(script_dir, 'lembox_data.csv')
+# Scaled column -> (raw column, scale factor) to get the true values from the Miller LEM Box
+SCALED_COLUMNS = {
+    'Scaled_Voltage(V)': ('Voltage(V)', 10),
+    'Scaled_Current(A)': ('Current(A)', 100),
+}
+DEFAULT_CHUNKSIZE = 500000
 
-print(f"Reading and updating file: {input_file}")
+def add_scaled_columns(df):
+    for scaled_col, (raw_col, factor) in SCALED_COLUMNS.items():
+        df[scaled_col] = df[raw_col] * factor
+    return df
 
-# Read, scale, and update the data in place
-df = pd.read_csv(input_file)
-df['Scaled_Voltage(V)'] = df['Voltage(V)'] * 10
-df['Scaled_Current(A)'] = df['Current(A)'] * 100
+def is_scaled(input_file):
+    """True if the CSV header already has all scaled columns (only the header is read)"""
+    columns = pd.read_csv(input_file, nrows=0).columns
+    return all(col in columns for col in SCALED_COLUMNS)
 
-# Save back to the same file
-df.to_csv(input_file, index=False)
-print(f"Scaling complete. Original file updated: {input_file}")
\ No newline at end of file
+def scale_lembox_csv(input_file, chunksize=DEFAULT_CHUNKSIZE, log_func=print):
+    """Add the scaled voltage and current columns to a LEM box CSV, in place.
+
+    Files that already have the scaled columns are left untouched. Otherwise the CSV is
+    streamed in chunks of `chunksize` rows (chunksize=None reads it whole) into a temporary
+    file next to it, which then atomically replaces the original. Returns True if the file
+    was rewritten.
+    """
+    if is_scaled(input_file):
+        log_func(f"Already scaled, skipping: {input_file}")
+        return False
+
+    log_func(f"Reading and updating file: {input_file}")
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(input_file)), suffix='.tmp')
+    os.close(fd)
+    try:
+        chunks = [pd.read_csv(input_file)] if chunksize is None else pd.read_csv(input_file, chunksize=chunksize)
+        for i, chunk in enumerate(timed_iter('lembox.read', chunks)):
+            with span('lembox.scale'):
+                chunk = add_scaled_columns(chunk)
+            with span('lembox.write'):
+                chunk.to_csv(tmp_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+        os.replace(tmp_path, input_file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    log_func(f"Scaling complete. Original file updated: {input_file}")
+    return True
+
+if __name__ == "__main__":
+    # Get the directory where the script is located
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+
+    if len(sys.argv) > 1:
+        # Make paths relative to script directory if it's not absolute
+        input_file = os.path.join(script_dir, sys.argv[1]) if not os.path.isabs(sys.argv[1]) else sys.argv[1]
+    else:
+        input_file = os.path.join(script_dir, 'lembox_data.csv')
+
+    scale_lembox_csv(input_file)
@@ -0,0 +1,488 @@
+import io
+import os
+import csv
+import json
+import time
+import struct
+import argparse
+from collections import deque
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from audio_conversion import find_header_row, write_amplitude_cache
+from create_flirvideo import FrameRenderer, build_frame_manifest, load_frame, manifest_min_max
+from Data_Processing import AUDIO_SAMPLING_RATE, FLIR_CALIBRATION, FLIR_SIZE, LEMBOX_ANALYTICS, build_jobs
+from instrumentation import span
+from lembox_analytics import analyze_lembox_csv
+from lembox_scaling import SCALED_COLUMNS, add_scaled_columns
+from processing_manifest import load_manifest, record_job, save_manifest
+from robotdata_parsing import SCHEMA_SAMPLE_LINES, SchemaMismatch, learn_robot_schema
+
+CHECKPOINT_FILENAME = 'live_follow.json'
+CHECKPOINT_VERSION = 1
+# Most bytes of one file handled per step, so catching up on a long file keeps memory bounded
+MAX_READ_BYTES = 16 * 1024 * 1024
+LIVE_WAV_FILENAME = 'microphone_data.live.wav'
+LIVE_LEMBOX_FILENAME = 'lembox_data.live.csv'
+PREVIEW_FOLDER_NAME = 'FLIR_preview'
+
+def read_new_data(path, offset, final=False, max_bytes=MAX_READ_BYTES):
+    """Read the complete lines appended to a file after offset.
+
+    A last line without a newline may still be being written and is left for the next
+    read, unless final is set (the recording has stopped).
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(max_bytes)
+    if not final or len(data) == max_bytes:
+        data = data[:data.rfind(b'\n') + 1]
+    return data
+
+def _truncate(path, size):
+    with open(path, 'r+b') as f:
+        f.truncate(size)
+
+class _Follower:
+    """Follows one growing data file. `state` is the JSON-serializable checkpoint."""
+
+    name = None
+    defaults = {}
+
+    def __init__(self, folder, state, log_func=print):
+        self.folder = folder
+        self.log_func = log_func
+        self.state = dict(self.defaults, **(state or {}))
+
+    @property
+    def source(self):
+        return os.path.join(self.folder, self.source_name)
+
+    @property
+    def output(self):
+        return os.path.join(self.folder, self.output_name)
+
+    def reset(self):
+        if os.path.exists(self.output):
+            os.remove(self.output)
+        self.state = dict(self.defaults)
+
+    def recover(self):
+        """Bring the output back to the checkpoint: bytes written after it are cut off"""
+        size = self.state['output_size']
+        if self.state['status'] != 'following':
+            return
+        if size and (not os.path.exists(self.output) or os.path.getsize(self.output) < size):
+            self.log_func(f"{self.output_name} no longer matches the checkpoint; restarting {self.name}")
+            self.reset()
+        elif size and os.path.getsize(self.output) > size:
+            _truncate(self.output, size)
+
+    def poll(self, final=False):
+        """Handle the data appended since the last poll; return True if there was any"""
+        if self.state['status'] != 'following' or not os.path.exists(self.source):
+            return False
+        if os.path.getsize(self.source) < self.state['offset']:
+            self.log_func(f"{self.source_name} shrank; restarting {self.name}")
+            self.reset()
+        if self.state['offset'] == 0 and not self.start(final):
+            return False
+        grew = False
+        while True:
+            data = read_new_data(self.source, self.state['offset'], final)
+            if not data:
+                return grew
+            checkpoint = dict(self.state)
+            try:
+                if not self.append(data):
+                    return grew
+            except Exception:
+                # Drop whatever the failed step wrote, so a retry starts from a clean output
+                self.state = checkpoint
+                self.recover()
+                raise
+            self.state['offset'] += len(data)
+            self.state['output_size'] = os.path.getsize(self.output) if os.path.exists(self.output) else 0
+            grew = True
+
+    def is_complete(self):
+        return (self.state['status'] == 'following' and self.state['output_size'] > 0
+                and self.state['offset'] == os.path.getsize(self.source))
+
+    def finish(self):
+        pass
+
+class RobotFollower(_Follower):
+    """Appends parsed robot messages to robot_data.csv.
+
+    The message schema is learned from the same first lines as the fast parser, so the
+    finished CSV is the one Data_Processing would write. If a later message does not fit
+    the schema, following stops and the post-run parser handles the file.
+    """
+
+    name = 'robot'
+    source_name = 'robot_data.txt'
+    output_name = 'robot_data.csv'
+    defaults = {'status': 'following', 'offset': 0, 'output_size': 0, 'rows': 0}
+
+    def __init__(self, folder, state, log_func=print):
+        super().__init__(folder, state, log_func)
+        self.schema = None
+
+    def start(self, final):
+        data = read_new_data(self.source, 0, final)
+        # Wait for the header and enough messages to learn the schema from
+        if data.count(b'\n') <= SCHEMA_SAMPLE_LINES and not final:
+            return False
+        self.schema = learn_robot_schema(self.source)
+        if not self.schema.templates:
+            self.log_func("Robot messages have no fixed layout; leaving robot_data.txt to post-run processing")
+            self.state['status'] = 'generic'
+            return False
+        self.state['offset'] = data.find(b'\n') + 1
+        return True
+
+    def append(self, data):
+        if self.schema is None:
+            self.schema = learn_robot_schema(self.source)
+        rows = []
+        try:
+            for line in data.decode('utf-8').split('\n'):
+                if line.strip():
+                    row = self.schema.parse_line(line)
+                    if row is not None:
+                        rows.append(row)
+        except SchemaMismatch:
+            self.log_func("Robot messages changed layout; leaving robot_data.txt to post-run processing")
+            self.state['status'] = 'fallback'
+            return False
+        if rows:
+            with open(self.output, 'a' if self.state['output_size'] else 'w', newline='', encoding='utf-8') as out:
+                writer = csv.writer(out, lineterminator=os.linesep)
+                if not self.state['output_size']:
+                    writer.writerow(self.schema.columns)
+                writer.writerows(rows)
+        self.state['rows'] += len(rows)
+        return True
+
+class LemboxFollower(_Follower):
+    """Writes scaled LEM box rows to lembox_data.live.csv.
+
+    When the recording has finished, the live file replaces lembox_data.csv, just as
+    scale_lembox_csv would have rewritten it, and the LEM box analytics are written.
+    """
+
+    name = 'lembox'
+    source_name = 'lembox_data.csv'
+    output_name = LIVE_LEMBOX_FILENAME
+    defaults = {'status': 'following', 'offset': 0, 'output_size': 0, 'rows': 0, 'columns': None}
+
+    def start(self, final):
+        data = read_new_data(self.source, 0, final)
+        header = data[:data.find(b'\n') + 1] if b'\n' in data else data
+        if not header:
+            return False
+        columns = pd.read_csv(io.BytesIO(header), nrows=0).columns.tolist()
+        if all(col in columns for col in SCALED_COLUMNS):
+            self.state['status'] = 'scaled'
+            return False
+        self.state['columns'] = columns
+        self.state['offset'] = len(header)
+        return True
+
+    def append(self, data):
+        with span('lembox.read'):
+            chunk = pd.read_csv(io.BytesIO(data), header=None, names=self.state['columns'])
+        with span('lembox.scale'):
+            chunk = add_scaled_columns(chunk)
+        with span('lembox.write'):
+            chunk.to_csv(self.output, mode='a' if self.state['output_size'] else 'w',
+                         header=not self.state['output_size'], index=False)
+        self.state['rows'] += len(chunk)
+        return True
+
+    def finish(self):
+        if self.is_complete() and os.path.exists(self.output):
+            os.replace(self.output, self.source)
+            self.state['status'] = 'replaced'
+            self.log_func(f"Scaled LEM box data moved to {self.source}")
+            try:
+                analyze_lembox_csv(self.source, log_func=self.log_func, **LEMBOX_ANALYTICS)
+            except ValueError as e:
+                # The scaled data is in place; the post-run processing retries the analytics
+                self.log_func(f"LEM box analytics skipped for {self.source}: {e}")
+
+class AudioFollower(_Follower):
+    """Appends microphone samples to a growing 16-bit WAV file for listening during the run.
+
+    The final WAV is normalized by the peak of the whole recording, which is only known
+    at the end, so the live file uses a fixed full scale instead. The amplitude range is
+    tracked as well and cached for csv_to_wav when the recording finishes, so post-run
+    conversion needs a single pass.
+    """
+
+    name = 'audio'
+    source_name = 'microphone_data.csv'
+    output_name = LIVE_WAV_FILENAME
+    defaults = {'status': 'following', 'offset': 0, 'output_size': 0, 'samples': 0,
+                'min': None, 'max': None, 'columns': None, 'full_scale': 1.0}
+
+    def __init__(self, folder, state, log_func=print, full_scale=None, sampling_rate=AUDIO_SAMPLING_RATE):
+        super().__init__(folder, state, log_func)
+        self.sampling_rate = sampling_rate
+        if full_scale is not None and not self.state['samples']:
+            self.state['full_scale'] = full_scale
+
+    def reset(self):
+        full_scale = self.state['full_scale']
+        super().reset()
+        self.state['full_scale'] = full_scale
+
+    def recover(self):
+        super().recover()
+        if self.state['output_size']:
+            self._patch_header()
+
+    def start(self, final):
+        data = read_new_data(self.source, 0, final)
+        # The header may follow an info row, so wait for two complete lines
+        if data.count(b'\n') < 2 and not final:
+            return False
+        skiprows = find_header_row(self.source)
+        if skiprows is None:
+            self.state['status'] = 'no_amplitude'
+            return False
+        lines = data.split(b'\n')
+        self.state['columns'] = pd.read_csv(io.BytesIO(lines[skiprows]), nrows=0).columns.tolist()
+        self.state['offset'] = sum(len(line) + 1 for line in lines[:skiprows + 1])
+        return True
+
+    def append(self, data):
+        with span('audio.read'):
+            values = pd.read_csv(io.BytesIO(data), header=None, names=self.state['columns'],
+                                 usecols=['Amplitude'])['Amplitude'].to_numpy(dtype=np.float64)
+        with span('audio.normalize'):
+            samples = (np.clip(values / self.state['full_scale'], -1, 1) * 32767).astype('<i2')
+        with span('audio.write'):
+            with open(self.output, 'r+b' if self.state['output_size'] else 'wb') as f:
+                if not self.state['output_size']:
+                    f.write(self._header(0))
+                f.seek(44 + 2 * self.state['samples'])
+                f.write(samples.tobytes())
+        if len(values):
+            self.state['min'] = min(float(values.min()), self.state['min'] if self.state['min'] is not None else np.inf)
+            self.state['max'] = max(float(values.max()), self.state['max'] if self.state['max'] is not None else -np.inf)
+        self.state['samples'] += len(values)
+        self._patch_header()
+        return True
+
+    def _header(self, samples):
+        data_bytes = 2 * samples
+        return (b'RIFF' + struct.pack('<I', 36 + data_bytes) + b'WAVE'
+                + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 1, self.sampling_rate, 2 * self.sampling_rate, 2, 16)
+                + b'data' + struct.pack('<I', data_bytes))
+
+    def _patch_header(self):
+        # Keep the RIFF and data chunk sizes in step with the samples written so far
+        with open(self.output, 'r+b') as f:
+            f.write(self._header(self.state['samples']))
+
+    def finish(self):
+        if self.is_complete() and self.state['samples']:
+            write_amplitude_cache(self.source, self.state['samples'], self.state['min'], self.state['max'])
+
+class FlirFollower:
+    """Renders newly arrived FLIR frames into a rolling preview folder.
+
+    The frame manifest is updated as frames arrive, so post-run rendering does not scan
+    them again. The newest `preview_frames` renders are kept in FLIR_preview, and the
+    newest of all is copied to FLIR_preview/latest.jpg. Colors use the range of the
+    frames seen so far. With preview_frames <= 0 only the manifest is kept up to date.
+    """
+
+    name = 'flir'
+
+    def __init__(self, folder, state, log_func=print, preview_frames=30):
+        self.folder = folder
+        self.log_func = log_func
+        self.state = dict({'frames': 0, 'rendered': 0}, **(state or {}))
+        self.preview_frames = preview_frames
+        self.preview_folder = os.path.join(folder, PREVIEW_FOLDER_NAME)
+        self.known = set()
+        self.renderer = None
+        self.previews = deque()
+
+    def recover(self):
+        if os.path.isdir(self.preview_folder):
+            self.previews.extend(sorted(os.path.join(self.preview_folder, name)
+                                        for name in os.listdir(self.preview_folder) if name != 'latest.jpg'))
+
+    def poll(self, final=False):
+        flir_folder = os.path.join(self.folder, 'FLIR')
+        if not os.path.isdir(flir_folder):
+            return False
+        entries = build_frame_manifest(flir_folder, self.log_func)
+        new = [entry for entry in entries if entry['filename'] not in self.known and entry['timestamp']]
+        self.known.update(entry['filename'] for entry in entries)
+        self.state['frames'] = len(entries)
+        if not new:
+            return False
+        if self.preview_frames <= 0:
+            # new[-0:] would be every frame, not none
+            return True
+
+        global_min, global_max = manifest_min_max(entries)
+        if self.renderer is None or (self.renderer.global_min, self.renderer.global_max) != (global_min, global_max):
+            self.renderer = FrameRenderer(global_min, global_max, *FLIR_SIZE, FLIR_CALIBRATION)
+        os.makedirs(self.preview_folder, exist_ok=True)
+        for entry in new[-self.preview_frames:]:
+            frame, timestamp = load_frame(os.path.join(flir_folder, entry['filename']))
+            path = os.path.join(self.preview_folder, os.path.splitext(entry['filename'])[0] + '.jpg')
+            image = self.renderer.render(frame, timestamp)
+            cv2.imwrite(path, image)
+            if path in self.previews:
+                self.previews.remove(path)
+            self.previews.append(path)
+            self.state['rendered'] += 1
+        while len(self.previews) > self.preview_frames:
+            old = self.previews.popleft()
+            if os.path.exists(old):
+                os.remove(old)
+        # Viewers polling latest.jpg never see a half written file
+        latest = os.path.join(self.preview_folder, 'latest.tmp.jpg')
+        cv2.imwrite(latest, image)
+        os.replace(latest, os.path.join(self.preview_folder, 'latest.jpg'))
+        return True
+
+    def is_complete(self):
+        return False
+
+    def finish(self):
+        pass
+
+class LiveSession:
+    """Follows every data file of a session folder while it is being recorded.
+
+    Each poll handles what was appended since the last one and then saves the read
+    offsets and output sizes to live_follow.json. A restarted follower cuts its outputs
+    back to the checkpoint and resumes from the saved offsets, so no data is handled
+    twice. finish() handles the last partial lines and hands the results over to
+    post-run processing: the robot and LEM box jobs are recorded in the processing
+    manifest, so Data_Processing skips them.
+    """
+
+    def __init__(self, folder, log_func=print, preview_frames=30, audio_full_scale=None):
+        self.folder = folder
+        self.log_func = log_func
+        self.checkpoint_path = os.path.join(folder, CHECKPOINT_FILENAME)
+        state = self._load_checkpoint()
+        self.followers = [
+            RobotFollower(folder, state.get('robot'), log_func),
+            LemboxFollower(folder, state.get('lembox'), log_func),
+            AudioFollower(folder, state.get('audio'), log_func, audio_full_scale),
+            FlirFollower(folder, state.get('flir'), log_func, preview_frames),
+        ]
+        for follower in self.followers:
+            follower.recover()
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                checkpoint = json.load(f)
+            if checkpoint.get('version') == CHECKPOINT_VERSION:
+                return checkpoint['streams']
+        except (OSError, ValueError, KeyError):
+            pass
+        return {}
+
+    def save_checkpoint(self, finished=False):
+        checkpoint = {
+            'version': CHECKPOINT_VERSION,
+            'finished': finished,
+            'streams': {follower.name: follower.state for follower in self.followers},
+        }
+        with open(self.checkpoint_path + '.tmp', 'w') as f:
+            json.dump(checkpoint, f, indent=1)
+        os.replace(self.checkpoint_path + '.tmp', self.checkpoint_path)
+
+    def poll(self, final=False):
+        """Handle new data in every stream; return True if any stream grew"""
+        grew = False
+        for follower in self.followers:
+            try:
+                with span(f'live.{follower.name}'):
+                    grew = follower.poll(final) or grew
+            except Exception as e:
+                self.log_func(f"Error following {follower.name}: {e}")
+        if grew:
+            self.save_checkpoint()
+        return grew
+
+    def finish(self):
+        """Handle the rest of the data once the recording has stopped"""
+        self.poll(final=True)
+        complete = [follower.name for follower in self.followers if follower.is_complete()]
+        for follower in self.followers:
+            follower.finish()
+        jobs = build_jobs(self.folder)
+        manifest = load_manifest(self.folder)
+        for name in complete:
+            if name in ('robot', 'lembox') and name in jobs:
+                record_job(manifest, name, jobs[name])
+        save_manifest(self.folder, manifest)
+        self.save_checkpoint(finished=True)
+        self.log_func(f"Live follow finished; followed to the end: {', '.join(complete) or 'none'}")
+
+    def summary(self):
+        states = {follower.name: follower.state for follower in self.followers}
+        return (f"robot {states['robot']['rows']} rows, lembox {states['lembox']['rows']} rows, "
+                f"audio {states['audio']['samples']} samples, flir {states['flir']['frames']} frames")
+
+def follow(folder, interval=1.0, idle_finish=None, log_func=print, **options):
+    """Poll a session folder every `interval` seconds until interrupted.
+
+    With idle_finish set, the recording is taken to be over once no file has grown for
+    that many seconds, and the session is finished.
+    """
+    session = LiveSession(folder, log_func, **options)
+    last_growth = time.monotonic()
+    try:
+        while True:
+            if session.poll():
+                last_growth = time.monotonic()
+                log_func(session.summary())
+            elif idle_finish is not None and time.monotonic() - last_growth >= idle_finish:
+                session.finish()
+                return session
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        # The checkpoint of the last complete poll stays; outputs are cut back to it on restart
+        log_func("Stopped; run again to resume from the checkpoint")
+    return session
+
+def main():
+    parser = argparse.ArgumentParser(description="Process a session folder incrementally while it is being recorded.")
+    parser.add_argument('folder', help="session folder being recorded")
+    parser.add_argument('--interval', type=float, default=1.0, help="seconds between polls")
+    parser.add_argument('--idle-finish', type=float, metavar='SECONDS',
+                        help="finish once no file has grown for this long")
+    parser.add_argument('--once', action='store_true', help="poll once and exit")
+    parser.add_argument('--finish', action='store_true', help="the recording is over: handle the rest and finish")
+    parser.add_argument('--preview-frames', type=int, default=30, help="FLIR preview frames kept (0 turns the preview off)")
+    parser.add_argument('--audio-full-scale', type=float, help="amplitude mapped to full scale in the live WAV (default 1.0)")
+    args = parser.parse_args()
+
+    options = {'preview_frames': args.preview_frames, 'audio_full_scale': args.audio_full_scale}
+    if args.once or args.finish:
+        session = LiveSession(args.folder, **options)
+        session.poll()
+        if args.finish:
+            session.finish()
+        print(session.summary())
+    else:
+        follow(args.folder, args.interval, args.idle_finish, **options)
+
+if __name__ == "__main__":
+    main()
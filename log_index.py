@@ -0,0 +1,301 @@
+import io
+import os
+import sys
+import json
+import mmap
+import argparse
+import numpy as np
+import pandas as pd
+
+from instrumentation import span
+from robotdata_parsing import SchemaMismatch, learn_robot_schema, parse_robot_message
+from session_alignment import (NAT_NS, TIME_COLUMNS, find_time_column, microphone_start_ns, parse_timestamps_ns,
+                               seconds_to_ns)
+
+INDEX_VERSION = 1
+# Every Nth data line is indexed; a window read parses at most about 2N lines it does not need
+DEFAULT_STRIDE = 1000
+SCAN_BLOCK_BYTES = 64 * 1024 * 1024
+HEADER_SEARCH_LINES = 5
+ROBOT_LOG_COLUMNS = ('SystemTime', 'RelativeTime', 'Message')
+
+def index_paths(log_file):
+    """Return the index metadata and offset array paths of a log file"""
+    return log_file + '.index.json', log_file + '.index.npy'
+
+def _find_header(mm):
+    """Return (header offset, data offset, delimiter, columns) of a robot log or CSV.
+
+    Robot logs are read by position like the robot parsers do: whatever their first
+    line holds, it is skipped and the fields are SystemTime|RelativeTime|Message.
+    """
+    offset = 0
+    lines = []
+    for _ in range(HEADER_SEARCH_LINES):
+        end = mm.find(b'\n', offset)
+        if end < 0:
+            break
+        line = mm[offset:end].decode('utf-8', 'replace').strip()
+        lines.append((offset, end + 1, line))
+        delimiter = '|' if '|' in line else ','
+        columns = [column.strip() for column in line.split(delimiter)]
+        if any(name in columns for name in TIME_COLUMNS):
+            return offset, end + 1, delimiter, columns
+        offset = end + 1
+    if len(lines) > 1 and lines[1][2].count('|') == len(ROBOT_LOG_COLUMNS) - 1:
+        return 0, lines[0][1], '|', list(ROBOT_LOG_COLUMNS)
+    raise ValueError("No header with a time column in the first lines")
+
+class LogIndex:
+    """Sparse index of a time-ordered text log: the byte offset and time of every Nth line.
+
+    Robot logs (`SystemTime|RelativeTime|Message`) are indexed by SystemTime, CSVs by
+    their time column. Relative times in seconds (the microphone Time column) are made
+    absolute with the recording start in the info row when there is one. Lines whose
+    time does not parse are left out of the index.
+    """
+
+    def __init__(self, log_file, metadata, offsets, times):
+        self.log_file = log_file
+        self.metadata = metadata
+        self.offsets = offsets
+        self.times = times
+
+    @classmethod
+    def build(cls, log_file, stride=DEFAULT_STRIDE, previous=None):
+        """Index a log file. With a previous index of the same file, only the appended part is scanned."""
+        with open(log_file, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                raise ValueError(f"{log_file} is empty")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if previous is not None:
+                    metadata = dict(previous.metadata)
+                    offsets, times = [previous.offsets], [previous.times]
+                else:
+                    header_offset, data_offset, delimiter, columns = _find_header(mm)
+                    time_column = find_time_column(columns)
+                    metadata = {
+                        'version': INDEX_VERSION,
+                        'stride': stride,
+                        'header_offset': header_offset,
+                        'data_offset': data_offset,
+                        'delimiter': delimiter,
+                        'columns': columns,
+                        'time_column': time_column,
+                        'time_field': columns.index(time_column),
+                        'start_ns': None,
+                        'lines': 0,
+                        'end_offset': data_offset,
+                    }
+                    if header_offset > 0:
+                        start_ns = microphone_start_ns(log_file)
+                        metadata['start_ns'] = None if start_ns is None else int(start_ns)
+                    offsets, times = [], []
+                new_offsets, new_times = cls._scan(mm, metadata)
+                offsets.append(new_offsets)
+                times.append(new_times)
+        stat = os.stat(log_file)
+        metadata.update({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+        return cls(log_file, metadata, np.concatenate(offsets), np.concatenate(times))
+
+    @staticmethod
+    def _scan(mm, metadata):
+        # Line starts come from a vectorized newline search over the memory map, a block at a time
+        data = np.frombuffer(mm, dtype=np.uint8)
+        stride, lines, position = metadata['stride'], metadata['lines'], metadata['end_offset']
+        sampled = []
+        block = None
+        while position < len(data):
+            block = data[position:position + SCAN_BLOCK_BYTES]
+            line_ends = np.flatnonzero(block == 10) + position
+            if len(line_ends) == 0:
+                break
+            starts = np.concatenate(([position], line_ends[:-1] + 1))
+            first = (-lines) % stride
+            sampled.append(starts[first::stride])
+            lines += len(starts)
+            position = int(line_ends[-1]) + 1
+        # The memory map can only be closed once no array views it
+        del data, block
+        # Only complete lines are indexed; a partly written last line is picked up next time
+        metadata['lines'] = lines
+        metadata['end_offset'] = position
+        offsets = np.concatenate(sampled) if sampled else np.empty(0, dtype=np.int64)
+
+        delimiter = metadata['delimiter'].encode()
+        field = metadata['time_field']
+        values = []
+        for offset in offsets:
+            end = mm.find(b'\n', offset)
+            parts = mm[offset:end].split(delimiter, field + 1)
+            values.append(parts[field].strip().decode('utf-8', 'replace') if len(parts) > field else '')
+        times = _parse_times(values, metadata)
+        valid = times != NAT_NS
+        return offsets[valid].astype(np.int64), times[valid]
+
+    @classmethod
+    def load(cls, log_file):
+        """Load the saved index of a log file, or None if there is none or it is unreadable"""
+        metadata_path, offsets_path = index_paths(log_file)
+        try:
+            with open(metadata_path, 'r') as f:
+                metadata = json.load(f)
+            if metadata.get('version') != INDEX_VERSION:
+                return None
+            table = np.load(offsets_path)
+        except (OSError, ValueError):
+            return None
+        return cls(log_file, metadata, table[:, 0], table[:, 1])
+
+    def save(self):
+        metadata_path, offsets_path = index_paths(self.log_file)
+        with open(offsets_path + '.tmp', 'wb') as f:
+            np.save(f, np.column_stack((self.offsets, self.times)))
+        os.replace(offsets_path + '.tmp', offsets_path)
+        with open(metadata_path + '.tmp', 'w') as f:
+            json.dump(self.metadata, f)
+        os.replace(metadata_path + '.tmp', metadata_path)
+
+    def is_current(self):
+        stat = os.stat(self.log_file)
+        return self.metadata['size'] == stat.st_size and self.metadata['mtime_ns'] == stat.st_mtime_ns
+
+    def byte_range(self, start_ns, end_ns):
+        """Byte range of the data lines that can hold times in [start_ns, end_ns)"""
+        # Lines before the last entry earlier than start_ns, and from the first entry at or
+        # after end_ns on, are outside the window
+        first = np.searchsorted(self.times, start_ns, side='left') - 1
+        last = np.searchsorted(self.times, end_ns, side='left')
+        start = int(self.offsets[first]) if first >= 0 else self.metadata['data_offset']
+        end = int(self.offsets[last]) if last < len(self.offsets) else self.metadata['end_offset']
+        return start, max(start, end)
+
+    @property
+    def first_time_ns(self):
+        return int(self.times[0]) if len(self.times) else None
+
+def _parse_times(values, metadata):
+    values = np.asarray(values, dtype=object)
+    if len(values) == 0:
+        return np.empty(0, dtype=np.int64)
+    numbers = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy()
+    if np.isfinite(numbers).any():
+        return seconds_to_ns(numbers, metadata['start_ns'] or 0)
+    return parse_timestamps_ns(values)
+
+def open_log_index(log_file, stride=DEFAULT_STRIDE, save=True):
+    """Return an up to date index of a log file, loading, extending or building it as needed.
+
+    A log that only grew since it was indexed (e.g. one being recorded) is indexed from
+    where the last scan stopped; any other change rebuilds the index.
+    """
+    index = LogIndex.load(log_file)
+    if index is not None and index.metadata['stride'] == stride and index.is_current():
+        return index
+    with span('log_index.build'):
+        previous = None
+        if (index is not None and index.metadata['stride'] == stride
+                and os.path.getsize(log_file) >= index.metadata['size'] and _last_entry_matches(index)):
+            previous = index
+        index = LogIndex.build(log_file, stride, previous)
+    if save:
+        index.save()
+    return index
+
+def _last_entry_matches(index):
+    # Cheap check that the file was appended to rather than rewritten
+    if len(index.offsets) == 0:
+        return index.metadata['lines'] == 0
+    with open(index.log_file, 'rb') as f:
+        f.seek(int(index.offsets[-1]))
+        line = f.readline()
+    parts = line.split(index.metadata['delimiter'].encode(), index.metadata['time_field'] + 1)
+    if len(parts) <= index.metadata['time_field']:
+        return False
+    value = parts[index.metadata['time_field']].strip().decode('utf-8', 'replace')
+    return _parse_times([value], index.metadata)[0] == index.times[-1]
+
+def to_ns(value, index=None):
+    """Convert a time to int64 ns: a timestamp string or datetime, or seconds after the log's first line"""
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        origin = index.first_time_ns if index is not None and index.first_time_ns is not None else 0
+        return origin + int(round(float(value) * 1e9))
+    return int(parse_timestamps_ns([value])[0])
+
+def read_window_bytes(log_file, start, end, index=None):
+    """Return the header line and the raw data lines around [start, end), read with one seek"""
+    index = index or open_log_index(log_file)
+    start_ns, end_ns = to_ns(start, index), to_ns(end, index)
+    byte_start, byte_end = index.byte_range(start_ns, end_ns)
+    with open(log_file, 'rb') as f:
+        f.seek(index.metadata['header_offset'])
+        header = f.read(index.metadata['data_offset'] - index.metadata['header_offset'])
+        f.seek(byte_start)
+        data = f.read(byte_end - byte_start)
+    return header, data, start_ns, end_ns
+
+def read_window(log_file, start, end, index=None):
+    """Return the rows of a log with start <= time < end as a DataFrame.
+
+    Only the indexed byte range around the window is read and parsed. Robot logs are
+    parsed into the same columns as robot_data.csv; CSVs keep their own columns.
+    start and end are timestamps, or seconds after the first line of the log.
+    """
+    index = index or open_log_index(log_file)
+    header, data, start_ns, end_ns = read_window_bytes(log_file, start, end, index)
+    with span('log_index.parse'):
+        if index.metadata['delimiter'] == '|':
+            table = _parse_robot_lines(log_file, data)
+        else:
+            table = pd.read_csv(io.BytesIO(header + data))
+        if table.empty:
+            return table
+        time_column = index.metadata['time_column']
+        times = _parse_times(table[time_column].astype(str).to_numpy(), index.metadata)
+        return table[(times >= start_ns) & (times < end_ns)].reset_index(drop=True)
+
+def _parse_robot_lines(log_file, data):
+    schema = learn_robot_schema(log_file)
+    lines = [line for line in data.decode('utf-8').split('\n') if line.strip()]
+    try:
+        rows = [row for row in map(schema.parse_line, lines) if row is not None]
+        return pd.DataFrame(rows, columns=schema.columns)
+    except SchemaMismatch:
+        rows = [row for row in map(parse_robot_message, lines) if row]
+        table = pd.DataFrame(rows)
+        first = [col for col in ('SystemTime', 'RelativeTime') if col in table]
+        return table[first + [col for col in table.columns if col not in first]]
+
+def main():
+    parser = argparse.ArgumentParser(description="Index time-ordered session logs and read time windows from them.")
+    parser.add_argument('files', nargs='+', help="robot_data.txt, lembox_data.csv, microphone_data.csv, ...")
+    parser.add_argument('--stride', type=int, default=DEFAULT_STRIDE, help="index every Nth line")
+    parser.add_argument('--start', help="window start: a timestamp, or seconds after the first line")
+    parser.add_argument('--end', help="window end: a timestamp, or seconds after the first line")
+    parser.add_argument('--output', help="CSV for the window rows (default: print them)")
+    args = parser.parse_args()
+
+    def parse_time(value):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+    for log_file in args.files:
+        index = open_log_index(log_file, args.stride)
+        print(f"{log_file}: {index.metadata['lines']} lines, {len(index.offsets)} index entries")
+        if args.start is None or args.end is None:
+            continue
+        window = read_window(log_file, parse_time(args.start), parse_time(args.end), index)
+        if args.output:
+            window.to_csv(args.output, index=False)
+            print(f"{len(window)} rows written to {args.output}")
+        else:
+            print(window.to_string(max_rows=20))
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python log_index.py <log_file> [...] [--start T --end T]")
+        sys.exit(1)
+    main()
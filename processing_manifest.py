@@ -0,0 +1,84 @@
+import os
+import json
+import hashlib
+
+MANIFEST_FILENAME = 'processing_manifest.json'
+MANIFEST_VERSION = 1
+
+def _file_sha1(path, block_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def fingerprint(path, hash_content=False):
+    """Return a JSON-serializable fingerprint of a file or folder, or None if it is missing.
+
+    Files are fingerprinted by size and modification time (plus a SHA-1 of the content if
+    hash_content is set). Folders are fingerprinted by the count, total size and latest
+    modification time of the files directly inside them, which only needs one directory
+    scan.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if os.path.isdir(path):
+        files = 0
+        total_size = 0
+        latest_mtime_ns = 0
+        with os.scandir(path) as it:
+            for dir_entry in it:
+                if dir_entry.is_file():
+                    entry_stat = dir_entry.stat()
+                    files += 1
+                    total_size += entry_stat.st_size
+                    latest_mtime_ns = max(latest_mtime_ns, entry_stat.st_mtime_ns)
+        return {'files': files, 'size': total_size, 'mtime_ns': latest_mtime_ns}
+    result = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if hash_content:
+        result['sha1'] = _file_sha1(path)
+    return result
+
+def load_manifest(folder):
+    """Load a session's processing manifest, or an empty one if it is missing or unreadable"""
+    try:
+        with open(os.path.join(folder, MANIFEST_FILENAME), 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'version': MANIFEST_VERSION, 'jobs': {}}
+
+def save_manifest(folder, manifest):
+    manifest_path = os.path.join(folder, MANIFEST_FILENAME)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+def _fingerprints(paths, hash_content):
+    return {os.path.basename(path): fingerprint(path, hash_content) for path in paths}
+
+def is_job_fresh(manifest, job_name, job, hash_content=False):
+    """True if the job last succeeded with the same inputs and params and its outputs are intact"""
+    entry = manifest['jobs'].get(job_name)
+    if entry is None or entry.get('params') != job['params']:
+        return False
+    if entry.get('inputs') != _fingerprints(job['inputs'], hash_content):
+        return False
+    outputs = _fingerprints(job['outputs'], False)
+    return all(outputs.values()) and entry.get('outputs') == outputs
+
+def record_job(manifest, job_name, job, hash_content=False):
+    """Record a successful job run.
+
+    Fingerprints are taken after the run, so jobs that rewrite their input in place (LEM
+    box scaling) or add sidecar files to it (FLIR) are seen as fresh on the next run.
+    """
+    manifest['jobs'][job_name] = {
+        'params': job['params'],
+        'inputs': _fingerprints(job['inputs'], hash_content),
+        'outputs': _fingerprints(job['outputs'], False),
+    }
@@ -1,8 +1,15 @@
+import os
+import re
+import csv
+import shutil
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
 import xml.etree.ElementTree as ET
 
+from instrumentation import span
+
 def extract_xml_data(element, prefix=''):
     """Recursively extract all data from XML elements"""
     data = {}
@@ -59,7 +66,7 @@ def convert_robot_data_to_csv(input_file, output_file):
     data_list = []
     
     # Read and parse the input file
-    with open(input_file, 'r') as f:
+    with span('robot.parse'), open(input_file, 'r') as f:
         # Skip the header line
         next(f)
         
@@ -71,21 +78,259 @@ def convert_robot_data_to_csv(input_file, output_file):
     
     # Convert to DataFrame and save to CSV
     if data_list:
-        df = pd.DataFrame(data_list)
-        
-        # Define timestamp columns to appear first
-        timestamp_cols = ['SystemTime', 'RelativeTime']
-        
-        # Get all other columns
-        other_cols = [col for col in df.columns if col not in timestamp_cols]
-        
-        # Reorder columns
-        df = df[timestamp_cols + other_cols]
-        
-        df.to_csv(output_file, index=False)
+        with span('robot.write'):
+            df = pd.DataFrame(data_list)
+            
+            # Define timestamp columns to appear first
+            timestamp_cols = ['SystemTime', 'RelativeTime']
+            
+            # Get all other columns
+            other_cols = [col for col in df.columns if col not in timestamp_cols]
+            
+            # Reorder columns
+            df = df[timestamp_cols + other_cols]
+            
+            df.to_csv(output_file, index=False)
         print(f"Data successfully written to {output_file}")
-    else:
-        print("No data was parsed")
+        return True
+    print("No data was parsed")
+    return False
+
+TIMESTAMP_COLUMNS = ['SystemTime', 'RelativeTime']
+SCHEMA_SAMPLE_LINES = 200
+MAX_SCHEMA_TEMPLATES = 8
+PARALLEL_MIN_BYTES = 32 * 1024 * 1024
+
+_TOKEN_RE = re.compile(r'<[^>]*>|[^<]+')
+_START_TAG_RE = re.compile(r'<([^\s/>!?]+)[^>]*?(/?)>')
+_ATTR_RE = re.compile(r'([^\s=]+)="([^"]*)"')
+
+class SchemaMismatch(Exception):
+    """A line produced columns that are not in the learned schema"""
+
+class MessageTemplate:
+    """Fixed extractor for one robot message layout, compiled from a sample XML message.
+
+    Every attribute value and element text of the sample becomes a regex capture group
+    named the same way extract_xml_data names it, so a matching message is parsed with a
+    single regex match instead of building an element tree. Values the XML parser would
+    transform (entities, attribute whitespace, empty text) do not match and are left to
+    the generic parser.
+    """
+
+    def __init__(self, xml_data):
+        pattern = []
+        self.slots = []
+        open_tag = None
+        for token in _TOKEN_RE.findall(xml_data):
+            if token.startswith('<'):
+                open_tag = None
+                match = _START_TAG_RE.fullmatch(token)
+                if match is None:
+                    pattern.append(re.escape(token))
+                    continue
+                tag = match.group(1)
+                position = 0
+                for attr in _ATTR_RE.finditer(token):
+                    pattern.append(re.escape(token[position:attr.start(2)]) + r'([^"&\t\n\r]*)')
+                    self.slots.append((f"{tag}_{attr.group(1)}", False))
+                    position = attr.end(2)
+                pattern.append(re.escape(token[position:]))
+                if not match.group(2):
+                    open_tag = tag
+            elif open_tag is not None and token.strip():
+                # Element text; whitespace between tags stays literal
+                pattern.append(r'([^<&]*?[^<&\s][^<&]*)')
+                self.slots.append((open_tag, True))
+                open_tag = None
+            else:
+                pattern.append(re.escape(token))
+        self.regex = re.compile(''.join(pattern))
+        self.column_slots = []
+
+    def extract(self, xml_data):
+        """Return the same dict as extract_xml_data, or None if the message does not fit"""
+        match = self.regex.fullmatch(xml_data)
+        if match is None:
+            return None
+        data = {}
+        for (key, is_text), value in zip(self.slots, match.groups()):
+            try:
+                data[key] = float(value)
+            except ValueError:
+                data[key] = value.strip() if is_text else value
+        return data
+
+    def bind(self, columns):
+        """Map each column to the capture group that fills it (the last one, as in dict.update)"""
+        slot_index = {key: (i, is_text) for i, (key, is_text) in enumerate(self.slots)}
+        self.column_slots = [slot_index.get(col, (None, False)) for col in columns]
+
+    def extract_row(self, xml_data):
+        """Return the values of the bound columns, or None if the message does not fit"""
+        match = self.regex.fullmatch(xml_data)
+        if match is None:
+            return None
+        groups = match.groups()
+        row = []
+        for index, is_text in self.column_slots:
+            if index is None:
+                row.append('')
+                continue
+            value = groups[index]
+            try:
+                row.append(float(value))
+            except ValueError:
+                row.append(value.strip() if is_text else value)
+        return row
+
+class RobotMessageSchema:
+    """Columns and message templates learned from the first lines of a robot log"""
+
+    def __init__(self, sample_lines):
+        self.templates = []
+        rows = []
+        for line in sample_lines:
+            parts = line.strip().split('|')
+            if len(parts) != 3:
+                continue
+            parsed_data = parse_robot_message(line)
+            if not parsed_data:
+                continue
+            rows.append(parsed_data)
+            if len(self.templates) < MAX_SCHEMA_TEMPLATES and all(t.regex.fullmatch(parts[2]) is None for t in self.templates):
+                template = MessageTemplate(parts[2])
+                if template.extract(parts[2]) is not None:
+                    self.templates.append(template)
+
+        # Same column order as building a DataFrame from the rows, timestamps first
+        columns = dict.fromkeys(key for row in rows for key in row)
+        self.columns = TIMESTAMP_COLUMNS + [col for col in columns if col not in TIMESTAMP_COLUMNS]
+        self.column_set = set(self.columns)
+        for template in self.templates:
+            template.bind(self.columns[len(TIMESTAMP_COLUMNS):])
+
+    def parse_line(self, line):
+        """Parse one log line into a row list in column order, or None if it is invalid.
+
+        Lines that no template matches go through parse_robot_message; SchemaMismatch is
+        raised if that yields a column the schema does not have.
+        """
+        parts = line.strip().split('|')
+        if len(parts) != 3:
+            return None
+        system_time, relative_time, xml_data = parts
+        for template in self.templates:
+            row = template.extract_row(xml_data)
+            if row is not None:
+                try:
+                    return [system_time, float(relative_time)] + row
+                except ValueError:
+                    break
+
+        parsed_data = parse_robot_message(line)
+        if not parsed_data:
+            return None
+        if not self.column_set.issuperset(parsed_data):
+            raise SchemaMismatch(sorted(set(parsed_data) - self.column_set))
+        return [parsed_data.get(col, '') for col in self.columns]
+
+def learn_robot_schema(input_file, sample_lines=SCHEMA_SAMPLE_LINES):
+    with open(input_file, 'r', encoding='utf-8') as f:
+        # Skip the header line
+        next(f, None)
+        lines = [line for _, line in zip(range(sample_lines), f)]
+    return RobotMessageSchema(lines)
+
+def _split_byte_ranges(input_file, parts):
+    """Split the file after its header line into byte ranges that start on line boundaries"""
+    with open(input_file, 'rb') as f:
+        f.readline()
+        start = f.tell()
+        end = os.fstat(f.fileno()).st_size
+        bounds = [start]
+        for i in range(1, parts):
+            f.seek(max(start + (end - start) * i // parts - 1, bounds[-1]))
+            f.readline()
+            bounds.append(min(max(f.tell(), bounds[-1]), end))
+        bounds.append(end)
+    return [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+def _parse_byte_range(input_file, start, end, part_file, schema):
+    """Parse the lines in [start, end) and write them as CSV rows without a header.
+
+    Returns the number of rows written, or None if a line did not fit the schema.
+    """
+    rows = 0
+    with span('robot.parse'), open(input_file, 'rb') as f, open(part_file, 'w', newline='', encoding='utf-8') as out:
+        writer = csv.writer(out, lineterminator=os.linesep)
+        f.seek(start)
+        position = start
+        while position < end:
+            raw_line = f.readline()
+            if not raw_line:
+                break
+            position += len(raw_line)
+            line = raw_line.decode('utf-8')
+            if not line.strip():
+                continue
+            try:
+                row = schema.parse_line(line)
+            except SchemaMismatch:
+                return None
+            if row is not None:
+                # pandas writes a missing float as an empty field, csv.writer as 'nan'
+                writer.writerow(['' if value != value else value for value in row])
+                rows += 1
+    return rows
+
+def convert_robot_data_to_csv_fast(input_file, output_file, workers=None, chunk_bytes=PARALLEL_MIN_BYTES):
+    """Produce the same CSV as convert_robot_data_to_csv, faster.
+
+    The message layout is learned from the first lines and compiled into regex templates,
+    large files are split into line-aligned byte ranges parsed on a process pool, and rows
+    are streamed to the CSV with a fixed column order. If a later line introduces a column
+    the first lines did not have, the generic parser is used for the whole file instead.
+    Returns True if the CSV was written and False if no message could be parsed.
+    """
+    with span('robot.learn_schema'):
+        schema = learn_robot_schema(input_file)
+    if not schema.templates:
+        return convert_robot_data_to_csv(input_file, output_file)
+
+    workers = workers or os.cpu_count() or 1
+    size = os.path.getsize(input_file)
+    parts = max(1, min(workers, size // chunk_bytes)) if workers > 1 else 1
+    ranges = _split_byte_ranges(input_file, parts)
+    part_files = [f"{output_file}.part{i}" for i in range(len(ranges))]
+
+    try:
+        if len(ranges) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+                counts = list(executor.map(_parse_byte_range, [input_file] * len(ranges),
+                                           [a for a, _ in ranges], [b for _, b in ranges],
+                                           part_files, [schema] * len(ranges)))
+        else:
+            counts = [_parse_byte_range(input_file, a, b, part, schema) for (a, b), part in zip(ranges, part_files)]
+
+        if any(count is None for count in counts):
+            print("Robot messages changed layout after the first lines; using the generic parser")
+            return convert_robot_data_to_csv(input_file, output_file)
+        if sum(counts) == 0:
+            print("No data was parsed")
+            return False
+
+        with span('robot.write'), open(output_file, 'w', newline='', encoding='utf-8') as out:
+            csv.writer(out, lineterminator=os.linesep).writerow(schema.columns)
+            for part in part_files:
+                with open(part, 'r', newline='', encoding='utf-8') as f:
+                    shutil.copyfileobj(f, out)
+        print(f"Data successfully written to {output_file}")
+        return True
+    finally:
+        for part in part_files:
+            if os.path.exists(part):
+                os.remove(part)
 
 if __name__ == "__main__":
     import sys
@@ -107,4 +352,4 @@ if __name__ == "__main__":
     output_file = os.path.normpath(output_file)
     
     print(f"Attempting to read from: {input_file}")
-    convert_robot_data_to_csv(input_file, output_file)
\ No newline at end of file
+    convert_robot_data_to_csv_fast(input_file, output_file)
\ No newline at end of file
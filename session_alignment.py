@@ -0,0 +1,243 @@
+import os
+import re
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+from create_flirvideo import (build_frame_manifest, default_stack_folder, is_flir_stack, is_stack_fresh,
+                              load_flir_stack)
+from session_cache import CACHE_STREAMS, load_stream
+
+NAT_NS = np.iinfo(np.int64).min
+
+# Preferred time column names, most specific first
+TIME_COLUMNS = ('SystemTime', 'Timestamp', 'timestamp', 'Time')
+
+_START_TIME_RE = re.compile(r'\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(?:\.\d+)?')
+
+def find_time_column(columns):
+    """Return the name of the time column among columns, or None"""
+    columns = list(columns)
+    for name in TIME_COLUMNS:
+        if name in columns:
+            return name
+    return next((name for name in columns if 'time' in name.lower()), None)
+
+def parse_timestamps_ns(values):
+    """Parse timestamps into int64 nanoseconds since the epoch in one vectorized pass.
+
+    Accepts datetime64 arrays (converted without parsing) or strings in any ISO 8601
+    layout. Missing or unparseable values become NAT_NS.
+    """
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype('datetime64[ns]').view(np.int64)
+    parsed = pd.to_datetime(pd.Series(values), format='ISO8601', errors='coerce')
+    return parsed.to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+def seconds_to_ns(seconds, start_ns=0):
+    """Convert relative times in seconds to int64 nanoseconds after start_ns"""
+    seconds = np.asarray(seconds, dtype=np.float64)
+    result = np.full(seconds.shape, NAT_NS, dtype=np.int64)
+    valid = np.isfinite(seconds)
+    result[valid] = start_ns + np.rint(seconds[valid] * 1e9).astype(np.int64)
+    return result
+
+class TimedStream:
+    """A sensor stream with int64 nanosecond times, searchable with np.searchsorted.
+
+    times is kept sorted with missing timestamps dropped. When the source rows were
+    not already in order, `order` maps sorted positions back to source rows, so the
+    columns themselves (often memory maps) are never reordered as a whole.
+    """
+
+    def __init__(self, name, times_ns, columns):
+        self.name = name
+        self.columns = columns
+        times_ns = np.asarray(times_ns, dtype=np.int64)
+        valid = times_ns != NAT_NS
+        if valid.all() and (len(times_ns) < 2 or (np.diff(times_ns) >= 0).all()):
+            self.times = times_ns
+            self.order = None
+        else:
+            rows = np.flatnonzero(valid)
+            self.order = rows[np.argsort(times_ns[rows], kind='stable')]
+            self.times = times_ns[self.order]
+
+    def __len__(self):
+        return len(self.times)
+
+    def rows(self, positions):
+        """Map positions in times to source row numbers"""
+        return positions if self.order is None else self.order[positions]
+
+    def values(self, column, positions):
+        return np.asarray(self.columns[column])[self.rows(positions)]
+
+    def asof_positions(self, query_ns, direction='backward', tolerance_ns=None):
+        """Position of the matching sample for each query time, or -1 if there is none.
+
+        direction is 'backward' (last sample at or before the query), 'forward' (first
+        sample at or after it) or 'nearest'. Matches further than tolerance_ns away from
+        the query are dropped.
+        """
+        if direction not in ('backward', 'forward', 'nearest'):
+            raise ValueError(f"Unknown direction {direction!r}")
+        query_ns = np.asarray(query_ns, dtype=np.int64)
+        if len(query_ns) > 1 and not (np.diff(query_ns) >= 0).all():
+            # Binary searches are several times faster on sorted keys
+            query_order = np.argsort(query_ns, kind='stable')
+            positions = np.empty(len(query_ns), dtype=np.int64)
+            positions[query_order] = self.asof_positions(query_ns[query_order], direction, tolerance_ns)
+            return positions
+
+        n = len(self.times)
+        if direction != 'forward':
+            before = np.searchsorted(self.times, query_ns, side='right') - 1
+        if direction != 'backward':
+            after = np.searchsorted(self.times, query_ns, side='left')
+        if direction == 'backward':
+            positions = before
+        elif direction == 'forward':
+            positions = np.where(after < n, after, -1)
+        else:
+            after_valid = after < n
+            gap_before = np.where(before >= 0, query_ns - self.times[np.maximum(before, 0)], np.iinfo(np.int64).max)
+            gap_after = np.where(after_valid, self.times[np.minimum(after, n - 1)] - query_ns, np.iinfo(np.int64).max)
+            positions = np.where(gap_after < gap_before, np.where(after_valid, after, -1), before)
+
+        positions = np.where(query_ns == NAT_NS, -1, positions)
+        if tolerance_ns is not None:
+            matched = positions >= 0
+            gap = np.abs(self.times[np.maximum(positions, 0)] - query_ns)
+            positions = np.where(matched & (gap <= tolerance_ns), positions, -1)
+        return positions
+
+    def asof(self, query_ns, columns, direction='backward', tolerance_ns=None):
+        """Return {column: values at each query time}; unmatched queries get NaN (or None)"""
+        positions = self.asof_positions(query_ns, direction, tolerance_ns)
+        matched = positions >= 0
+        result = {}
+        for column in columns:
+            values = self.values(column, np.maximum(positions, 0)) if len(self.times) else np.empty(len(positions))
+            if np.issubdtype(values.dtype, np.number):
+                values = np.where(matched, values, np.nan)
+            else:
+                values = np.where(matched, values.astype(object), None)
+            result[column] = values
+        return result
+
+    def window(self, start_ns, end_ns):
+        """Return the slice of positions with start_ns <= time < end_ns"""
+        return slice(int(np.searchsorted(self.times, start_ns, side='left')),
+                     int(np.searchsorted(self.times, end_ns, side='left')))
+
+    def between(self, start_ns, end_ns, columns):
+        """Return the times and {column: values} of the samples with start_ns <= time < end_ns"""
+        window = self.window(start_ns, end_ns)
+        positions = np.arange(window.start, window.stop)
+        return self.times[window], {column: self.values(column, positions) for column in columns}
+
+def microphone_start_ns(csv_path):
+    """Recording start time from the info row above a microphone CSV header, or None"""
+    with open(csv_path, 'r') as f:
+        match = _START_TIME_RE.search(f.readline())
+    return parse_timestamps_ns([match.group(0)])[0] if match else None
+
+def load_flir_times(folder):
+    """Return the FLIR stream: frame timestamps plus frame_index and filename columns"""
+    flir_folder = os.path.join(folder, 'FLIR')
+    stack_folder = default_stack_folder(flir_folder)
+    if is_flir_stack(stack_folder) and is_stack_fresh(stack_folder, flir_folder):
+        _, timestamps, metadata = load_flir_stack(stack_folder)
+        times = parse_timestamps_ns(timestamps)
+        filenames = np.array(metadata['filenames'], dtype=object)
+    else:
+        entries = [entry for entry in build_frame_manifest(flir_folder) if entry['timestamp']]
+        times = parse_timestamps_ns([entry['timestamp'] for entry in entries])
+        filenames = np.array([entry['filename'] for entry in entries], dtype=object)
+    return TimedStream('flir', times, {'frame_index': np.arange(len(times)), 'filename': filenames})
+
+def load_timed_stream(folder, stream):
+    """Load a cached or CSV session stream (see session_cache) with its times in nanoseconds.
+
+    Microphone times are relative seconds; they are made absolute with the start time in
+    the CSV's info row when there is one, and are left relative to 0 otherwise.
+    """
+    if stream == 'flir':
+        return load_flir_times(folder)
+    columns = load_stream(folder, stream)
+    time_column = find_time_column(columns)
+    if time_column is None:
+        raise ValueError(f"No time column in the {stream} stream")
+    times = columns[time_column]
+    if stream == 'microphone':
+        start_ns = microphone_start_ns(os.path.join(folder, CACHE_STREAMS[stream]))
+        if start_ns is None:
+            print("Microphone recording start time not found; its times are relative to 0")
+        times = seconds_to_ns(times, start_ns or 0)
+    elif np.issubdtype(np.asarray(times).dtype, np.number):
+        times = seconds_to_ns(times)
+    else:
+        times = parse_timestamps_ns(times)
+    return TimedStream(stream, times, columns)
+
+def load_session_streams(folder, streams=None):
+    """Return {stream name: TimedStream} for the streams present in a session folder"""
+    available = [name for name, csv_name in CACHE_STREAMS.items() if os.path.isfile(os.path.join(folder, csv_name))]
+    if os.path.isdir(os.path.join(folder, 'FLIR')):
+        available.append('flir')
+    result = {}
+    for stream in streams or available:
+        if stream in available:
+            result[stream] = load_timed_stream(folder, stream)
+    return result
+
+def align_streams(streams, reference, columns, direction='backward', tolerance_ns=None):
+    """As-of join columns of other streams onto the sample times of the reference stream.
+
+    columns maps stream name -> column names. Returns a DataFrame with a Timestamp column
+    and one '<stream>.<column>' column per requested column.
+    """
+    reference_stream = streams[reference]
+    aligned = {'Timestamp': reference_stream.times.view('datetime64[ns]')}
+    for stream, names in columns.items():
+        for name, values in streams[stream].asof(reference_stream.times, names, direction, tolerance_ns).items():
+            aligned[f"{stream}.{name}"] = values
+    return pd.DataFrame(aligned)
+
+# Columns joined by the command line tool when none are given
+DEFAULT_ALIGN_COLUMNS = {
+    'robot': ['RIst_X', 'RIst_Y', 'RIst_Z', 'RIst_A', 'RIst_B', 'RIst_C'],
+    'lembox': ['Scaled_Voltage(V)', 'Scaled_Current(A)', 'Voltage(V)', 'Current(A)'],
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Align session streams to the samples of one reference stream.")
+    parser.add_argument('folder', help="session folder")
+    parser.add_argument('--reference', default='flir', help="stream whose sample times are used (default flir)")
+    parser.add_argument('--direction', choices=['backward', 'forward', 'nearest'], default='backward')
+    parser.add_argument('--tolerance', type=float, help="largest allowed time gap in seconds")
+    parser.add_argument('--output', help="output CSV (default aligned_<reference>.csv in the session folder)")
+    args = parser.parse_args()
+
+    streams = load_session_streams(args.folder)
+    if args.reference not in streams:
+        print(f"Error: no {args.reference} stream in {args.folder}")
+        sys.exit(1)
+    columns = {}
+    for stream, names in DEFAULT_ALIGN_COLUMNS.items():
+        if stream in streams and stream != args.reference:
+            present = [name for name in names if name in streams[stream].columns]
+            if present:
+                columns[stream] = present
+    tolerance_ns = None if args.tolerance is None else int(args.tolerance * 1e9)
+    aligned = align_streams(streams, args.reference, columns, args.direction, tolerance_ns)
+
+    output = args.output or os.path.join(args.folder, f"aligned_{args.reference}.csv")
+    aligned.to_csv(output, index=False)
+    print(f"Aligned {len(aligned)} {args.reference} samples with {', '.join(columns) or 'no streams'}: {output}")
+
+if __name__ == "__main__":
+    main()
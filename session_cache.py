@@ -0,0 +1,192 @@
+import os
+import sys
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+from audio_conversion import find_header_row
+from instrumentation import span
+
+CACHE_FOLDER_NAME = 'session_cache'
+SCHEMA_FILENAME = 'schema.json'
+CACHE_VERSION = 1
+DEFAULT_CHUNKSIZE = 500000
+
+# Stream name -> CSV file in the session folder that it is cached from
+CACHE_STREAMS = {
+    'lembox': 'lembox_data.csv',
+    'microphone': 'microphone_data.csv',
+    'robot': 'robot_data.csv',
+}
+
+def stream_cache_folder(folder, stream):
+    return os.path.join(folder, CACHE_FOLDER_NAME, stream)
+
+def _source_skiprows(csv_path, stream):
+    # The microphone CSV may have an extra info row above its header
+    if stream == 'microphone':
+        skiprows = find_header_row(csv_path)
+        if skiprows is None:
+            raise ValueError(f"no header with an Amplitude column in {csv_path}")
+        return skiprows
+    return 0
+
+def _column_kind(name, values):
+    """Pick how a column is stored from its first chunk: float, datetime or category"""
+    if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+        return 'float'
+    if 'time' in name.lower():
+        non_null = values.dropna()
+        parsed = pd.to_datetime(non_null, format='ISO8601', errors='coerce')
+        if len(non_null) and not parsed.isna().any():
+            return 'datetime'
+    return 'category'
+
+_KIND_DTYPES = {
+    'float': np.dtype(np.float64),
+    'datetime': np.dtype('datetime64[ns]'),
+    'category': np.dtype(np.int32),
+}
+
+def _column_array(values, kind, categories):
+    if kind == 'float':
+        return pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64)
+    if kind == 'datetime':
+        return pd.to_datetime(values, format='ISO8601', errors='coerce').to_numpy(dtype='datetime64[ns]')
+    # Strings are dictionary encoded; missing values get code -1
+    chunk_codes, uniques = pd.factorize(values)
+    mapping = np.array([categories.setdefault(str(value), len(categories)) for value in uniques] + [-1], dtype=np.int32)
+    return mapping[chunk_codes]
+
+def _finalize_npy(raw_path, npy_path, dtype, rows):
+    """Turn a file of raw little-endian values into a .npy file that np.load can memory map"""
+    with open(npy_path, 'wb') as out, open(raw_path, 'rb') as raw:
+        np.lib.format.write_array_header_1_0(out, {
+            'descr': np.lib.format.dtype_to_descr(dtype),
+            'fortran_order': False,
+            'shape': (rows,),
+        })
+        shutil.copyfileobj(raw, out)
+    os.remove(raw_path)
+
+def write_stream_cache(csv_path, cache_folder, stream=None, chunksize=DEFAULT_CHUNKSIZE):
+    """Cache one CSV as one .npy array per column plus a schema.json.
+
+    The CSV is read in chunks and each column is appended to its own file, so memory
+    stays bounded by the chunk size. Numeric columns are stored as float64, time columns
+    as datetime64[ns] and text columns as int32 codes into a category list kept in the
+    schema. Returns the schema.
+    """
+    stat = os.stat(csv_path)
+    skiprows = _source_skiprows(csv_path, stream)
+    os.makedirs(cache_folder, exist_ok=True)
+    schema_path = os.path.join(cache_folder, SCHEMA_FILENAME)
+    if os.path.exists(schema_path):
+        os.remove(schema_path)
+
+    columns = None
+    raw_files = []
+    rows = 0
+    try:
+        for chunk in pd.read_csv(csv_path, skiprows=skiprows, chunksize=chunksize, low_memory=False):
+            if columns is None:
+                columns = [{
+                    'name': name,
+                    'file': f"col_{i:03d}.npy",
+                    'kind': _column_kind(name, chunk[name]),
+                    'categories': {},
+                } for i, name in enumerate(chunk.columns)]
+                raw_files = [open(os.path.join(cache_folder, column['file'] + '.part'), 'wb') for column in columns]
+            for column, raw in zip(columns, raw_files):
+                array = _column_array(chunk[column['name']], column['kind'], column['categories'])
+                raw.write(array.astype(_KIND_DTYPES[column['kind']].newbyteorder('<'), copy=False).tobytes())
+            rows += len(chunk)
+    finally:
+        for raw in raw_files:
+            raw.close()
+
+    columns = columns or []
+    for column in columns:
+        dtype = _KIND_DTYPES[column['kind']].newbyteorder('<')
+        _finalize_npy(os.path.join(cache_folder, column['file'] + '.part'),
+                      os.path.join(cache_folder, column['file']), dtype, rows)
+        column['dtype'] = dtype.str
+        column['categories'] = list(column['categories'])
+
+    schema = {
+        'version': CACHE_VERSION,
+        'source': os.path.basename(csv_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'rows': rows,
+        'columns': columns,
+    }
+    with open(schema_path + '.tmp', 'w') as f:
+        json.dump(schema, f)
+    os.replace(schema_path + '.tmp', schema_path)
+    return schema
+
+def load_schema(cache_folder):
+    with open(os.path.join(cache_folder, SCHEMA_FILENAME), 'r') as f:
+        return json.load(f)
+
+def is_stream_fresh(folder, stream):
+    """True if the stream's cache exists and matches the size and mtime of its CSV"""
+    csv_path = os.path.join(folder, CACHE_STREAMS[stream])
+    try:
+        schema = load_schema(stream_cache_folder(folder, stream))
+        stat = os.stat(csv_path)
+    except (OSError, ValueError):
+        return False
+    return (schema.get('version') == CACHE_VERSION
+            and schema['size'] == stat.st_size and schema['mtime_ns'] == stat.st_mtime_ns)
+
+def write_session_cache(folder, chunksize=DEFAULT_CHUNKSIZE, force=False, log_func=print):
+    """Write or refresh the binary cache of every stream CSV present in a session folder"""
+    for stream, csv_name in CACHE_STREAMS.items():
+        csv_path = os.path.join(folder, csv_name)
+        if not os.path.isfile(csv_path):
+            continue
+        if not force and is_stream_fresh(folder, stream):
+            log_func(f"Session cache for {stream} is up to date")
+            continue
+        try:
+            with span(f'cache.{stream}', memory=True):
+                schema = write_stream_cache(csv_path, stream_cache_folder(folder, stream), stream, chunksize)
+            log_func(f"Cached {csv_name}: {schema['rows']} rows, {len(schema['columns'])} columns")
+        except Exception as e:
+            log_func(f"Error caching {csv_name}: {e}")
+
+def load_stream(folder, stream, columns=None):
+    """Return {column name: array} for a session stream.
+
+    The binary cache is used when it is fresh: numeric and time columns come back as
+    read-only memory maps, so only the parts that are touched are read from disk. Text
+    columns are decoded from their category codes. Without a fresh cache the CSV is read
+    with pandas instead.
+    """
+    if is_stream_fresh(folder, stream):
+        cache_folder = stream_cache_folder(folder, stream)
+        schema = load_schema(cache_folder)
+        result = {}
+        for column in schema['columns']:
+            if columns is not None and column['name'] not in columns:
+                continue
+            array = np.load(os.path.join(cache_folder, column['file']), mmap_mode='r')
+            if column['kind'] == 'category':
+                categories = np.array(column['categories'] + [''], dtype=object)
+                array = categories[array]
+            result[column['name']] = array
+        return result
+
+    csv_path = os.path.join(folder, CACHE_STREAMS[stream])
+    df = pd.read_csv(csv_path, skiprows=_source_skiprows(csv_path, stream), usecols=columns, low_memory=False)
+    return {name: df[name].to_numpy() for name in df.columns}
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python session_cache.py <session_folder>")
+        sys.exit(1)
+
+    write_session_cache(sys.argv[1])
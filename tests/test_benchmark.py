@@ -0,0 +1,8 @@
+from benchmark import generate_robot_log
+from robotdata_parsing import convert_robot_data_to_csv_fast
+
+def test_every_generated_robot_message_is_parsed(tmp_path):
+    source, output = tmp_path / 'robot_data.txt', tmp_path / 'robot_data.csv'
+    assert generate_robot_log(str(source), 300) == 300
+    assert convert_robot_data_to_csv_fast(str(source), str(output), workers=1)
+    assert len(output.read_text().splitlines()) == 301
@@ -0,0 +1,85 @@
+import numpy as np
+
+from create_flirvideo import flir_to_video
+
+def write_frames(folder, count, timestamp=True):
+    folder.mkdir()
+    for i in range(count):
+        frame = np.full((24, 32), 7000 + i, dtype=np.uint16)
+        data = {'frame': frame, 'timestamp': f'2025-03-01 12:00:00.{i:06d}' if timestamp else None}
+        np.save(folder / f'frame_{i:05d}.npy', data)
+
+def render(tmp_path, folder):
+    return flir_to_video(str(folder), str(tmp_path / 'FLIR.mp4'), str(tmp_path / 'FLIR_Frames'), 10, 64, 48,
+                         log_func=lambda message: None, frame_format=None)
+
+def test_returns_true_when_the_video_is_written(tmp_path):
+    write_frames(tmp_path / 'FLIR', 3)
+    assert render(tmp_path, tmp_path / 'FLIR') is True
+
+def test_returns_false_without_frames(tmp_path):
+    write_frames(tmp_path / 'FLIR', 2, timestamp=False)
+    assert render(tmp_path, tmp_path / 'FLIR') is False
+    (tmp_path / 'empty').mkdir()
+    assert render(tmp_path, tmp_path / 'empty') is False
+
+def test_frame_names(tmp_path):
+    write_frames(tmp_path / 'FLIR', 2)
+    for frame_names, expected in (('stem', 'frame_00000.png'), ('filename', 'frame_00000.npy.png')):
+        frames = tmp_path / f'frames_{frame_names}'
+        assert flir_to_video(str(tmp_path / 'FLIR'), str(tmp_path / 'FLIR.mp4'), str(frames), 10, 64, 48,
+                             log_func=lambda message: None, frame_names=frame_names)
+        assert sorted(path.name for path in frames.iterdir())[0] == expected
+
+def test_serial_runs_on_threads_do_not_share_state(tmp_path):
+    # The GUI renders several folders at once on threads, each with one worker
+    import threading
+    import cv2
+
+    for name, base in (('A', 7000), ('B', 9000)):
+        # Each folder sits in its own session, next to its own stack
+        folder = tmp_path / name / 'FLIR'
+        folder.mkdir(parents=True)
+        for i in range(30):
+            frame = np.linspace(base, base + 500 + 40 * i, 24 * 32).reshape(24, 32).astype(np.uint16)
+            np.save(folder / f'frame_{i:05d}.npy', {'frame': frame, 'timestamp': f'2025-03-01 12:00:00.{i:06d}'})
+
+    def run(name, suffix, results):
+        results[name] = flir_to_video(str(tmp_path / name / 'FLIR'), str(tmp_path / name / f'FLIR{suffix}.mp4'),
+                                       str(tmp_path / name / f'frames{suffix}'), 10, 64, 48,
+                                       log_func=lambda message: None, workers=1)
+
+    alone = {}
+    for name in 'AB':
+        run(name, '_alone', alone)
+    together = {}
+    threads = [threading.Thread(target=run, args=(name, '_together', together)) for name in 'AB']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert alone == together == {'A': True, 'B': True}
+    for name in 'AB':
+        for path in sorted((tmp_path / name / 'frames_alone').iterdir()):
+            expected = cv2.imread(str(path))
+            actual = cv2.imread(str(tmp_path / name / 'frames_together' / path.name))
+            assert np.array_equal(expected, actual), path.name
+
+def test_npy_frames_are_the_8bit_source_frames(tmp_path):
+    write_frames(tmp_path / 'FLIR', 3)
+    frames = tmp_path / 'FLIR_Frames'
+    assert flir_to_video(str(tmp_path / 'FLIR'), str(tmp_path / 'FLIR.mp4'), str(frames), 10, 64, 48,
+                         log_func=lambda message: None, frame_format='npy')
+    saved = [np.load(path) for path in sorted(frames.iterdir())]
+    assert [(frame.shape, frame.dtype) for frame in saved] == [((24, 32), np.uint8)] * 3
+    # Frames of 7000, 7001 and 7002 counts span the whole 8-bit range
+    assert [int(frame[0, 0]) for frame in saved] == [0, 127, 255]
+
+def test_no_stack_renders_the_frame_files(tmp_path):
+    write_frames(tmp_path / 'FLIR', 3)
+    assert flir_to_video(str(tmp_path / 'FLIR'), str(tmp_path / 'FLIR.mp4'), str(tmp_path / 'FLIR_Frames'), 10, 64, 48,
+                         log_func=lambda message: None, frame_format=None, use_stack=False)
+    assert not (tmp_path / 'FLIR_stack').exists()
+    assert render(tmp_path, tmp_path / 'FLIR')
+    assert (tmp_path / 'FLIR_stack').is_dir()
@@ -0,0 +1,17 @@
+from create_xirisvideo import generate_synthetic_xiris, xiris_to_video
+
+def render(tmp_path, folder, **kwargs):
+    return xiris_to_video(str(folder), str(tmp_path / 'Xiris.mp4'), 30, 64, 48, log_func=lambda message: None,
+                          level_sample=4, **kwargs)
+
+def test_unreadable_sample_frames_are_skipped(tmp_path):
+    folder = generate_synthetic_xiris(tmp_path / 'Xiris', count=4, width=64, height=48)
+    (folder / 'xiris_000000.png').write_bytes(b'not a png')
+    assert render(tmp_path, folder) is True
+
+def test_returns_false_when_no_frame_can_be_read(tmp_path):
+    folder = generate_synthetic_xiris(tmp_path / 'Xiris', count=3, width=64, height=48)
+    for path in folder.iterdir():
+        path.write_bytes(b'not a png')
+    assert render(tmp_path, folder) is False
+    assert render(tmp_path, folder, levels=(0, 4095)) is False
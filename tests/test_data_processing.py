@@ -0,0 +1,31 @@
+from Data_Processing import process_data_folder, share_workers
+from processing_manifest import load_manifest
+
+def test_stage_returning_false_fails_the_job(tmp_path):
+    (tmp_path / 'microphone_data.csv').write_text('Recording started 2025-03-01 12:00:00.000000\nTime,Level\n0.0,1\n')
+    # A WAV left over from an earlier run must not be taken as this run's output
+    (tmp_path / 'microphone_data.wav').write_bytes(b'old')
+    statuses = process_data_folder(str(tmp_path), max_workers=1)
+    assert statuses['audio'].startswith('JobFailed')
+    assert 'audio' not in load_manifest(str(tmp_path))['jobs']
+
+def test_share_workers_splits_the_budget():
+    jobs = {
+        'audio': {'kwargs': {}},
+        'lembox': {'kwargs': {}},
+        'robot': {'kwargs': {'workers': 16}},
+        'flir': {'kwargs': {'workers': 16}},
+        'xiris': {'kwargs': {'workers': None}},
+    }
+    # Audio and LEM box take one core each; the pool jobs split the other six
+    kwargs = share_workers(jobs, concurrent=5, workers=8)
+    assert kwargs['audio'] == {} and kwargs['lembox'] == {}
+    assert [kwargs[name]['workers'] for name in ('robot', 'flir', 'xiris')] == [2, 2, 2]
+    assert jobs['robot']['kwargs']['workers'] == 16
+    assert [share_workers(jobs, 5, 16)[name]['workers'] for name in ('robot', 'flir', 'xiris')] == [4, 4, 4]
+    # With two jobs at a time, two pool jobs share all the cores
+    assert share_workers(jobs, 2, 8)['flir']['workers'] == 4
+    # A job asking for fewer processes keeps its count
+    jobs['xiris']['kwargs']['workers'] = 1
+    assert share_workers(jobs, 5, 8)['xiris']['workers'] == 1
+    assert share_workers(jobs, 5, 2)['flir']['workers'] == 1
@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip('tkinter')
+
+from GUI import process_folder
+from processing_manifest import load_manifest
+
+def test_failed_conversion_is_not_recorded(tmp_path):
+    (tmp_path / 'microphone_data.csv').write_text('Recording started 2025-03-01 12:00:00.000000\nTime,Level\n0.0,1\n')
+    (tmp_path / 'microphone_data.wav').write_bytes(b'old')
+    messages = []
+    process_folder(str(tmp_path), messages.append)
+    assert 'audio' not in load_manifest(str(tmp_path))['jobs']
+    assert any('could not be converted' in message for message in messages)
+
+def test_frames_keep_the_gui_naming(tmp_path):
+    import numpy as np
+    (tmp_path / 'FLIR').mkdir()
+    np.save(tmp_path / 'FLIR' / 'frame_00000.npy',
+            {'frame': np.arange(24 * 32, dtype=np.uint16).reshape(24, 32), 'timestamp': '2025-03-01 12:00:00.000000'})
+    process_folder(str(tmp_path), lambda message: None, workers=1)
+    assert [path.name for path in (tmp_path / 'FLIR_Frames').iterdir()] == ['frame_00000.npy.png']
+    assert load_manifest(str(tmp_path))['jobs']['flir']['params']['frame_names'] == 'filename'
@@ -0,0 +1,37 @@
+import os
+import sys
+import json
+import subprocess
+import textwrap
+import multiprocessing
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run as a script, so spawned workers import instrumentation while re-importing __main__,
+# as they do when Data_Processing.py or batch_cli.py is the main module
+SCRIPT = textwrap.dedent('''
+    import sys
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    sys.path.insert(0, sys.argv[1])
+    from instrumentation import record, session_report
+
+    if __name__ == '__main__':
+        multiprocessing.set_start_method(sys.argv[3])
+        with session_report(sys.argv[2], log_func=lambda message: None):
+            with ProcessPoolExecutor(max_workers=2) as executor:
+                list(executor.map(record, ['test.worker'] * 4, [0.01] * 4))
+''')
+
+@pytest.mark.parametrize('method', [m for m in ('spawn', 'fork') if m in multiprocessing.get_all_start_methods()])
+def test_worker_spans_are_collected(tmp_path, method):
+    script = tmp_path / 'profiled.py'
+    script.write_text(SCRIPT)
+    subprocess.run([sys.executable, str(script), REPO, str(tmp_path), method], check=True, timeout=120)
+    with open(tmp_path / 'performance_report.json') as f:
+        report = json.load(f)
+    assert report['spans']['test.worker']['count'] == 4
+    assert report['processes'] >= 2
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lembox_analytics import analyze_lembox_csv, scale_and_analyze_lembox
+
+def write_weld(path, rows=3000, seed=1):
+    """A raw LEM box CSV with the arc struck, short circuits and arc outs at random places"""
+    rng = np.random.default_rng(seed)
+    times = pd.Timestamp('2025-03-01 12:00:00') + pd.to_timedelta(np.arange(rows) * 100, unit='us')
+    current = np.full(rows, 150.0) + rng.normal(0, 5, rows)
+    current[:50] = 0.5
+    voltage = np.full(rows, 25.0) + rng.normal(0, 1, rows)
+    for start in rng.integers(100, rows - 20, 40):
+        length = int(rng.integers(1, 12))
+        if rng.random() < 0.5:
+            voltage[start:start + length] = rng.uniform(0, 5, length)
+        else:
+            current[start:start + length] = rng.uniform(0, 2, length)
+    # An arc out that ends on a sample carrying a large current
+    current[997:1001] = 0.9
+    current[1001] = 200.0
+    pd.DataFrame({
+        'Timestamp': times.strftime('%Y-%m-%d %H:%M:%S.%f'),
+        'Voltage(V)': np.round(voltage / 10, 5),
+        'Current(A)': np.round(current / 100, 5),
+    }).to_csv(path, index=False)
+
+def test_chunk_size_does_not_change_results(tmp_path):
+    source = tmp_path / 'lembox_data.csv'
+    write_weld(source)
+    results = []
+    for chunksize in (7, 64, 1001, 100000):
+        summary, events = tmp_path / f'summary_{chunksize}.csv', tmp_path / f'events_{chunksize}.csv'
+        analyze_lembox_csv(str(source), str(summary), str(events), chunksize=chunksize, log_func=lambda message: None)
+        results.append((summary.read_bytes(), events.read_bytes()))
+    assert b'arc_out' in results[0][1] and b'short_circuit' in results[0][1]
+    for result in results[1:]:
+        assert result == results[0]
+
+@pytest.mark.parametrize('chunksize', [1, 2, 3, 5])
+def test_carried_event_ending_on_first_sample(tmp_path, chunksize):
+    source = tmp_path / 'lembox_data.csv'
+    write_weld(source, rows=1200)
+    events = tmp_path / 'events.csv'
+    analyze_lembox_csv(str(source), str(tmp_path / 'summary.csv'), str(events), chunksize=chunksize,
+                       log_func=lambda message: None)
+    reference = tmp_path / 'events_reference.csv'
+    analyze_lembox_csv(str(source), str(tmp_path / 'summary_reference.csv'), str(reference),
+                       log_func=lambda message: None)
+    assert events.read_bytes() == reference.read_bytes()
+
+def test_time_column_is_detected_and_parsed_as_iso8601(tmp_path):
+    # A Time column with whole-second timestamps, as some LEM box exports write
+    source = tmp_path / 'lembox_data.csv'
+    times = pd.Timestamp('2025-03-01 12:00:00') + pd.to_timedelta(np.arange(40), unit='s')
+    current = np.where(np.arange(40) % 10 == 5, 1.0, 150.0)
+    pd.DataFrame({'Time': times.strftime('%Y-%m-%dT%H:%M:%S'), 'Voltage(V)': 2.5,
+                  'Current(A)': current / 100}).to_csv(source, index=False)
+    summary, events = tmp_path / 'summary.csv', tmp_path / 'events.csv'
+    windows, found = analyze_lembox_csv(str(source), str(summary), str(events), window_s=10,
+                                        log_func=lambda message: None)
+    assert windows == 4 and found == 4
+    assert pd.read_csv(summary)['samples'].tolist() == [10, 10, 10, 10]
+    assert pd.read_csv(events)['start'].tolist()[0] == '2025-03-01 12:00:05.000000'
+
+def test_scaling_is_kept_when_analytics_cannot_run(tmp_path):
+    source = tmp_path / 'lembox_data.csv'
+    pd.DataFrame({'Sample': [0, 1, 2], 'Voltage(V)': 2.5, 'Current(A)': 1.5}).to_csv(source, index=False)
+    messages = []
+    assert scale_and_analyze_lembox(str(source), log_func=messages.append) is True
+    assert 'Scaled_Voltage(V)' in pd.read_csv(source).columns
+    assert any('analytics skipped' in message for message in messages)
+    assert not (tmp_path / 'lembox_summary.csv').exists()
@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+from live_follow import FlirFollower, PREVIEW_FOLDER_NAME
+
+def write_frames(folder, count):
+    folder.mkdir(exist_ok=True)
+    for i in range(count):
+        data = {'frame': np.full((24, 32), 7000 + i, dtype=np.uint16), 'timestamp': f'2025-03-01 12:00:00.{i:06d}'}
+        np.save(folder / f'frame_{i:05d}.npy', data)
+
+@pytest.mark.parametrize('preview_frames, kept', [(0, 0), (-1, 0), (2, 2)])
+def test_preview_frames_limit(tmp_path, preview_frames, kept):
+    write_frames(tmp_path / 'FLIR', 5)
+    follower = FlirFollower(str(tmp_path), None, log_func=lambda message: None, preview_frames=preview_frames)
+    assert follower.poll()
+    assert follower.state['frames'] == 5
+    preview = tmp_path / PREVIEW_FOLDER_NAME
+    rendered = sorted(path.name for path in preview.glob('frame_*.jpg')) if preview.exists() else []
+    assert len(rendered) == kept
+    assert follower.state['rendered'] == kept
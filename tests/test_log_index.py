@@ -0,0 +1,42 @@
+import pandas as pd
+import pytest
+
+from benchmark import generate_robot_log
+from log_index import open_log_index, read_window
+from robotdata_parsing import convert_robot_data_to_csv_fast
+
+@pytest.mark.parametrize('header', [None, 'Robot log 3.2 started', 'SystemTime|RelativeTime|Message'])
+def test_robot_log_windows_match_the_parsed_csv(tmp_path, header):
+    source = tmp_path / 'robot_data.txt'
+    generate_robot_log(str(source), 2000)
+    if header is not None:
+        lines = source.read_text().splitlines(keepends=True)
+        source.write_text(header + '\n' + ''.join(lines[1:]))
+    convert_robot_data_to_csv_fast(str(source), str(tmp_path / 'robot_data.csv'), workers=1)
+    parsed = pd.read_csv(tmp_path / 'robot_data.csv')
+    times = pd.to_datetime(parsed['SystemTime'])
+
+    index = open_log_index(str(source), stride=37)
+    assert index.metadata['time_field'] == 0
+    assert index.metadata['lines'] == 2000
+    start, end = times[0] + pd.Timedelta(seconds=1.5), times[0] + pd.Timedelta(seconds=2.5)
+    window = read_window(str(source), 1.5, 2.5, index)
+    expected = parsed[(times >= start) & (times < end)].reset_index(drop=True)
+    assert len(window) == len(expected) > 0
+    assert (window['SystemTime'] == expected['SystemTime']).all()
+    assert (window['RIst_X'].astype(float) == expected['RIst_X']).all()
+
+def test_appended_lines_extend_the_index(tmp_path):
+    source = tmp_path / 'robot_data.txt'
+    generate_robot_log(str(source), 3000)
+    lines = source.read_text().splitlines(keepends=True)
+    source.write_text(''.join(lines[:1000]))
+    open_log_index(str(source), stride=50)
+    with open(source, 'a') as f:
+        f.write(''.join(lines[1000:]))
+    extended = open_log_index(str(source), stride=50)
+    for path in tmp_path.glob('robot_data.txt.index.*'):
+        path.unlink()
+    fresh = open_log_index(str(source), stride=50)
+    assert (extended.offsets == fresh.offsets).all() and (extended.times == fresh.times).all()
+    assert extended.metadata['lines'] == fresh.metadata['lines'] == 3000
@@ -0,0 +1,39 @@
+import pytest
+
+from robotdata_parsing import convert_robot_data_to_csv, convert_robot_data_to_csv_fast
+
+MESSAGE = ('<Rob Type="KUKA"><RIst X="{x}" Y="1.5" Z="-2.25" A="0.0" B="90.0" C="0.0"/>'
+           '<Delay D="0"/><CAM>{cam}</CAM><FLASH>{flash}</FLASH><IPOC>{ipoc}</IPOC></Rob>')
+
+def write_log(path, flashes, xs=None):
+    lines = ['SystemTime|RelativeTime|Message']
+    for i, flash in enumerate(flashes):
+        message = MESSAGE.format(x=i * 0.5 if xs is None else xs[i], cam=i % 2, flash=flash, ipoc=1000 + i)
+        lines.append(f'2025-03-01 12:00:00.{i * 4000:06d}|{i * 0.004:.3f}|{message}')
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+@pytest.mark.parametrize('flash', ['A&amp;B', '&lt;on&gt;', ' &#65; ', 'x&amp;'])
+def test_fast_parser_matches_generic_parser_with_entities(tmp_path, flash):
+    source = tmp_path / 'robot_data.txt'
+    write_log(source, ['OFF', 'ON', flash, 'OFF', flash])
+    convert_robot_data_to_csv(str(source), str(tmp_path / 'generic.csv'))
+    assert convert_robot_data_to_csv_fast(str(source), str(tmp_path / 'fast.csv'), workers=1)
+    assert (tmp_path / 'fast.csv').read_bytes() == (tmp_path / 'generic.csv').read_bytes()
+
+def test_header_line_is_skipped(tmp_path):
+    source = tmp_path / 'robot_data.txt'
+    write_log(source, ['OFF'] * 5)
+    assert convert_robot_data_to_csv_fast(str(source), str(tmp_path / 'fast.csv'), workers=1)
+    assert len((tmp_path / 'fast.csv').read_text().splitlines()) == 6
+
+def test_fast_parser_matches_generic_parser_with_missing_values(tmp_path):
+    source = tmp_path / 'robot_data.txt'
+    write_log(source, ['OFF', 'ON', 'OFF', 'ON'], xs=['1.5', 'nan', 'NaN', '-2.0'])
+    with open(source, 'a', encoding='utf-8') as f:
+        # A message without the RIst element leaves its columns empty
+        f.write('2025-03-01 12:00:01.000000|1.000|<Rob Type="KUKA"><Delay D="0"/><CAM>0</CAM>'
+                '<FLASH>OFF</FLASH><IPOC>2000</IPOC></Rob>\n')
+    convert_robot_data_to_csv(str(source), str(tmp_path / 'generic.csv'))
+    assert convert_robot_data_to_csv_fast(str(source), str(tmp_path / 'fast.csv'), workers=1)
+    assert (tmp_path / 'fast.csv').read_bytes() == (tmp_path / 'generic.csv').read_bytes()
+    assert 'nan' not in (tmp_path / 'fast.csv').read_text().lower()
@@ -0,0 +1,19 @@
+import pytest
+
+from session_cache import CACHE_FOLDER_NAME, load_stream, write_session_cache
+
+def test_microphone_csv_without_amplitude_is_not_cached(tmp_path):
+    (tmp_path / 'microphone_data.csv').write_text('Recording started 2025-03-01 12:00:00.000000\nTime,Level\n0.0,1\n')
+    messages = []
+    write_session_cache(str(tmp_path), log_func=messages.append)
+    assert not (tmp_path / CACHE_FOLDER_NAME / 'microphone').exists()
+    assert any('Amplitude' in message for message in messages)
+    with pytest.raises(ValueError):
+        load_stream(str(tmp_path), 'microphone')
+
+def test_microphone_csv_is_cached(tmp_path):
+    (tmp_path / 'microphone_data.csv').write_text('Recording started 2025-03-01 12:00:00.000000\n'
+                                                  'Time,Amplitude\n0.0,0.5\n0.1,-0.25\n')
+    write_session_cache(str(tmp_path), log_func=lambda message: None)
+    stream = load_stream(str(tmp_path), 'microphone')
+    assert list(stream['Amplitude']) == [0.5, -0.25]